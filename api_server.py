@@ -0,0 +1,204 @@
+"""HTTP API for legal document analysis.
+
+Serves LegalDocumentAnalyzer over an async FastAPI app so other systems can
+extract, analyze, translate and pull entities from documents without the
+Streamlit UI. Documents are sent as the raw request body and streamed to a
+temporary file in chunks, so large filings are never held in memory whole.
+Long documents can be submitted to the durable job queue (see job_worker.py)
+and polled by ID.
+
+Example:
+    python api_server.py --port 8000 --workers 8
+    curl --data-binary @contract.pdf "http://localhost:8000/analyze?filename=contract.pdf"
+    curl --data-binary @filing.pdf "http://localhost:8000/jobs?filename=filing.pdf"
+    curl http://localhost:8000/jobs/<job_id>
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel
+
+from job_worker import analyze_path, enqueue_analysis, spool_path, start_workers, stop_workers
+from legal_core import JOBS_DB_PATH, LANGUAGES, JobQueue, LegalDocumentAnalyzer, QueueFullError, get_gemini_integration
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+logger = logging.getLogger('api_server')
+
+class TextRequest(BaseModel):
+    text: str
+    target_lang: str = 'en'
+
+class TranslateRequest(BaseModel):
+    text: str
+    target_lang: str = 'en'
+    source_lang: str | None = None
+
+def create_app(api_key=None, workers=4, pdf_workers=1, max_upload_mb=200, max_active_jobs=100,
+               job_workers=0, queue_db=JOBS_DB_PATH):
+    """Build the FastAPI app
+    
+    Synchronous endpoints run extraction and analysis on a bounded thread pool. /jobs feeds the
+    durable job queue; pass job_workers to run that many queue worker processes with the app,
+    or run job_worker.py separately.
+    """
+    api_key = api_key or os.environ.get('GOOGLE_API_KEY')
+    gemini_integration = get_gemini_integration(api_key) if api_key else None
+    analyzer = LegalDocumentAnalyzer(gemini_integration)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis')
+    # Job queue calls are short; their own threads keep /health and job polling responsive while every
+    # analysis thread is busy
+    queue_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='queue')
+    jobs = JobQueue(queue_db, max_depth=max_active_jobs)
+    max_upload_bytes = int(max_upload_mb * 1024 * 1024)
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        worker_processes, stop_event = start_workers(job_workers, api_key, queue_db, pdf_workers=pdf_workers)
+        yield
+        executor.shutdown(wait=False, cancel_futures=True)
+        queue_executor.shutdown(wait=False, cancel_futures=True)
+        stop_workers(worker_processes, stop_event, timeout=10)
+    
+    app = FastAPI(title="Legal Document Analyzer API", lifespan=lifespan)
+    
+    def require_language(target_lang):
+        if target_lang not in LANGUAGES:
+            raise HTTPException(status_code=422, detail=f"Unsupported language: {target_lang}")
+    
+    async def run_blocking(fn, *args, pool=None):
+        # Extraction, analysis and SQLite calls block, so keep them off the event loop
+        return await asyncio.get_running_loop().run_in_executor(pool or executor, fn, *args)
+    
+    async def receive_upload(request, filename, path=None):
+        """Stream the request body to a file (a new temporary file by default), returning its path"""
+        extension = os.path.splitext(filename)[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(status_code=415, detail=f"Unsupported file format: {extension or filename}")
+        
+        if path:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        else:
+            fd, path = tempfile.mkstemp(suffix=extension, prefix='legal_upload_')
+        received = 0
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                async for chunk in request.stream():
+                    received += len(chunk)
+                    if received > max_upload_bytes:
+                        raise HTTPException(status_code=413, detail=f"Upload exceeds {max_upload_mb} MB")
+                    file.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        
+        if not received:
+            os.remove(path)
+            raise HTTPException(status_code=400, detail="Empty request body; send the document as the body")
+        return path
+    
+    @app.get('/health')
+    async def health():
+        return {
+            'status': 'ok',
+            'ai_engine': 'Gemini AI' if gemini_integration and gemini_integration.is_configured else 'Basic Analysis',
+            'queue': await run_blocking(jobs.get_depth, pool=queue_executor)
+        }
+    
+    @app.post('/extract')
+    async def extract(request: Request, filename: str = Query(..., description="Original file name, used for its extension")):
+        path = await receive_upload(request, filename)
+        try:
+            text = await run_blocking(lambda: ''.join(analyzer.iter_text_from_path(path, pdf_workers)))
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"{type(e).__name__}: {e}")
+        finally:
+            os.remove(path)
+        return {'document_name': filename, 'word_count': len(text.split()), 'character_count': len(text), 'text': text}
+    
+    @app.post('/analyze')
+    async def analyze(request: Request, filename: str = Query(...), target_lang: str = 'en'):
+        require_language(target_lang)
+        path = await receive_upload(request, filename)
+        try:
+            text, record = await run_blocking(analyze_path, analyzer, path, filename, target_lang, pdf_workers)
+            return record
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        finally:
+            os.remove(path)
+    
+    @app.post('/analyze/text')
+    async def analyze_text(body: TextRequest):
+        require_language(body.target_lang)
+        original_lang, analysis_result, entities = await run_blocking(
+            analyzer.analyze_document_full, body.text, body.target_lang
+        )
+        return {'original_language': original_lang, 'analysis_result': analysis_result, 'entities': entities}
+    
+    @app.post('/entities')
+    async def entities(body: TextRequest):
+        return {'entities': await run_blocking(analyzer.extract_entities_with_offsets, body.text)}
+    
+    @app.post('/translate')
+    async def translate(body: TranslateRequest):
+        require_language(body.target_lang)
+        if not (gemini_integration and gemini_integration.is_configured):
+            raise HTTPException(status_code=503, detail="Translation requires a Gemini API key")
+        translated = await run_blocking(gemini_integration.translate_text, body.text, body.target_lang, body.source_lang)
+        return {'target_language': body.target_lang, 'translated_text': translated}
+    
+    @app.post('/jobs', status_code=202)
+    async def submit_job(request: Request, filename: str = Query(...), target_lang: str = 'en'):
+        require_language(target_lang)
+        path = await receive_upload(request, filename, spool_path(filename))
+        try:
+            job_id = await run_blocking(enqueue_analysis, jobs, path, filename, target_lang, pool=queue_executor)
+        except QueueFullError as e:
+            # Refuse new work rather than queueing without bound when clients outpace the workers
+            os.remove(path)
+            raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': '30'})
+        return {'job_id': job_id, 'status': 'queued'}
+    
+    @app.get('/jobs/{job_id}')
+    async def get_job(job_id: str):
+        job = await run_blocking(jobs.get, job_id, pool=queue_executor)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown or purged job")
+        return job
+    
+    return app
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Serve the legal document analyzer over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind")
+    parser.add_argument('--port', type=int, default=8000, help="Port to listen on")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 4,
+                        help="Threads running extraction and analysis")
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'),
+                        help="Google API key for Gemini analysis (defaults to $GOOGLE_API_KEY)")
+    parser.add_argument('--pdf-workers', type=int, default=1, help="Processes used to extract pages of each PDF")
+    parser.add_argument('--max-upload-mb', type=float, default=200, help="Largest accepted document")
+    parser.add_argument('--max-active-jobs', type=int, default=100,
+                        help="Queued and running jobs allowed before /jobs answers 429")
+    parser.add_argument('--job-workers', type=int, default=2,
+                        help="Queue worker processes to run with the server (0 if job_worker.py runs separately)")
+    parser.add_argument('--queue-db', default=JOBS_DB_PATH, help="Job queue database")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    
+    import uvicorn
+    app = create_app(args.api_key, args.workers, args.pdf_workers, args.max_upload_mb, args.max_active_jobs,
+                     args.job_workers, args.queue_db)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Headless batch analysis of legal documents.
+
+Walks directories or glob patterns, analyzes every PDF/DOCX/TXT file with
+LegalDocumentAnalyzer (and Gemini when an API key is available) and streams one
+result record per document to a JSONL or Parquet file. Completed files are
+recorded in a checkpoint file so an interrupted run can be resumed.
+
+Example:
+    python batch_analyze.py contracts/ "archive/**/*.pdf" -o results.jsonl --workers 8
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from legal_core import GeminiIntegration, LegalDocumentAnalyzer
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+logger = logging.getLogger('batch_analyze')
+
+# Per-process worker state, created once by the pool initializer and shared by threads
+_worker_gemini = None
+_worker_target_lang = 'en'
+_worker_pdf_workers = 1
+_worker_lock = threading.Lock()
+
+def init_worker(api_key, target_lang, pdf_workers=1, requests_per_minute=15, tokens_per_minute=1000000):
+    """Set up the Gemini client used by every task in this worker process or thread pool
+    
+    The rate limits apply to this process alone; run_batch divides the key's quota between processes.
+    """
+    global _worker_gemini, _worker_target_lang, _worker_pdf_workers
+    with _worker_lock:
+        _worker_target_lang = target_lang
+        _worker_pdf_workers = pdf_workers
+        if api_key and _worker_gemini is None:
+            _worker_gemini = GeminiIntegration(api_key, requests_per_minute=requests_per_minute,
+                                               tokens_per_minute=tokens_per_minute)
+
+def analyze_file(path):
+    """Extract and analyze a single file, returning a JSON-serializable result record"""
+    record = {
+        'path': path,
+        'document_name': os.path.basename(path),
+        'analyzed_at': datetime.now().isoformat(),
+        'error': None
+    }
+    started = time.perf_counter()
+    analyzer = LegalDocumentAnalyzer(_worker_gemini)
+    
+    try:
+        with open(path, 'rb') as file:
+            # Hash in chunks so a large filing is not read into memory twice
+            record['sha256'] = hashlib.file_digest(file, 'sha256').hexdigest()
+        
+        # Pages stream straight into chunked analysis, so Gemini starts before the whole PDF is decoded
+        text, original_lang, analysis_result, entities = analyzer.analyze_text_stream(
+            analyzer.iter_text_from_path(path, _worker_pdf_workers), _worker_target_lang
+        )
+        if not text.strip():
+            record['error'] = "No text could be extracted"
+        else:
+            record.update({
+                'original_language': original_lang,
+                'target_language': _worker_target_lang,
+                'word_count': len(text.split()),
+                'character_count': len(text),
+                'ai_engine': 'Gemini AI' if _worker_gemini and _worker_gemini.is_configured else 'Basic Analysis',
+                'analysis_result': analysis_result,
+                'entities': entities
+            })
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+    
+    record['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+def iter_input_files(inputs, recursive=True):
+    """Yield supported document paths from directories, files and glob patterns, without duplicates"""
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            candidates = glob.iglob(pattern, recursive=recursive)
+        elif os.path.isfile(item):
+            candidates = [item]
+        else:
+            candidates = glob.iglob(item, recursive=True)
+        
+        for path in sorted(candidates):
+            path = os.path.abspath(path)
+            if path in seen or not os.path.isfile(path) or not path.lower().endswith(SUPPORTED_EXTENSIONS):
+                continue
+            seen.add(path)
+            yield path
+
+class JsonlWriter:
+    """Append result records to a JSON Lines file, flushing after every record"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+    
+    def write(self, record):
+        """Write a record; returns the paths whose records are now on disk"""
+        self.file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self.file.flush()
+        return [record['path']]
+    
+    def close(self):
+        self.file.close()
+        return []
+
+class ParquetWriter:
+    """Write result records to Parquet in row groups, storing nested results as JSON strings"""
+    
+    COLUMNS = ['path', 'document_name', 'sha256', 'analyzed_at', 'original_language', 'target_language',
+               'word_count', 'character_count', 'ai_engine', 'elapsed_seconds', 'error',
+               'analysis_result', 'entities']
+    
+    def __init__(self, path, row_group_size=500):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+        
+        # Parquet files cannot be appended to, so a resumed run writes a new part file
+        if os.path.exists(path):
+            stem, extension = os.path.splitext(path)
+            path = f"{stem}.{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
+            logger.info("Output exists, writing resumed results to %s", path)
+        
+        self.pa = pa
+        self.schema = pa.schema([
+            (column, pa.int64() if column in ('word_count', 'character_count')
+             else pa.float64() if column == 'elapsed_seconds' else pa.string())
+            for column in self.COLUMNS
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+    
+    def write(self, record):
+        """Buffer a record; returns the paths whose records are now on disk (a whole row group at a time)"""
+        row = {column: record.get(column) for column in self.COLUMNS}
+        for column in ('analysis_result', 'entities'):
+            if row[column] is not None:
+                row[column] = json.dumps(row[column], ensure_ascii=False, default=str)
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            return self.flush()
+        return []
+    
+    def flush(self):
+        """Write buffered rows as a row group; returns their paths"""
+        if not self.rows:
+            return []
+        self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+        paths = [row['path'] for row in self.rows]
+        self.rows = []
+        return paths
+    
+    def close(self):
+        paths = self.flush()
+        self.writer.close()
+        return paths
+
+class Checkpoint:
+    """Track completed files in an append-only text file so interrupted runs can resume"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.completed = {line.rstrip('\n') for line in file if line.strip()}
+        self.file = open(path, 'a', encoding='utf-8')
+    
+    def __contains__(self, path):
+        return path in self.completed
+    
+    def mark_done(self, path):
+        self.completed.add(path)
+        self.file.write(path + '\n')
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+
+def run_batch(inputs, output, workers=4, use_processes=False, api_key=None, target_lang='en',
+              checkpoint_path=None, recursive=True, retry_failed=False, pdf_workers=1, requests_per_minute=15,
+              tokens_per_minute=1000000):
+    """Analyze every matching document, streaming results and checkpointing progress
+    
+    requests_per_minute and tokens_per_minute are the API key's Gemini quota for the whole run.
+    Returns a dict with processed, failed and skipped counts.
+    """
+    checkpoint = Checkpoint(checkpoint_path or f"{output}.checkpoint")
+    writer = ParquetWriter(output) if output.lower().endswith('.parquet') else JsonlWriter(output)
+    
+    # Threads share one rate limiter per key; worker processes each get an equal share of the quota
+    if use_processes:
+        requests_per_minute /= workers
+        tokens_per_minute /= workers
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    executor = executor_class(max_workers=workers, initializer=init_worker,
+                              initargs=(api_key, target_lang, pdf_workers, requests_per_minute, tokens_per_minute))
+    # Keep a bounded number of tasks in flight so huge directories don't build a huge backlog
+    max_in_flight = workers * 4
+    counts = {'processed': 0, 'failed': 0, 'skipped': 0}
+    failed_paths = set()
+    started = time.perf_counter()
+    
+    def mark_done(paths):
+        # Only results already on disk are checkpointed, so a crash never skips a lost result on resume.
+        # With retry_failed, failures stay out of the checkpoint so the next run tries them again
+        for path in paths:
+            if not (retry_failed and path in failed_paths):
+                checkpoint.mark_done(path)
+    
+    def collect(done):
+        for future in done:
+            record = future.result()
+            if record['error']:
+                failed_paths.add(record['path'])
+            mark_done(writer.write(record))
+            counts['failed' if record['error'] else 'processed'] += 1
+            
+            total = counts['processed'] + counts['failed']
+            if total % 100 == 0:
+                rate = total / (time.perf_counter() - started)
+                logger.info("%d documents analyzed (%.1f/s), %d failed", total, rate, counts['failed'])
+    
+    try:
+        pending = set()
+        for path in iter_input_files(inputs, recursive):
+            if path in checkpoint:
+                counts['skipped'] += 1
+                continue
+            pending.add(executor.submit(analyze_file, path))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        mark_done(writer.close())
+        checkpoint.close()
+    
+    return counts
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Analyze a directory of legal documents without the Streamlit UI")
+    parser.add_argument('inputs', nargs='+', help="Directories, files or glob patterns (e.g. 'contracts/**/*.pdf')")
+    parser.add_argument('-o', '--output', required=True, help="Output file (.jsonl or .parquet)")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 4, help="Number of parallel workers")
+    parser.add_argument('--processes', action='store_true',
+                        help="Use worker processes instead of threads (best for CPU-bound basic analysis)")
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'),
+                        help="Google API key for Gemini analysis (defaults to $GOOGLE_API_KEY)")
+    parser.add_argument('--pdf-workers', type=int, default=1,
+                        help="Processes used to extract pages of each PDF (for very large filings with few workers)")
+    parser.add_argument('--requests-per-minute', type=float, default=15,
+                        help="Gemini requests per minute allowed for the API key, shared by all workers")
+    parser.add_argument('--tokens-per-minute', type=float, default=1000000,
+                        help="Gemini tokens per minute allowed for the API key, shared by all workers")
+    parser.add_argument('--target-lang', default='en', help="ISO 639-1 language for analysis results")
+    parser.add_argument('--checkpoint', help="Checkpoint file (defaults to <output>.checkpoint)")
+    parser.add_argument('--no-recursive', action='store_true', help="Do not descend into subdirectories")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Leave failed documents out of the checkpoint so they are retried on the next run")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    
+    counts = run_batch(
+        args.inputs, args.output,
+        workers=args.workers,
+        use_processes=args.processes,
+        api_key=args.api_key,
+        target_lang=args.target_lang,
+        checkpoint_path=args.checkpoint,
+        recursive=not args.no_recursive,
+        retry_failed=args.retry_failed,
+        pdf_workers=args.pdf_workers,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute
+    )
+    logger.info("Done: %(processed)d analyzed, %(failed)d failed, %(skipped)d skipped (already in checkpoint)", counts)
+    return 1 if counts['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
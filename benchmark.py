@@ -0,0 +1,511 @@
+"""Benchmarks for the document processing hot paths.
+
+Builds deterministic synthetic contracts (1 to 1000 pages, in any language of
+LANGUAGE_SEEDS, with a controlled density of entities and clauses), then times
+each stage: text extraction from TXT/DOCX/PDF, basic analysis, entity
+extraction, entity highlighting, language detection and the UserManager
+SQLite operations. The Gemini analysis and translation paths run offline
+against FakeGeminiModel (or a ReplayModel recording) with injected latency,
+errors and 429s. Every stage reports latency percentiles, throughput and
+peak traced memory. Results can be saved as a JSON baseline, and later runs
+compared against it to flag regressions.
+
+Example:
+    python benchmark.py --pages 1 10 100 --languages en de --save-baseline baseline.json
+    python benchmark.py --pages 1 10 100 --languages en de --compare baseline.json --threshold 0.15
+    python benchmark.py --pages 100 --stages gemini_analysis gemini_translation --gemini-latency 1.5 --gemini-429-rate 0.05
+"""
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from legal_core import (LANGUAGE_SEEDS, AnalysisCache, EntityHighlighter, FakeGeminiModel, GeminiIntegration,
+                        LegalDocumentAnalyzer, RateLimiter, ReplayModel, UserManager, detect_language_local,
+                        paginate_text)
+
+BASELINE_VERSION = 1
+
+logger = logging.getLogger('benchmark')
+
+class SyntheticContractGenerator:
+    """Deterministic generator of contract-like documents with controlled entity and clause density
+    
+    The same seed and settings always produce the same text. Filler prose comes from the
+    language's LANGUAGE_SEEDS text; entity mentions use the formats the basic extractor
+    recognizes, and clause sentences are English because the basic clause patterns are.
+    """
+    
+    FIRST_NAMES = ['Alice', 'Robert', 'Maria', 'James', 'Elena', 'David', 'Sophie', 'Thomas', 'Laura', 'Michael']
+    LAST_NAMES = ['Johnson', 'Schmidt', 'Garcia', 'Rossi', 'Dubois', 'Nielsen', 'Kowalski', 'Silva', 'Evans', 'Weber']
+    COMPANY_WORDS = ['Acme', 'Northwind', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Cyberdyne', 'Hooli', 'Vandelay']
+    COMPANY_SUFFIXES = ['Inc.', 'LLC', 'Corp.', 'Ltd.', 'Company', 'Corporation']
+    CLAUSES = {
+        'termination': "Either party may terminate this agreement upon thirty days written notice in the event of a "
+                       "breach of contract.",
+        'confidentiality': "The receiving party shall keep all proprietary information confidential and subject to "
+                           "the non-disclosure obligations herein.",
+        'indemnity': "The supplier shall indemnify and hold harmless the customer against any liability for damages "
+                     "arising from the services.",
+        'payment': "Payment terms are net thirty days from the date of each invoice, and late fees accrue monthly.",
+        'dispute_resolution': "Any dispute shall be resolved by binding arbitration, and the governing law shall be "
+                              "the law of the State of New York."
+    }
+    HEADINGS = ['DEFINITIONS', 'SERVICES', 'PAYMENT', 'TERM AND TERMINATION', 'CONFIDENTIALITY', 'INDEMNIFICATION',
+                'LIMITATION OF LIABILITY', 'GOVERNING LAW', 'DISPUTE RESOLUTION', 'GENERAL PROVISIONS']
+    
+    def __init__(self, seed=0, language='en', entities_per_page=12, clauses_per_page=3, page_chars=3000):
+        if language not in LANGUAGE_SEEDS:
+            raise ValueError(f"No seed text for language: {language}")
+        self.seed = seed
+        self.language = language
+        self.entities_per_page = entities_per_page
+        self.clauses_per_page = clauses_per_page
+        self.page_chars = page_chars
+        self.sentences = [sentence for sentence in re.split(r'(?<=[.!?])\s+', LANGUAGE_SEEDS[language].strip()) if sentence]
+    
+    def _entity(self, rng):
+        kind = rng.randrange(4)
+        if kind == 0:
+            return f"{rng.choice(self.FIRST_NAMES)} {rng.choice(self.LAST_NAMES)}"
+        if kind == 1:
+            return f"{rng.choice(self.COMPANY_WORDS)} {rng.choice(self.COMPANY_SUFFIXES)}"
+        if kind == 2:
+            return f"${rng.randrange(1000, 10000000):,}.00"
+        day = date(2020, 1, 1) + timedelta(days=rng.randrange(3650))
+        return day.strftime('%m/%d/%Y')
+    
+    def pages(self, page_count):
+        """Return the document as a list of page texts"""
+        rng = random.Random(f"{self.seed}:{self.language}")
+        pages = []
+        section = 0
+        for _ in range(page_count):
+            # Spread the page's entity mentions and clauses over its paragraphs
+            inserts = [', '.join(self._entity(rng) for _ in range(3)) + '.'
+                       for _ in range((self.entities_per_page + 2) // 3)]
+            inserts += [self.CLAUSES[rng.choice(list(self.CLAUSES))] for _ in range(self.clauses_per_page)]
+            rng.shuffle(inserts)
+            
+            paragraphs = []
+            length = 0
+            while length < self.page_chars or inserts:
+                if rng.random() < 0.25:
+                    section += 1
+                    heading = f"{section}. {self.HEADINGS[section % len(self.HEADINGS)]}"
+                    paragraphs.append(heading)
+                    length += len(heading)
+                sentences = [rng.choice(self.sentences) for _ in range(rng.randint(3, 6))]
+                if inserts:
+                    sentences.insert(rng.randrange(len(sentences) + 1), inserts.pop())
+                paragraph = ' '.join(sentences)
+                paragraphs.append(paragraph)
+                length += len(paragraph)
+            pages.append('\n\n'.join(paragraphs) + '\n')
+        return pages
+    
+    def text(self, page_count):
+        """Return the document as plain text"""
+        return '\n'.join(self.pages(page_count))
+    
+    def to_txt(self, page_count):
+        """Return the document as UTF-8 TXT file bytes"""
+        return self.text(page_count).encode('utf-8')
+    
+    def to_docx(self, page_count):
+        """Return the document as DOCX file bytes, or None if python-docx is not installed"""
+        try:
+            import docx
+        except ImportError:
+            return None
+        document = docx.Document()
+        for page in self.pages(page_count):
+            for paragraph in page.split('\n\n'):
+                document.add_paragraph(paragraph.strip())
+        buffer = io.BytesIO()
+        document.save(buffer)
+        return buffer.getvalue()
+    
+    def to_pdf(self, page_count, line_chars=95, lines_per_page=60):
+        """Return the document as PDF file bytes, one or more PDF pages per generated page
+        
+        Written directly with the base Helvetica font, so characters outside Latin-1 become '?'.
+        """
+        def escape(line):
+            return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        
+        pdf_pages = []
+        for page in self.pages(page_count):
+            lines = []
+            for paragraph in page.split('\n'):
+                words = paragraph.split()
+                current = ''
+                for word in words:
+                    if current and len(current) + len(word) + 1 > line_chars:
+                        lines.append(current)
+                        current = word
+                    else:
+                        current = f"{current} {word}" if current else word
+                lines.append(current)
+            for start in range(0, len(lines), lines_per_page):
+                content = ['BT', '/F1 10 Tf', '12 TL', '50 780 Td']
+                content += [f"({escape(line)}) '" for line in lines[start:start + lines_per_page]]
+                content.append('ET')
+                pdf_pages.append('\n'.join(content).encode('latin-1', errors='replace'))
+        
+        # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+        page_ids = [4 + 2 * index for index in range(len(pdf_pages))]
+        objects = [
+            b'<< /Type /Catalog /Pages 2 0 R >>',
+            f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] "
+            f"/Count {len(page_ids)} >>".encode('ascii'),
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'
+        ]
+        for page_id, content in zip(page_ids, pdf_pages):
+            objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                           f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode('ascii'))
+            objects.append(f"<< /Length {len(content)} >>\nstream\n".encode('ascii') + content + b'\nendstream')
+        
+        output = io.BytesIO()
+        output.write(b'%PDF-1.4\n')
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(output.tell())
+            output.write(f"{number} 0 obj\n".encode('ascii') + body + b'\nendobj\n')
+        xref_offset = output.tell()
+        output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii'))
+        output.write(''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('ascii'))
+        output.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+        return output.getvalue()
+
+def measure(fn, min_iterations=3, max_iterations=50, min_seconds=1.0):
+    """Time repeated calls of fn, then trace one more call for peak memory
+    
+    Returns (latencies in seconds, peak traced memory in bytes).
+    """
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iterations and (len(latencies) < min_iterations or time.perf_counter() - started < min_seconds):
+        gc.collect()
+        call_started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - call_started)
+    
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return latencies, peak_bytes
+
+def summarize(latencies, peak_bytes, work, unit):
+    """Summarize latencies and peak memory; throughput is work units per second at the median"""
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = statistics.median(latencies), percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        'iterations': len(latencies),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'throughput': round(work / p50, 2) if p50 > 0 else None,
+        'throughput_unit': unit,
+        'peak_memory_kb': round(peak_bytes / 1024, 1)
+    }
+
+def run_benchmarks(page_counts, languages, stages=None, seed=0, entities_per_page=12, clauses_per_page=3,
+                   min_iterations=3, max_iterations=50, min_seconds=1.0, db_operations=200, gemini_model=None,
+                   gemini_workers=4, gemini_requests_per_minute=100000):
+    """Run every selected stage for each language and document size
+    
+    The gemini_* stages run only with a gemini_model, normally a local FakeGeminiModel or
+    ReplayModel. Returns a dict of results keyed "<stage>[<language>,<pages>p]".
+    """
+    analyzer = LegalDocumentAnalyzer()
+    results = {}
+    
+    def record(stage, language, pages, fn, work, unit):
+        if stages and stage not in stages:
+            return
+        latencies, peak_bytes = measure(fn, min_iterations, max_iterations, min_seconds)
+        key = f"{stage}[{language},{pages}p]"
+        results[key] = dict(stage=stage, language=language, pages=pages, **summarize(latencies, peak_bytes, work, unit))
+        logger.info("%-40s p50 %10.3f ms  p95 %10.3f ms  %12.1f %s  peak %9.1f KB", key,
+                    results[key]['p50_ms'], results[key]['p95_ms'], results[key]['throughput'] or 0.0, unit,
+                    results[key]['peak_memory_kb'])
+    
+    for language in languages:
+        generator = SyntheticContractGenerator(seed, language, entities_per_page, clauses_per_page)
+        for pages in page_counts:
+            text = generator.text(pages)
+            megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+            
+            txt_bytes = generator.to_txt(pages)
+            record('extract_txt', language, pages,
+                   lambda: analyzer.extract_text_from_txt(io.BytesIO(txt_bytes)), megabytes, 'MB/s')
+            
+            if not stages or 'extract_docx' in stages:
+                docx_bytes = generator.to_docx(pages)
+                if docx_bytes is None:
+                    logger.warning("python-docx is not installed; skipping extract_docx")
+                else:
+                    record('extract_docx', language, pages,
+                           lambda: analyzer.extract_text_from_docx(io.BytesIO(docx_bytes)), megabytes, 'MB/s')
+            
+            if not stages or 'extract_pdf' in stages:
+                pdf_bytes = generator.to_pdf(pages)
+                # A failed extraction returns '' instead of raising, and timing it would report bogus throughput
+                if not analyzer.extract_text_from_pdf(io.BytesIO(pdf_bytes)).strip():
+                    logger.warning("No text could be extracted from the synthetic PDF (is PyPDF2 installed?); "
+                                   "skipping extract_pdf")
+                else:
+                    record('extract_pdf', language, pages,
+                           lambda: analyzer.extract_text_from_pdf(io.BytesIO(pdf_bytes)), pages, 'pages/s')
+            
+            record('basic_analysis', language, pages, lambda: analyzer._basic_analysis(text), megabytes, 'MB/s')
+            record('basic_entities', language, pages, lambda: analyzer._extract_basic_entities(text), megabytes, 'MB/s')
+            record('entity_offsets', language, pages,
+                   lambda: analyzer.extract_entities_with_offsets(text), megabytes, 'MB/s')
+            
+            entity_strings = [entity for found in analyzer._extract_basic_entities(text).values() for entity in found]
+            def highlight():
+                highlighter = EntityHighlighter(entity_strings)
+                for start, end in paginate_text(text):
+                    highlighter.to_html(text, start, end)
+            record('highlight', language, pages, highlight, megabytes, 'MB/s')
+            
+            record('detect_language', language, pages, lambda: detect_language_local(text), 1, 'docs/s')
+    
+    if not stages or any(stage.startswith('db_') for stage in stages):
+        results.update(run_database_benchmarks(
+            languages[0], seed, entities_per_page, clauses_per_page, stages, min_iterations, max_iterations,
+            min_seconds, db_operations
+        ))
+    if gemini_model is not None and (not stages or any(stage.startswith('gemini_') for stage in stages)):
+        results.update(run_gemini_benchmarks(
+            page_counts, languages, gemini_model, seed, entities_per_page, clauses_per_page, stages, min_iterations,
+            max_iterations, min_seconds, gemini_workers, gemini_requests_per_minute
+        ))
+    return results
+
+def run_gemini_benchmarks(page_counts, languages, model, seed, entities_per_page, clauses_per_page, stages,
+                          min_iterations, max_iterations, min_seconds, workers, requests_per_minute):
+    """Time the Gemini analysis and translation paths end to end against a local model
+    
+    Each call starts from an empty cache and translation memory, so every request reaches the
+    model and its injected latency and failures, while chunking, concurrency, retries and rate
+    limiting run as they do against the real API.
+    """
+    directory = tempfile.mkdtemp(prefix='legal_benchmark_')
+    gemini = GeminiIntegration(cache=AnalysisCache(os.path.join(directory, 'cache.db')), model=model,
+                               max_workers=workers, max_concurrency=workers, requests_per_minute=requests_per_minute)
+    # A limiter of our own: the shared one for a missing API key may already pace at another quota
+    gemini.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute=10 ** 9)
+    analyzer = LegalDocumentAnalyzer(gemini)
+    results = {}
+    
+    def analyze(text):
+        gemini.cache.clear()
+        analyzer.analyze_document_full(text)
+    
+    def translate(text, language):
+        gemini.cache.clear()
+        gemini.translation_memory.clear()
+        gemini.translate_text(text, 'fr' if language == 'en' else 'en', language)
+    
+    try:
+        for language in languages:
+            generator = SyntheticContractGenerator(seed, language, entities_per_page, clauses_per_page)
+            for pages in page_counts:
+                text = generator.text(pages)
+                for stage, fn in (('gemini_analysis', lambda: analyze(text)),
+                                  ('gemini_translation', lambda: translate(text, language))):
+                    if stages and stage not in stages:
+                        continue
+                    latencies, peak_bytes = measure(fn, min_iterations, max_iterations, min_seconds)
+                    key = f"{stage}[{language},{pages}p]"
+                    results[key] = dict(stage=stage, language=language, pages=pages,
+                                        **summarize(latencies, peak_bytes, pages, 'pages/s'))
+                    logger.info("%-40s p50 %10.3f ms  p95 %10.3f ms  %12.1f pages/s  peak %9.1f KB", key,
+                                results[key]['p50_ms'], results[key]['p95_ms'], results[key]['throughput'] or 0.0,
+                                results[key]['peak_memory_kb'])
+        if hasattr(model, 'get_stats'):
+            logger.info("Local model: %s; rate limiter: %s", model.get_stats(), gemini.rate_limiter.get_stats())
+    finally:
+        gemini.executor.shutdown(wait=False, cancel_futures=True)
+        gemini.cache.pool.close_all()
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def run_database_benchmarks(language, seed, entities_per_page, clauses_per_page, stages, min_iterations,
+                            max_iterations, min_seconds, operations):
+    """Time UserManager operations against a temporary database holding `operations` saved analyses"""
+    analyzer = LegalDocumentAnalyzer()
+    text = SyntheticContractGenerator(seed, language, entities_per_page, clauses_per_page).text(5)
+    analysis_result = analyzer._basic_analysis(text)
+    entities = analyzer._extract_basic_entities(text)
+    entity_offsets = analyzer.extract_entities_with_offsets(text)
+    results = {}
+    
+    directory = tempfile.mkdtemp(prefix='legal_benchmark_')
+    try:
+        user_manager = UserManager(os.path.join(directory, 'benchmark.db'))
+        user_manager.register_user('benchmark', 'benchmark')
+        user_id = user_manager.login_user('benchmark', 'benchmark')[1][0]
+        counter = iter(range(sys.maxsize))
+        
+        def save():
+            number = next(counter)
+            return user_manager.save_analysis(
+                user_id, f"Contract_{number}.txt", 'Services Agreement', len(text.split()), language, 'en',
+                f"Synthetic contract {number}", analysis_result=analysis_result, entities=entities,
+                text=text + str(number), entity_offsets=entity_offsets, ai_engine='Basic Analysis'
+            )
+        
+        analysis_ids = [save() for _ in range(operations)]
+        rng = random.Random(seed)
+        operations_by_stage = {
+            'db_save_analysis': save,
+            'db_history_page': lambda: user_manager.get_history_page(user_id, 20),
+            'db_search_history': lambda: user_manager.search_history(user_id, 'arbitration confidential'),
+            'db_user_stats': lambda: user_manager.get_user_stats(user_id),
+            'db_load_analysis': lambda: user_manager.load_analysis(user_id, rng.choice(analysis_ids))
+        }
+        for stage, fn in operations_by_stage.items():
+            if stages and stage not in stages:
+                continue
+            latencies, peak_bytes = measure(fn, max(min_iterations, 20), max(max_iterations, 200), min_seconds)
+            key = f"{stage}[{language},{operations}rows]"
+            results[key] = dict(stage=stage, language=language, pages=None, rows=operations,
+                                **summarize(latencies, peak_bytes, 1, 'ops/s'))
+            logger.info("%-40s p50 %10.3f ms  p95 %10.3f ms  %12.1f ops/s", key,
+                        results[key]['p50_ms'], results[key]['p95_ms'], results[key]['throughput'] or 0.0)
+        user_manager.pool.close_all()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+def compare_results(results, baseline, threshold=0.15):
+    """Compare results with a baseline; returns a list of (key, metric, baseline value, new value, change)
+    
+    A stage regresses when its median latency or peak memory grows by more than threshold
+    (a fraction, so 0.15 is 15%).
+    """
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get('results', {}).get(key)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'peak_memory_kb'):
+            old, new = previous.get(metric), result.get(metric)
+            if old and new is not None and (new - old) / old > threshold:
+                regressions.append((key, metric, old, new, (new - old) / old))
+    return regressions
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark extraction, analysis, highlighting and history storage")
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100],
+                        help="Document sizes to benchmark, in pages (1 to 1000)")
+    parser.add_argument('--languages', nargs='+', default=['en'], choices=sorted(LANGUAGE_SEEDS),
+                        help="Languages of the synthetic documents")
+    parser.add_argument('--stages', nargs='+', help="Only run these stages (e.g. extract_pdf basic_analysis db_save_analysis)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic documents")
+    parser.add_argument('--entities-per-page', type=int, default=12, help="Entity mentions per page")
+    parser.add_argument('--clauses-per-page', type=int, default=3, help="Clause sentences per page")
+    parser.add_argument('--min-iterations', type=int, default=3, help="Minimum timed runs per stage")
+    parser.add_argument('--max-iterations', type=int, default=50, help="Maximum timed runs per stage")
+    parser.add_argument('--min-seconds', type=float, default=1.0, help="Keep repeating a stage for at least this long")
+    parser.add_argument('--db-rows', type=int, default=200, help="Analyses saved before timing database operations")
+    parser.add_argument('--gemini-latency', type=float, default=0.5,
+                        help="Seconds the local Gemini stand-in takes per request (gemini_* stages)")
+    parser.add_argument('--gemini-token-latency', type=float, default=0.0, help="Extra seconds per output token")
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument('--gemini-429-rate', type=float, default=0.0, help="Fraction of requests failing with 429")
+    parser.add_argument('--gemini-quota', type=int, help="Requests per minute the stand-in accepts before answering 429")
+    parser.add_argument('--gemini-replay', metavar='PATH',
+                        help="Answer with replies recorded by RecordingModel, faking prompts that were not recorded")
+    parser.add_argument('--gemini-workers', type=int, default=4, help="Concurrent Gemini requests")
+    parser.add_argument('--gemini-rpm', type=int, default=100000, help="Client-side requests-per-minute limit")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Save the results as a baseline JSON file")
+    parser.add_argument('--compare', metavar='PATH', help="Compare against a baseline JSON file and flag regressions")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="Relative slowdown or memory growth counted as a regression (default 0.15)")
+    args = parser.parse_args(argv)
+    
+    if any(pages < 1 or pages > 1000 for pages in args.pages):
+        parser.error("--pages must be between 1 and 1000")
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    
+    faults = dict(latency=args.gemini_latency, token_latency=args.gemini_token_latency,
+                  error_rate=args.gemini_error_rate, rate_limit_rate=args.gemini_429_rate,
+                  quota_per_minute=args.gemini_quota, seed=args.seed)
+    if args.gemini_replay:
+        gemini_model = ReplayModel(args.gemini_replay, fallback=FakeGeminiModel(), **faults)
+    else:
+        gemini_model = FakeGeminiModel(**faults)
+    
+    results = run_benchmarks(
+        args.pages, args.languages,
+        stages=set(args.stages) if args.stages else None,
+        seed=args.seed,
+        entities_per_page=args.entities_per_page,
+        clauses_per_page=args.clauses_per_page,
+        min_iterations=args.min_iterations,
+        max_iterations=args.max_iterations,
+        min_seconds=args.min_seconds,
+        db_operations=args.db_rows,
+        gemini_model=gemini_model,
+        gemini_workers=args.gemini_workers,
+        gemini_requests_per_minute=args.gemini_rpm
+    )
+    report = {
+        'version': BASELINE_VERSION,
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'save_baseline', 'compare', 'threshold')},
+        'results': results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+            logger.info("Results written to %s", path)
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline.get('version') != BASELINE_VERSION:
+            logger.warning("Baseline was written by a different benchmark version; comparing anyway")
+        regressions = compare_results(results, baseline, args.threshold)
+        for key, metric, old, new, change in regressions:
+            logger.warning("REGRESSION %s %s: %.3f -> %.3f (%+.0f%%)", key, metric, old, new, change * 100)
+        compared = sum(1 for key in results if key in baseline.get('results', {}))
+        logger.info("%d of %d stages compared with %s, %d regressions", compared, len(results), args.compare,
+                    len(regressions))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
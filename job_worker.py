@@ -0,0 +1,208 @@
+"""Background workers for the durable analysis job queue.
+
+Jobs are rows in a SQLite JobQueue, so no external broker is needed. Each worker
+process leases one job at a time, runs extraction and analysis with
+LegalDocumentAnalyzer (and Gemini when an API key is available), and records
+the result. Failed jobs are retried with backoff and dead-lettered after
+their last attempt. The number of worker processes caps concurrency; the
+queue's max depth gives back-pressure to producers.
+
+Example:
+    python job_worker.py --processes 4
+    python job_worker.py --stats
+    python job_worker.py --requeue <job_id>
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from legal_core import DB_PATH, JOBS_DB_PATH, JobQueue, LegalDocumentAnalyzer, UserManager, get_gemini_integration
+
+# Uploads waiting for a worker; kept outside the temp dir so queued jobs survive a restart
+SPOOL_DIR = 'job_uploads'
+
+logger = logging.getLogger('job_worker')
+
+def analyze_path(analyzer, path, document_name, target_lang='en', pdf_workers=1):
+    """Extract and analyze a document on disk
+    
+    Returns the extracted text and a JSON-serializable result record.
+    """
+    started = time.perf_counter()
+    # Pages stream straight into chunked analysis, so Gemini starts before the whole PDF is decoded
+    text, original_lang, analysis_result, entities = analyzer.analyze_text_stream(
+        analyzer.iter_text_from_path(path, pdf_workers), target_lang
+    )
+    if not text.strip():
+        raise ValueError("No text could be extracted")
+    
+    record = {
+        'document_name': document_name,
+        'analyzed_at': datetime.now().isoformat(),
+        'original_language': original_lang,
+        'target_language': target_lang,
+        'word_count': len(text.split()),
+        'character_count': len(text),
+        'ai_engine': 'Gemini AI' if analyzer.gemini and analyzer.gemini.is_configured else 'Basic Analysis',
+        'analysis_result': analysis_result,
+        'entities': entities,
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }
+    return text, record
+
+def enqueue_analysis(queue, path, document_name, target_lang='en', user_id=None):
+    """Queue a spooled document for analysis; the worker deletes the file once the job succeeds
+    
+    With a user_id the result is also saved to that user's analysis history.
+    """
+    payload = {'path': os.path.abspath(path), 'document_name': document_name, 'target_lang': target_lang}
+    return queue.enqueue('analyze_file', payload, user_id=user_id)
+
+def spool_path(document_name):
+    """Reserve a file path in the spool directory for an upload"""
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    extension = os.path.splitext(document_name)[1].lower()
+    return os.path.join(SPOOL_DIR, f"{uuid.uuid4().hex}{extension}")
+
+def run_job(job, analyzer, user_manager, pdf_workers=1):
+    """Run one claimed job and return its result"""
+    if job['kind'] != 'analyze_file':
+        raise ValueError(f"Unknown job kind: {job['kind']}")
+    
+    payload = job['payload']
+    text, record = analyze_path(analyzer, payload['path'], payload['document_name'], payload['target_lang'], pdf_workers)
+    
+    if job['user_id']:
+        analysis_result = record['analysis_result']
+        record['analysis_id'] = user_manager.save_analysis(
+            job['user_id'],
+            payload['document_name'],
+            analysis_result.get('document_type', 'Legal Document'),
+            record['word_count'],
+            record['original_language'],
+            record['target_language'],
+            analysis_result.get('summary', 'Analysis completed'),
+            analysis_result=analysis_result,
+            entities=record['entities'],
+            text=text,
+            entity_offsets=analyzer.extract_entities_with_offsets(text),
+            ai_engine=record['ai_engine']
+        )
+    return record
+
+def run_worker(stop_event, api_key=None, queue_db=JOBS_DB_PATH, history_db=DB_PATH, pdf_workers=1,
+               poll_interval=1.0, lease_seconds=600):
+    """Claim and run jobs until stop_event is set"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(queue_db)
+    user_manager = UserManager(history_db)
+    analyzer = LegalDocumentAnalyzer(get_gemini_integration(api_key) if api_key else None)
+    
+    while not stop_event.is_set():
+        job = queue.claim(worker_id, lease_seconds)
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        
+        # Renew the lease while the job runs so long documents are not handed to a second worker
+        job_done = threading.Event()
+        def keep_leased(job_id=job['id']):
+            while not job_done.wait(lease_seconds / 3):
+                queue.extend_lease(job_id, lease_seconds)
+        threading.Thread(target=keep_leased, daemon=True).start()
+        
+        status = 'done'
+        try:
+            queue.complete(job['id'], run_job(job, analyzer, user_manager, pdf_workers))
+        except Exception as e:
+            # Bad input fails the same way every time, so only other errors are retried
+            retryable = not isinstance(e, (ValueError, FileNotFoundError))
+            status = queue.fail(job['id'], f"{type(e).__name__}: {e}", retryable)
+            logger.warning("Job %s attempt %d failed (%s): %s", job['id'], job['attempts'], status, e)
+        finally:
+            job_done.set()
+        
+        # Dead-lettered jobs keep their upload so they can be requeued
+        if status == 'done':
+            path = job['payload'].get('path')
+            if path and os.path.exists(path):
+                os.remove(path)
+
+def start_workers(processes, api_key=None, queue_db=JOBS_DB_PATH, history_db=DB_PATH, pdf_workers=1):
+    """Start worker processes; returns the processes and the event that stops them
+    
+    The workers are not daemonic, because a daemonic process cannot start the PDF extraction pool
+    (pdf_workers > 1). Shut them down with stop_workers.
+    """
+    # Spawn rather than fork, so workers never inherit the parent's SQLite connections or Gemini threads
+    context = multiprocessing.get_context('spawn')
+    stop_event = context.Event()
+    workers = [
+        context.Process(target=run_worker, args=(stop_event, api_key, queue_db, history_db, pdf_workers),
+                        name=f"job-worker-{i}")
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers, stop_event
+
+def stop_workers(workers, stop_event, timeout=None):
+    """Ask workers to stop after their current job and wait for them
+    
+    Workers still running after timeout seconds are terminated; their job's lease runs out and
+    another worker picks it up.
+    """
+    stop_event.set()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for worker in workers:
+        worker.join(None if deadline is None else max(0, deadline - time.monotonic()))
+    for worker in workers:
+        if worker.is_alive():
+            logger.warning("Worker %s did not stop in time; terminating it", worker.name)
+            worker.terminate()
+            worker.join()
+
+def main(argv=None):
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Run workers for the legal document analysis job queue")
+    parser.add_argument('-p', '--processes', type=int, default=2, help="Worker processes (jobs run at once)")
+    parser.add_argument('--api-key', default=os.environ.get('GOOGLE_API_KEY'),
+                        help="Google API key for Gemini analysis (defaults to $GOOGLE_API_KEY)")
+    parser.add_argument('--queue-db', default=JOBS_DB_PATH, help="Job queue database")
+    parser.add_argument('--history-db', default=DB_PATH, help="User and analysis history database")
+    parser.add_argument('--pdf-workers', type=int, default=1, help="Processes used to extract pages of each PDF")
+    parser.add_argument('--stats', action='store_true', help="Print the number of jobs in each state and exit")
+    parser.add_argument('--requeue', metavar='JOB_ID', help="Give a dead-lettered job a fresh set of attempts and exit")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(processName)s %(message)s')
+    
+    if args.stats:
+        depth = JobQueue(args.queue_db).get_depth()
+        print(' '.join(f"{status}={count}" for status, count in depth.items()))
+        return 0
+    if args.requeue:
+        requeued = JobQueue(args.queue_db).requeue(args.requeue)
+        logger.info("Job %s %s", args.requeue, "requeued" if requeued else "is not dead-lettered")
+        return 0 if requeued else 1
+    
+    workers, stop_event = start_workers(args.processes, args.api_key, args.queue_db, args.history_db, args.pdf_workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    logger.info("Started %d workers", len(workers))
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop_workers(workers, stop_event)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
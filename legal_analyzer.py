@@ -1,68 +1,42 @@
 import streamlit as st
 import pandas as pd
-import re
 import json
 import hashlib
-from datetime import datetime, timedelta
-from io import BytesIO
-import base64
-from typing import Dict, List, Tuple, Any
-import PyPDF2
-import docx
-import mammoth
-import warnings
-import sqlite3
-import uuid
-import google.generativeai as genai
-from langdetect import detect
+import html
 import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import warnings
+from legal_core import (LANGUAGES, AnalysisCache, DocumentChunker, GeminiIntegration, JobQueue, QueueFullError,
+                        TranslationMemory, UserManager, LegalDocumentAnalyzer, EntityHighlighter, collect_messages,
+                        detect_language_local, get_gemini_integration, get_result_store, paginate_text)
+from job_worker import enqueue_analysis, spool_path
 warnings.filterwarnings('ignore')
 
-# Configure Streamlit page
-st.set_page_config(
-    page_title="AI Legal Document Analyzer with Gemini",
-    page_icon="⚖️",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+def configure_page():
+    """Configure the Streamlit page; must run before any other Streamlit call"""
+    st.set_page_config(
+        page_title="AI Legal Document Analyzer with Gemini",
+        page_icon="⚖️",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
 
-# Initialize session state for user management
-if 'logged_in' not in st.session_state:
-    st.session_state.logged_in = False
-if 'username' not in st.session_state:
-    st.session_state.username = ""
-if 'user_id' not in st.session_state:
-    st.session_state.user_id = ""
-if 'analysis_history' not in st.session_state:
-    st.session_state.analysis_history = []
-if 'current_language' not in st.session_state:
-    st.session_state.current_language = 'en'
-if 'gemini_configured' not in st.session_state:
-    st.session_state.gemini_configured = False
-
-# Supported languages
-LANGUAGES = {
-    'en': 'English',
-    'es': 'Spanish (Español)',
-    'fr': 'French (Français)',
-    'de': 'German (Deutsch)',
-    'it': 'Italian (Italiano)',
-    'pt': 'Portuguese (Português)',
-    'ru': 'Russian (Русский)',
-    'zh': 'Chinese (中文)',
-    'ja': 'Japanese (日本語)',
-    'ko': 'Korean (한국어)',
-    'ar': 'Arabic (العربية)',
-    'hi': 'Hindi (हिन्दी)',
-    'nl': 'Dutch (Nederlands)',
-    'sv': 'Swedish (Svenska)',
-    'no': 'Norwegian (Norsk)',
-    'da': 'Danish (Dansk)',
-    'fi': 'Finnish (Suomi)',
-    'pl': 'Polish (Polski)',
-    'tr': 'Turkish (Türkçe)',
-    'he': 'Hebrew (עברית)'
-}
+def init_session_state():
+    """Initialize session state for user management"""
+    if 'logged_in' not in st.session_state:
+        st.session_state.logged_in = False
+    if 'username' not in st.session_state:
+        st.session_state.username = ""
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = ""
+    if 'analysis_history' not in st.session_state:
+        st.session_state.analysis_history = []
+    if 'current_language' not in st.session_state:
+        st.session_state.current_language = 'en'
+    if 'gemini_configured' not in st.session_state:
+        st.session_state.gemini_configured = False
 
 # Translation dictionary for UI elements
 TRANSLATIONS = {
@@ -103,7 +77,12 @@ TRANSLATIONS = {
         'gemini_setup': 'Gemini AI Setup',
         'api_key': 'Google API Key',
         'configure_gemini': 'Configure Gemini',
-        'gemini_status': 'Gemini Status'
+        'gemini_status': 'Gemini Status',
+        'clause_termination': 'Termination',
+        'clause_confidentiality': 'Confidentiality',
+        'clause_indemnity': 'Indemnity',
+        'clause_payment': 'Payment',
+        'clause_dispute_resolution': 'Dispute Resolution'
     },
     'es': {
         'title': 'Analizador de Documentos Legales con Gemini IA',
@@ -142,7 +121,12 @@ TRANSLATIONS = {
         'gemini_setup': 'Configuración de Gemini IA',
         'api_key': 'Clave API de Google',
         'configure_gemini': 'Configurar Gemini',
-        'gemini_status': 'Estado de Gemini'
+        'gemini_status': 'Estado de Gemini',
+        'clause_termination': 'Terminación',
+        'clause_confidentiality': 'Confidencialidad',
+        'clause_indemnity': 'Indemnización',
+        'clause_payment': 'Pago',
+        'clause_dispute_resolution': 'Resolución de Disputas'
     },
     'fr': {
         'title': 'Analyseur de Documents Juridiques avec Gemini IA',
@@ -181,7 +165,12 @@ TRANSLATIONS = {
         'gemini_setup': 'Configuration Gemini IA',
         'api_key': 'Clé API Google',
         'configure_gemini': 'Configurer Gemini',
-        'gemini_status': 'Statut Gemini'
+        'gemini_status': 'Statut Gemini',
+        'clause_termination': 'Résiliation',
+        'clause_confidentiality': 'Confidentialité',
+        'clause_indemnity': 'Indemnisation',
+        'clause_payment': 'Paiement',
+        'clause_dispute_resolution': 'Règlement des litiges'
     }
 }
 
@@ -190,8 +179,26 @@ def t(key):
     current_lang = st.session_state.current_language
     return TRANSLATIONS.get(current_lang, TRANSLATIONS['en']).get(key, key)
 
+# Gemini returns short clause keys, the pattern-based fallback uses *_clauses keys
+CLAUSE_LABEL_KEYS = {
+    'termination': 'clause_termination',
+    'termination_clauses': 'clause_termination',
+    'confidentiality': 'clause_confidentiality',
+    'confidentiality_clauses': 'clause_confidentiality',
+    'indemnity': 'clause_indemnity',
+    'indemnity_clauses': 'clause_indemnity',
+    'payment': 'clause_payment',
+    'payment_clauses': 'clause_payment',
+    'dispute_resolution': 'clause_dispute_resolution',
+}
+
+def clause_label(clause_type):
+    """Translated display label for a clause type key"""
+    key = CLAUSE_LABEL_KEYS.get(clause_type)
+    return t(key) if key else clause_type.replace('_', ' ').title()
+
 # Custom CSS for better styling
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -222,6 +229,10 @@ st.markdown("""
         border-radius: 3px;
         font-weight: bold;
     }
+    .entity-highlight .entity-highlight {
+        background-color: #ffe680;
+        padding: 0 2px;
+    }
     .clause-highlight {
         background-color: #e6f3ff;
         padding: 4px 8px;
@@ -229,6 +240,21 @@ st.markdown("""
         border-left: 3px solid #4dabf7;
         margin: 5px 0;
     }
+    .aligned-text {
+        width: 100%;
+        border-collapse: collapse;
+    }
+    .aligned-text td {
+        width: 50%;
+        vertical-align: top;
+        padding: 6px 10px;
+        border-bottom: 1px solid #eee;
+        white-space: pre-wrap;
+    }
+    .aligned-text .pending {
+        color: #999;
+        font-style: italic;
+    }
     .metric-container {
         background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
         padding: 1rem;
@@ -278,527 +304,13 @@ st.markdown("""
         margin: 0.5rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
-
-class GeminiIntegration:
-    """Google Gemini AI integration for multilingual legal document analysis"""
-    
-    def __init__(self, api_key=None):
-        self.api_key = api_key
-        self.model = None
-        self.is_configured = False
-        
-        if api_key:
-            self.configure_gemini(api_key)
-    
-    def configure_gemini(self, api_key):
-        """Configure Gemini AI with API key"""
-        try:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            self.api_key = api_key
-            self.is_configured = True
-            return True, "Gemini AI configured successfully!"
-        except Exception as e:
-            self.is_configured = False
-            return False, f"Failed to configure Gemini: {str(e)}"
-    
-    def detect_language(self, text):
-        """Detect language using Gemini AI"""
-        if not self.is_configured:
-            # Fallback to langdetect
-            try:
-                return detect(text[:1000])
-            except:
-                return 'en'
-        
-        try:
-            prompt = f"""
-            Detect the primary language of the following text and return only the ISO 639-1 language code (e.g., 'en' for English, 'es' for Spanish, 'fr' for French):
-            
-            Text: {text[:500]}
-            
-            Language code:
-            """
-            
-            response = self.model.generate_content(prompt)
-            detected_lang = response.text.strip().lower()
-            
-            # Validate the response
-            if detected_lang in LANGUAGES:
-                return detected_lang
-            else:
-                # Fallback to langdetect
-                return detect(text[:1000])
-        except Exception as e:
-            st.warning(f"Gemini language detection failed: {str(e)}")
-            try:
-                return detect(text[:1000])
-            except:
-                return 'en'
-    
-    def translate_text(self, text, target_lang, source_lang=None):
-        """Translate text using Gemini AI"""
-        if not self.is_configured:
-            return text  # Return original text if Gemini not configured
-        
-        try:
-            source_lang_name = LANGUAGES.get(source_lang, 'auto-detect') if source_lang else 'auto-detect'
-            target_lang_name = LANGUAGES.get(target_lang, 'English')
-            
-            prompt = f"""
-            Translate the following legal document text from {source_lang_name} to {target_lang_name}. 
-            Preserve legal terminology and maintain the formal tone. Ensure accuracy of legal concepts:
-            
-            Text to translate: {text}
-            
-            Translation:
-            """
-            
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            st.warning(f"Gemini translation failed: {str(e)}")
-            return text
-    
-    def analyze_legal_document(self, text, target_lang='en'):
-        """Comprehensive legal document analysis using Gemini AI"""
-        if not self.is_configured:
-            return self._fallback_analysis(text)
-        
-        try:
-            prompt = f"""
-            Analyze the following legal document and provide a comprehensive analysis in {LANGUAGES.get(target_lang, 'English')}. 
-            
-            Please provide:
-            1. Document type and purpose
-            2. Key parties involved (names, organizations)
-            3. Important dates and deadlines
-            4. Financial terms and amounts
-            5. Key legal clauses (termination, confidentiality, indemnity, payment, dispute resolution)
-            6. Potential risks and liabilities
-            7. Key obligations for each party
-            8. Jurisdiction and governing law
-            9. Document summary
-            
-            Format the response as JSON with the following structure:
-            {{
-                "document_type": "string",
-                "parties": ["list of parties"],
-                "dates": ["list of important dates"],
-                "financial_terms": ["list of amounts and terms"],
-                "clauses": {{
-                    "termination": ["termination clauses"],
-                    "confidentiality": ["confidentiality clauses"],
-                    "indemnity": ["indemnity clauses"],
-                    "payment": ["payment clauses"],
-                    "dispute_resolution": ["dispute resolution clauses"]
-                }},
-                "risks": ["list of potential risks"],
-                "obligations": ["list of key obligations"],
-                "jurisdiction": "string",
-                "summary": "comprehensive summary"
-            }}
-            
-            Legal Document Text:
-            {text}
-            
-            Analysis (JSON format):
-            """
-            
-            response = self.model.generate_content(prompt)
-            
-            # Try to parse JSON response
-            try:
-                analysis = json.loads(response.text)
-                return analysis
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return structured text analysis
-                return {
-                    "document_type": "Legal Document",
-                    "parties": [],
-                    "dates": [],
-                    "financial_terms": [],
-                    "clauses": {
-                        "termination": [],
-                        "confidentiality": [],
-                        "indemnity": [],
-                        "payment": [],
-                        "dispute_resolution": []
-                    },
-                    "risks": [],
-                    "obligations": [],
-                    "jurisdiction": "Not specified",
-                    "summary": response.text[:1000] + "..." if len(response.text) > 1000 else response.text
-                }
-                
-        except Exception as e:
-            st.error(f"Gemini analysis failed: {str(e)}")
-            return self._fallback_analysis(text)
-    
-    def _fallback_analysis(self, text):
-        """Fallback analysis when Gemini is not available"""
-        return {
-            "document_type": "Legal Document",
-            "parties": [],
-            "dates": [],
-            "financial_terms": [],
-            "clauses": {
-                "termination": [],
-                "confidentiality": [],
-                "indemnity": [],
-                "payment": [],
-                "dispute_resolution": []
-            },
-            "risks": [],
-            "obligations": [],
-            "jurisdiction": "Analysis requires Gemini AI configuration",
-            "summary": "Please configure Gemini AI for detailed analysis."
-        }
-    
-    def extract_entities_advanced(self, text, target_lang='en'):
-        """Advanced entity extraction using Gemini AI"""
-        if not self.is_configured:
-            return {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
-        
-        try:
-            prompt = f"""
-            Extract the following entities from the legal document text. Respond in {LANGUAGES.get(target_lang, 'English')}:
-            
-            1. PERSONS: Names of individuals
-            2. ORGANIZATIONS: Company names, institutions
-            3. DATES: All dates mentioned
-            4. MONEY: Financial amounts, currencies
-            5. LOCATIONS: Places, addresses, jurisdictions
-            
-            Format as JSON:
-            {{
-                "PERSONS": ["list of person names"],
-                "ORGANIZATIONS": ["list of organizations"],
-                "DATES": ["list of dates"],
-                "MONEY": ["list of monetary amounts"],
-                "LOCATIONS": ["list of locations"]
-            }}
-            
-            Text: {text}
-            
-            Entities (JSON):
-            """
-            
-            response = self.model.generate_content(prompt)
-            
-            try:
-                entities = json.loads(response.text)
-                return entities
-            except json.JSONDecodeError:
-                return {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
-                
-        except Exception as e:
-            st.warning(f"Gemini entity extraction failed: {str(e)}")
-            return {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
-
-class UserManager:
-    """User management system with database integration"""
-    
-    def __init__(self):
-        self.init_database()
-    
-    def init_database(self):
-        """Initialize SQLite database for user management"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                email TEXT,
-                full_name TEXT,
-                organization TEXT,
-                created_date TEXT,
-                last_login TEXT,
-                gemini_api_key TEXT
-            )
-        ''')
-        
-        # Analysis history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS analysis_history (
-                id TEXT PRIMARY KEY,
-                user_id TEXT,
-                document_name TEXT,
-                analysis_date TEXT,
-                document_type TEXT,
-                word_count INTEGER,
-                original_language TEXT,
-                target_language TEXT,
-                summary TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def hash_password(self, password):
-        """Hash password using SHA256"""
-        return hashlib.sha256(password.encode()).hexdigest()
-    
-    def register_user(self, username, password, email="", full_name="", organization=""):
-        """Register a new user"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        try:
-            user_id = str(uuid.uuid4())
-            password_hash = self.hash_password(password)
-            created_date = datetime.now().isoformat()
-            
-            cursor.execute('''
-                INSERT INTO users (id, username, password_hash, email, full_name, organization, created_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, username, password_hash, email, full_name, organization, created_date))
-            
-            conn.commit()
-            conn.close()
-            return True, "User registered successfully!"
-        except sqlite3.IntegrityError:
-            conn.close()
-            return False, "Username already exists!"
-        except Exception as e:
-            conn.close()
-            return False, f"Registration failed: {str(e)}"
-    
-    def login_user(self, username, password):
-        """Authenticate user login"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        password_hash = self.hash_password(password)
-        cursor.execute('''
-            SELECT id, username, email, full_name, organization, gemini_api_key 
-            FROM users 
-            WHERE username = ? AND password_hash = ?
-        ''', (username, password_hash))
-        
-        user = cursor.fetchone()
-        
-        if user:
-            # Update last login
-            cursor.execute('''
-                UPDATE users 
-                SET last_login = ? 
-                WHERE id = ?
-            ''', (datetime.now().isoformat(), user[0]))
-            conn.commit()
-            conn.close()
-            return True, user
-        else:
-            conn.close()
-            return False, None
-    
-    def update_gemini_key(self, user_id, api_key):
-        """Update user's Gemini API key"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE users 
-            SET gemini_api_key = ? 
-            WHERE id = ?
-        ''', (api_key, user_id))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_gemini_key(self, user_id):
-        """Get user's Gemini API key"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT gemini_api_key FROM users WHERE id = ?', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result[0] if result and result[0] else None
-    
-    def save_analysis(self, user_id, document_name, document_type, word_count, original_lang, target_lang, summary):
-        """Save analysis to history"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        analysis_id = str(uuid.uuid4())
-        analysis_date = datetime.now().isoformat()
-        
-        cursor.execute('''
-            INSERT INTO analysis_history (id, user_id, document_name, analysis_date, document_type, 
-                                        word_count, original_language, target_language, summary)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (analysis_id, user_id, document_name, analysis_date, document_type, 
-              word_count, original_lang, target_lang, summary))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_user_history(self, user_id):
-        """Get user's analysis history"""
-        conn = sqlite3.connect('legal_analyzer_gemini.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT document_name, analysis_date, document_type, word_count, 
-                   original_language, target_language, summary
-            FROM analysis_history 
-            WHERE user_id = ? 
-            ORDER BY analysis_date DESC
-            LIMIT 20
-        ''', (user_id,))
-        
-        history = cursor.fetchall()
-        conn.close()
-        return history
-
-class LegalDocumentAnalyzer:
-    """Enhanced legal document analyzer with Gemini AI integration"""
-    
-    def __init__(self, gemini_integration=None):
-        self.gemini = gemini_integration
-        
-        # Fallback patterns for basic analysis when Gemini is not available
-        self.legal_patterns = {
-            'termination_clauses': [
-                r'terminat[ei](?:on|ng)', r'end(?:ing)?\s+(?:of\s+)?(?:this\s+)?(?:agreement|contract)',
-                r'expir[ey](?:ation)?', r'breach\s+of\s+contract'
-            ],
-            'confidentiality_clauses': [
-                r'confidential(?:ity)?', r'non-disclos(?:ure|e)', r'proprietary\s+information'
-            ],
-            'indemnity_clauses': [
-                r'indemnif(?:y|ication)', r'hold\s+harmless', r'liability\s+(?:for\s+)?damages'
-            ],
-            'payment_clauses': [
-                r'payment\s+terms?', r'invoice', r'compensation', r'fee(?:s)?'
-            ],
-            'dispute_resolution': [
-                r'arbitration', r'mediation', r'dispute\s+resolution', r'governing\s+law'
-            ]
-        }
-    
-    def extract_text_from_pdf(self, file) -> str:
-        """Extract text from PDF file"""
-        try:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            st.error(f"Error reading PDF: {str(e)}")
-            return ""
-    
-    def extract_text_from_docx(self, file) -> str:
-        """Extract text from DOCX file"""
-        try:
-            doc = docx.Document(file)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-        except Exception as e:
-            st.error(f"Error reading DOCX: {str(e)}")
-            return ""
-    
-    def extract_text_from_txt(self, file) -> str:
-        """Extract text from TXT file"""
-        try:
-            return str(file.read(), "utf-8")
-        except Exception as e:
-            st.error(f"Error reading TXT: {str(e)}")
-            return ""
-    
-    def analyze_document(self, text, target_lang='en'):
-        """Main document analysis function"""
-        if self.gemini and self.gemini.is_configured:
-            return self.gemini.analyze_legal_document(text, target_lang)
-        else:
-            return self._basic_analysis(text)
-    
-    def _basic_analysis(self, text):
-        """Basic analysis when Gemini is not available"""
-        # Basic entity extraction
-        entities = self._extract_basic_entities(text)
-        
-        # Basic clause extraction
-        clauses = {}
-        for clause_type, patterns in self.legal_patterns.items():
-            clauses[clause_type] = []
-            for pattern in patterns:
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                for match in matches:
-                    start = max(0, match.start() - 50)
-                    end = min(len(text), match.end() + 100)
-                    context = text[start:end].strip()
-                    context = re.sub(r'\s+', ' ', context)
-                    if context not in clauses[clause_type]:
-                        clauses[clause_type].append(context)
-        
-        return {
-            "document_type": "Legal Document",
-            "parties": entities.get('PERSONS', []) + entities.get('ORGANIZATIONS', []),
-            "dates": entities.get('DATES', []),
-            "financial_terms": entities.get('MONEY', []),
-            "clauses": clauses,
-            "risks": ["Basic analysis - configure Gemini for detailed risk assessment"],
-            "obligations": ["Basic analysis - configure Gemini for detailed obligation analysis"],
-            "jurisdiction": "Not detected",
-            "summary": f"Document contains {len(text.split())} words. Basic analysis performed."
-        }
-    
-    def _extract_basic_entities(self, text):
-        """Basic entity extraction fallback"""
-        entities = {
-            'PERSONS': [],
-            'ORGANIZATIONS': [],
-            'DATES': [],
-            'MONEY': [],
-            'LOCATIONS': []
-        }
-        
-        # Basic patterns
-        person_patterns = [r'\b[A-Z][a-z]+\s+[A-Z][a-z]+\b']
-        org_patterns = [r'\b[A-Z][a-z]*(?:\s+[A-Z][a-z]*)*\s+(?:Inc\.|LLC|Corp\.|Company|Corporation|Ltd\.)\b']
-        date_patterns = [r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b']
-        money_patterns = [r'\$[\d,]+(?:\.\d{2})?', r'€[\d,]+(?:\.\d{2})?', r'£[\d,]+(?:\.\d{2})?']
-        
-        for pattern in person_patterns:
-            matches = re.findall(pattern, text)
-            entities['PERSONS'].extend([m.strip() for m in matches if len(m.strip()) > 3])
-        
-        for pattern in org_patterns:
-            matches = re.findall(pattern, text)
-            entities['ORGANIZATIONS'].extend([m.strip() for m in matches])
-        
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text)
-            entities['DATES'].extend(matches)
-        
-        for pattern in money_patterns:
-            matches = re.findall(pattern, text)
-            entities['MONEY'].extend(matches)
-        
-        # Clean and deduplicate
-        for key in entities:
-            entities[key] = list(set([item for item in entities[key] if item.strip()]))
-        
-        return entities
+"""
 
 def gemini_setup_page():
     """Gemini AI configuration page"""
     st.markdown(f'<h2 class="section-header">🤖 {t("gemini_setup")}</h2>', unsafe_allow_html=True)
     
-    user_manager = UserManager()
+    user_manager = get_user_manager()
     current_key = user_manager.get_gemini_key(st.session_state.user_id)
     
     col1, col2 = st.columns([2, 1])
@@ -834,13 +346,13 @@ def gemini_setup_page():
         with col_btn1:
             if st.button(f"🔧 {t('configure_gemini')}", use_container_width=True):
                 if api_key_input.strip():
-                    gemini_integration = GeminiIntegration()
+                    gemini_integration = GeminiIntegration(on_warning=st.warning, on_error=st.error)
                     success, message = gemini_integration.configure_gemini(api_key_input.strip())
                     
                     if success:
                         user_manager.update_gemini_key(st.session_state.user_id, api_key_input.strip())
                         st.session_state.gemini_configured = True
-                        st.session_state.gemini_integration = gemini_integration
+                        st.session_state.gemini_integration = get_gemini_integration(api_key_input.strip())
                         st.success(message)
                         st.balloons()
                     else:
@@ -851,7 +363,7 @@ def gemini_setup_page():
         with col_btn2:
             if st.button("🧪 Test Configuration", use_container_width=True):
                 if api_key_input.strip():
-                    gemini_integration = GeminiIntegration()
+                    gemini_integration = GeminiIntegration(on_warning=st.warning, on_error=st.error)
                     success, message = gemini_integration.configure_gemini(api_key_input.strip())
                     
                     if success:
@@ -870,13 +382,21 @@ def gemini_setup_page():
             
             # Initialize Gemini if key exists
             if 'gemini_integration' not in st.session_state:
-                gemini_integration = GeminiIntegration(current_key)
+                gemini_integration = get_gemini_integration(current_key)
                 if gemini_integration.is_configured:
                     st.session_state.gemini_integration = gemini_integration
                     st.session_state.gemini_configured = True
         else:
             st.markdown('<div class="gemini-error">🔴 Gemini Not Configured</div>', unsafe_allow_html=True)
         
+        if 'gemini_integration' in st.session_state:
+            limiter_stats = st.session_state.gemini_integration.rate_limiter.get_stats()
+            st.markdown("### ⏱️ Rate Limiter")
+            st.write(f"**Requests sent:** {limiter_stats['requests']:,}")
+            st.write(f"**Requests paced:** {limiter_stats['throttled']:,}")
+            st.write(f"**Quota backoffs:** {limiter_stats['rate_limited']:,}")
+            st.write(f"**Available now:** {limiter_stats['available_requests']} requests / {limiter_stats['available_tokens']:,} tokens")
+        
         st.markdown("### 📊 API Usage Tips")
         st.info("""
         **Free Tier Limits:**
@@ -901,7 +421,7 @@ def login_page():
         
         tab1, tab2 = st.tabs([t("login"), t("register")])
         
-        user_manager = UserManager()
+        user_manager = get_user_manager()
         
         with tab1:
             st.markdown(f"### {t('login')}")
@@ -922,7 +442,7 @@ def login_page():
                         # Initialize Gemini if API key exists
                         gemini_key = user_data[5]
                         if gemini_key:
-                            gemini_integration = GeminiIntegration(gemini_key)
+                            gemini_integration = get_gemini_integration(gemini_key)
                             if gemini_integration.is_configured:
                                 st.session_state.gemini_integration = gemini_integration
                                 st.session_state.gemini_configured = True
@@ -957,14 +477,508 @@ def login_page():
         
         st.markdown('</div>', unsafe_allow_html=True)
 
+@st.cache_resource(show_spinner=False)
+def get_user_manager():
+    """One UserManager per server process, shared by every session"""
+    return UserManager()
+
+@st.cache_resource(show_spinner=False)
+def get_job_queue():
+    """One JobQueue per server process; jobs are run by job_worker.py processes"""
+    return JobQueue()
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_cache():
+    """One AnalysisCache per server process for sessions without Gemini"""
+    return AnalysisCache()
+
+@st.cache_resource(show_spinner=False)
+def get_translation_memory():
+    """One TranslationMemory per server process for sessions without Gemini"""
+    return TranslationMemory()
+
+def get_analyzer(gemini_integration):
+    """One LegalDocumentAnalyzer per Gemini API key (or none) per server process"""
+    engine_id = None
+    if gemini_integration and gemini_integration.is_configured:
+        # Configured clients are shared per key by get_gemini_integration, so the key identifies one
+        engine_id = hashlib.sha256((gemini_integration.api_key or gemini_integration.model_name).encode('utf-8')).hexdigest()
+    return _get_analyzer(gemini_integration if engine_id else None, engine_id)
+
+@st.cache_resource(show_spinner=False)
+def _get_analyzer(_gemini_integration, engine_id):
+    return LegalDocumentAnalyzer(_gemini_integration, on_error=st.error)
+
+@contextmanager
+def show_gemini_messages():
+    """Show the warnings and errors Gemini reports while the block runs, once it has finished
+    
+    Gemini calls run on worker threads, which cannot write to the page themselves.
+    """
+    with collect_messages() as messages:
+        yield
+    for level, message in dict.fromkeys(messages):
+        (st.error if level == 'error' else st.warning)(message)
+
+def memoized(kind, key, compute):
+    """Get a value computed from key, shared by all sessions in the process
+    
+    Values live in the result store under a handle derived from the key, so they share its
+    memory cap and LRU eviction; an evicted value is simply recomputed. A None from compute is
+    returned but not stored, so the next call computes again.
+    """
+    result_store = get_result_store()
+    handle = hashlib.sha256(repr((kind, key)).encode('utf-8')).hexdigest()
+    value = result_store.get(handle)
+    if value is None:
+        value = compute()
+        if value is not None:
+            result_store.put(value, handle)
+    return value
+
+def session_result(slot, key, compute):
+    """Get this session's result for key, computing and storing it when the key changes
+    
+    Session state holds only the key and a ResultStore handle; the result itself lives in the
+    process-wide store, which caps memory across all sessions and spills to disk.
+    """
+    result_store = get_result_store()
+    previous = st.session_state.get(slot)
+    if previous and previous[0] == key:
+        result = result_store.get(previous[1])
+        if result is not None:
+            return result
+    
+    result = compute()
+    if result is None:
+        return None
+    if previous:
+        result_store.discard(previous[1])
+    st.session_state[slot] = (key, result_store.put(result))
+    return result
+
+def aligned_text_html(rows):
+    """Render (source, translation) pairs as a two-column table; a None translation is shown as pending"""
+    cells = []
+    for source, translation in rows:
+        target = ('<td class="pending">Translating…</td>' if translation is None
+                  else f'<td>{html.escape(translation.strip())}</td>')
+        cells.append(f'<tr><td>{html.escape(source.strip())}</td>{target}</tr>')
+    return f'<table class="aligned-text">{"".join(cells)}</table>'
+
+def stream_translation(gemini_integration, text, target_lang, source_lang, visible_rows=20):
+    """Translate text, showing segments side by side with the source as they arrive
+    
+    The opening segments are streamed from Gemini and the rest are translated concurrently, so
+    the view starts filling within a second or two. Returns (translation, complete); complete is
+    False when some segments failed and were left in the original language.
+    """
+    segments = gemini_integration.chunker.split_segments(text)
+    translated = {}
+    complete = set()
+    
+    st.markdown(f"### 🌐 Translating to {LANGUAGES.get(target_lang, target_lang)}")
+    progress = st.progress(0.0)
+    view = st.empty()
+    last_render = 0.0
+    
+    def render():
+        # Show the end of the translated opening of the document, which grows as segments arrive
+        shown = 0
+        while shown < len(segments) and shown in translated:
+            shown += 1
+        start = max(0, shown - visible_rows)
+        rows = [(segments[index], translated[index]) for index in range(start, shown) if segments[index].strip()]
+        if shown < len(segments):
+            rows.append((segments[shown], None))
+        view.markdown(aligned_text_html(rows), unsafe_allow_html=True)
+        progress.progress(len(complete) / len(segments), text=f"{len(complete)} of {len(segments)} segments translated")
+    
+    for index, translation, is_complete in gemini_integration.iter_translation(segments, target_lang, source_lang):
+        translated[index] = translation
+        if is_complete:
+            complete.add(index)
+        # Redraw a few times a second rather than on every streamed token
+        if time.monotonic() - last_render > 0.25:
+            render()
+            last_render = time.monotonic()
+    
+    progress.empty()
+    view.empty()
+    # Segments that failed or only partly streamed stay in the original language
+    translation = ''.join(translated[index] if index in complete else segment for index, segment in enumerate(segments))
+    return translation, len(complete) == len(segments)
+
+def render_change_report(change_report):
+    """Render the clause-level changes from the previous version of a document"""
+    counts = change_report['counts']
+    previous_date = (change_report.get('previous_analysis_date') or '')[:16].replace('T', ' ')
+    st.markdown('<div class="section-header">🔀 Changes Since Previous Version</div>', unsafe_allow_html=True)
+    st.caption(f"Compared with **{change_report.get('previous_document_name')}** analyzed {previous_date}")
+    
+    change_col1, change_col2, change_col3, change_col4 = st.columns(4)
+    with change_col1:
+        st.metric("Modified Sections", counts['modified'])
+    with change_col2:
+        st.metric("Added Sections", counts['added'])
+    with change_col3:
+        st.metric("Removed Sections", counts['removed'])
+    with change_col4:
+        reanalyzed = change_report['reanalyzed_chars'] / max(change_report['total_chars'], 1)
+        st.metric("Text Re-analyzed", f"{reanalyzed:.0%}")
+    
+    if not change_report['changes']:
+        st.success("No changes from the previous version.")
+        return
+    
+    if change_report['changed_clause_types']:
+        changed_types = ', '.join(dict.fromkeys(clause_label(clause_type) for clause_type in change_report['changed_clause_types']))
+        st.warning(f"**Changed clause types:** {changed_types}")
+    
+    icons = {'modified': '✏️', 'added': '➕', 'removed': '➖'}
+    with st.expander(f"View {len(change_report['changes'])} changed sections"):
+        for index, change in enumerate(change_report['changes']):
+            clause_types = ', '.join(dict.fromkeys(clause_label(clause_type) for clause_type in change['clause_types']))
+            st.markdown(f"**{icons[change['change']]} {change['change'].title()}: {change['heading'] or '(untitled section)'}**"
+                        + (f" — _{clause_types}_" if clause_types else ''))
+            if change['change'] == 'modified':
+                old_col, new_col = st.columns(2)
+                with old_col:
+                    st.text_area("Previous", change['old_text'], height=150, key=f"change_old_{index}")
+                with new_col:
+                    st.text_area("Amended", change['new_text'], height=150, key=f"change_new_{index}")
+            else:
+                st.text(change['new_text'] if change['change'] == 'added' else change['old_text'])
+
+def render_analysis_results(file_name, file_extension, text, translated_text, original_lang, target_translate_lang,
+                            analysis_result, entities, ai_engine, show_full_text, highlight_entities, change_report=None):
+    """Render the analysis tabs and export options for one analyzed document"""
+    # Display document info
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.markdown(f'<div class="metric-container"><h3>{len(text.split())}</h3><p>{t("words")}</p></div>', unsafe_allow_html=True)
+    with col2:
+        st.markdown(f'<div class="metric-container"><h3>{len(text)}</h3><p>{t("characters")}</p></div>', unsafe_allow_html=True)
+    with col3:
+        st.markdown(f'<div class="metric-container"><h3>{len(text.split("."))}</h3><p>{t("sentences")}</p></div>', unsafe_allow_html=True)
+    with col4:
+        st.markdown(f'<div class="metric-container"><h3>{file_extension.upper()}</h3><p>{t("file_type")}</p></div>', unsafe_allow_html=True)
+    
+    if change_report:
+        render_change_report(change_report)
+    
+    # Create tabs for different sections
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        f"📋 {t('document_summary')}", 
+        f"👥 {t('parties_entities')}", 
+        f"📜 {t('key_clauses')}", 
+        f"⚠️ {t('risks_obligations')}", 
+        f"📅 {t('important_dates')}", 
+        f"📄 {t('document_text')}"
+    ])
+    
+    with tab1:
+        st.markdown(f'<div class="section-header">{t("document_summary")}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="insight-box">{analysis_result.get("summary", "No summary available")}</div>', unsafe_allow_html=True)
+        
+        # Quick insights
+        st.markdown('<div class="section-header">Quick Insights</div>', unsafe_allow_html=True)
+        insight_col1, insight_col2, insight_col3 = st.columns(3)
+        
+        with insight_col1:
+            st.metric("Document Type", analysis_result.get('document_type', 'Unknown'))
+            st.metric("Entities Found", sum(len(v) for v in entities.values()))
+        
+        with insight_col2:
+            st.metric("Key Parties", len(analysis_result.get('parties', [])))
+            st.metric("Important Dates", len(analysis_result.get('dates', [])))
+        
+        with insight_col3:
+            st.metric("Risk Indicators", len(analysis_result.get('risks', [])))
+            st.metric("Obligations Found", len(analysis_result.get('obligations', [])))
+        
+        # Language and AI info
+        st.markdown("### 🤖 Analysis Information")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.info(f"**Original:** {LANGUAGES.get(original_lang, 'Unknown')}")
+        with col2:
+            st.info(f"**Target:** {LANGUAGES.get(target_translate_lang, 'English')}")
+        with col3:
+            st.info(f"**AI Engine:** {ai_engine}")
+        with col4:
+            st.info(f"**Jurisdiction:** {analysis_result.get('jurisdiction', 'Not specified')}")
+    
+    with tab2:
+        st.markdown(f'<div class="section-header">{t("parties_entities")}</div>', unsafe_allow_html=True)
+        
+        # Display parties from Gemini analysis
+        if analysis_result.get('parties'):
+            st.markdown("**Key Parties (Gemini Analysis):**")
+            for i, party in enumerate(analysis_result['parties'][:10], 1):
+                st.markdown(f"{i}. {party}")
+            st.markdown("---")
+        
+        # Display detailed entities
+        for entity_type, entity_list in entities.items():
+            if entity_list:
+                st.markdown(f"**{entity_type.replace('_', ' ').title()}:**")
+                for entity in entity_list[:15]:
+                    st.markdown(f"• {entity}")
+                st.markdown("---")
+    
+    with tab3:
+        st.markdown(f'<div class="section-header">{t("key_clauses")}</div>', unsafe_allow_html=True)
+        
+        clauses = analysis_result.get('clauses', {})
+        for clause_type, clause_list in clauses.items():
+            if clause_list:
+                st.markdown(f"**{clause_label(clause_type)} Clauses:**")
+                for i, clause in enumerate(clause_list[:5], 1):
+                    st.markdown(f'<div class="clause-highlight">{i}. {clause}</div>', unsafe_allow_html=True)
+                st.markdown("---")
+    
+    with tab4:
+        st.markdown(f'<div class="section-header">{t("risks_obligations")}</div>', unsafe_allow_html=True)
+        
+        risk_col1, risk_col2 = st.columns(2)
+        
+        with risk_col1:
+            st.markdown("**⚠️ Potential Risks:**")
+            risks = analysis_result.get('risks', [])
+            if risks:
+                for i, risk in enumerate(risks[:10], 1):
+                    st.markdown(f"{i}. {risk}")
+            else:
+                st.info("No specific risks identified.")
+        
+        with risk_col2:
+            st.markdown("**📋 Key Obligations:**")
+            obligations = analysis_result.get('obligations', [])
+            if obligations:
+                for i, obligation in enumerate(obligations[:10], 1):
+                    st.markdown(f"{i}. {obligation}")
+            else:
+                st.info("No specific obligations identified.")
+    
+    with tab5:
+        st.markdown(f'<div class="section-header">{t("important_dates")}</div>', unsafe_allow_html=True)
+        
+        dates = analysis_result.get('dates', []) or entities.get('DATES', [])
+        
+        if dates:
+            dates_df = pd.DataFrame({'Dates Found': dates})
+            st.dataframe(dates_df, use_container_width=True)
+            
+            # Date analysis
+            st.markdown("### 📊 Date Analysis")
+            current_date = datetime.now()
+            future_dates = []
+            past_dates = []
+            
+            for date_str in dates:
+                try:
+                    # Simple date parsing (can be enhanced)
+                    if '/' in date_str:
+                        parsed_date = datetime.strptime(date_str, '%m/%d/%Y')
+                    elif '-' in date_str:
+                        parsed_date = datetime.strptime(date_str, '%m-%d-%Y')
+                    else:
+                        continue
+                    
+                    if parsed_date > current_date:
+                        future_dates.append((date_str, parsed_date))
+                    else:
+                        past_dates.append((date_str, parsed_date))
+                except:
+                    continue
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("📅 Future Dates", len(future_dates))
+                if future_dates:
+                    st.write("**Upcoming Deadlines:**")
+                    for date_str, date_obj in sorted(future_dates, key=lambda x: x[1])[:5]:
+                        days_until = (date_obj - current_date).days
+                        st.write(f"• {date_str} ({days_until} days)")
+            
+            with col2:
+                st.metric("📆 Past Dates", len(past_dates))
+                if past_dates:
+                    st.write("**Historical Dates:**")
+                    for date_str, date_obj in sorted(past_dates, key=lambda x: x[1], reverse=True)[:5]:
+                        days_ago = (current_date - date_obj).days
+                        st.write(f"• {date_str} ({days_ago} days ago)")
+        else:
+            st.info("No specific dates were identified in the document.")
+    
+    with tab6:
+        st.markdown(f'<div class="section-header">{t("document_text")}</div>', unsafe_allow_html=True)
+        
+        # Language options for text display
+        text_col1, text_col2 = st.columns(2)
+        with text_col1:
+            display_original = st.checkbox("Show Original Text", value=True)
+        with text_col2:
+            display_translated = st.checkbox("Show Translated Text", 
+                                           value=False,
+                                           disabled=translated_text == text)
+        
+        if show_full_text:
+            if display_original:
+                st.markdown("### 📄 Original Text")
+                if highlight_entities:
+                    # Highlight all entities in a single pass, one page at a time
+                    highlighter = EntityHighlighter(
+                        entity for entity_list in entities.values() for entity in entity_list
+                    )
+                    pages = paginate_text(text)
+                    page_number = 1
+                    if len(pages) > 1:
+                        page_number = st.number_input(
+                            f"Page (of {len(pages)})", min_value=1, max_value=len(pages), value=1
+                        )
+                    page_start, page_end = pages[page_number - 1]
+                    st.markdown(highlighter.to_html(text, page_start, page_end), unsafe_allow_html=True)
+                else:
+                    st.text_area("Original Document Text", text, height=400)
+            
+            if display_translated and translated_text != text:
+                st.markdown(f"### 🌐 Text in {LANGUAGES[target_translate_lang]}")
+                # Translations keep the source's paragraph breaks, so paragraphs line up one to one
+                source_paragraphs = DocumentChunker.PARAGRAPH_BOUNDARY.split(text)
+                translated_paragraphs = DocumentChunker.PARAGRAPH_BOUNDARY.split(translated_text)
+                aligned = len(source_paragraphs) == len(translated_paragraphs)
+                if aligned and st.checkbox("Show Side by Side with Original", value=True):
+                    rows = [row for row in zip(source_paragraphs, translated_paragraphs) if row[0].strip()]
+                    rows_per_page = 50
+                    page_count = (len(rows) + rows_per_page - 1) // rows_per_page
+                    aligned_page = 1
+                    if page_count > 1:
+                        aligned_page = st.number_input(
+                            f"Paragraph page (of {page_count})", min_value=1, max_value=page_count, value=1
+                        )
+                    page_rows = rows[(aligned_page - 1) * rows_per_page:aligned_page * rows_per_page]
+                    st.markdown(aligned_text_html(page_rows), unsafe_allow_html=True)
+                else:
+                    st.text_area("Translated Document Text", translated_text, height=400)
+        
+        else:
+            st.info("Enable 'Show Full Document Text' in the sidebar to view the complete document.")
+    
+    # Export functionality
+    st.markdown(f'<div class="section-header">📤 {t("export_options")}</div>', unsafe_allow_html=True)
+    
+    export_data = {
+        'document_info': {
+            'name': file_name,
+            'original_language': original_lang,
+            'target_language': target_translate_lang,
+            'word_count': len(text.split()),
+            'character_count': len(text),
+            'analysis_date': datetime.now().isoformat(),
+            'ai_engine': ai_engine
+        },
+        'analysis_result': analysis_result,
+        'entities': entities,
+        'change_report': change_report,
+        'user_info': {
+            'username': st.session_state.username,
+            'organization': st.session_state.get('user_organization', '')
+        }
+    }
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        if st.button(f"📄 {t('download_report')}"):
+            report = f"""
+LEGAL DOCUMENT ANALYSIS REPORT (Enhanced with {ai_engine})
+Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Analyzed by: {st.session_state.username}
+Organization: {st.session_state.get('user_organization', 'N/A')}
+Document: {file_name}
+Original Language: {LANGUAGES.get(original_lang, 'Unknown')}
+Target Language: {LANGUAGES.get(target_translate_lang, 'English')}
+AI Engine: {ai_engine}
+
+DOCUMENT SUMMARY:
+{analysis_result.get('summary', 'No summary available')}
+
+DOCUMENT TYPE: {analysis_result.get('document_type', 'Unknown')}
+JURISDICTION: {analysis_result.get('jurisdiction', 'Not specified')}
+
+KEY PARTIES:
+{chr(10).join([f"• {party}" for party in analysis_result.get('parties', [])])}
+
+ENTITIES FOUND:
+{chr(10).join([f"{k}: {', '.join(v[:10])}" for k, v in entities.items() if v])}
+
+IMPORTANT DATES:
+{chr(10).join([f"• {date}" for date in analysis_result.get('dates', [])])}
+
+FINANCIAL TERMS:
+{chr(10).join([f"• {term}" for term in analysis_result.get('financial_terms', [])])}
+
+KEY CLAUSES:
+{chr(10).join([f"{k.replace('_', ' ').title()}: {len(v)} found" for k, v in analysis_result.get('clauses', {}).items() if v])}
+
+RISK ANALYSIS:
+{chr(10).join([f"• {risk}" for risk in analysis_result.get('risks', [])])}
+
+KEY OBLIGATIONS:
+{chr(10).join([f"• {obligation}" for obligation in analysis_result.get('obligations', [])])}
+            """
+            st.download_button(
+                label=f"📄 {t('download_report')}",
+                data=report,
+                file_name=f"gemini_legal_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                mime="text/plain"
+            )
+    
+    with col2:
+        if st.button("📊 Download JSON Data"):
+            json_data = json.dumps(export_data, indent=2, default=str, ensure_ascii=False)
+            st.download_button(
+                label="📊 Download JSON",
+                data=json_data,
+                file_name=f"gemini_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json"
+            )
+    
+    with col3:
+        if st.button("📈 Download CSV Summary"):
+            csv_data = []
+            csv_data.append(['Category', 'Count', 'Details'])
+            csv_data.append(['Document', 1, file_name])
+            csv_data.append(['Words', len(text.split()), ''])
+            csv_data.append(['Characters', len(text), ''])
+            csv_data.append(['Original Language', 1, LANGUAGES.get(original_lang, 'Unknown')])
+            csv_data.append(['AI Engine', 1, ai_engine])
+            csv_data.append(['Document Type', 1, analysis_result.get('document_type', 'Unknown')])
+            csv_data.append(['Key Parties', len(analysis_result.get('parties', [])), ''])
+            csv_data.append(['Total Entities', sum(len(v) for v in entities.values()), ''])
+            csv_data.append(['Risk Indicators', len(analysis_result.get('risks', [])), ''])
+            csv_data.append(['Obligations', len(analysis_result.get('obligations', [])), ''])
+            
+            df = pd.DataFrame(csv_data[1:], columns=csv_data[0])
+            csv_string = df.to_csv(index=False)
+            
+            st.download_button(
+                label="📈 Download CSV",
+                data=csv_string,
+                file_name=f"gemini_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv"
+            )
+
 def main_app():
     """Main application interface"""
     # Initialize components
-    user_manager = UserManager()
+    user_manager = get_user_manager()
     
     # Get Gemini integration from session state
     gemini_integration = st.session_state.get('gemini_integration', None)
-    analyzer = LegalDocumentAnalyzer(gemini_integration)
+    analyzer = get_analyzer(gemini_integration)
     
     # Header with user info and language selection
     col1, col2, col3 = st.columns([2, 1, 1])
@@ -997,7 +1011,8 @@ def main_app():
         
         if st.button(t("logout")):
             for key in ['logged_in', 'username', 'user_id', 'user_email', 'user_full_name', 
-                       'user_organization', 'gemini_integration', 'gemini_configured']:
+                       'user_organization', 'gemini_integration', 'gemini_configured', 'history_cursors',
+                       'reopened_analysis_id', 'reopened_result', 'analysis_result', 'queued_job']:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
@@ -1041,6 +1056,13 @@ def main_app():
             use_gemini_translation = st.checkbox("Use Gemini Translation", 
                                                 value=st.session_state.get('gemini_configured', False),
                                                 disabled=not st.session_state.get('gemini_configured', False))
+            compare_versions = st.checkbox("Compare with Previous Version", value=False,
+                                           help="Diff an upload against the last saved version of the same document "
+                                                "(e.g. Agreement_v6.docx for Agreement_v7.docx) and re-analyze only "
+                                                "the changed sections")
+            use_job_queue = st.checkbox("Analyze in Background Queue", value=False,
+                                        help="Hand large documents to the job_worker.py workers instead of "
+                                             "analyzing them in this session; results appear in your history")
             
             st.markdown(f"### 🌐 {t('language_selection')}")
             detected_lang_placeholder = st.empty()
@@ -1064,371 +1086,203 @@ def main_app():
                 st.write(f"**Gemini Status:** {'✅ Configured' if st.session_state.get('gemini_configured') else '❌ Not Configured'}")
         
         # Main content area
-        if uploaded_file is not None or (input_method == "Text Input" and text_input.strip()):
-            # Extract text based on input method
+        has_input = uploaded_file is not None or (input_method == "Text Input" and text_input.strip())
+        result = None
+        
+        if st.session_state.get('reopened_analysis_id'):
+            # A past analysis opened from the Dashboard, loaded from storage once per session
+            reopened_id = st.session_state.reopened_analysis_id
+            result = session_result(
+                'reopened_result', reopened_id,
+                lambda: user_manager.load_analysis(st.session_state.user_id, reopened_id)
+            )
+            if result:
+                analysis_date = result['analysis_date'][:16].replace('T', ' ')
+                st.info(f"📂 Showing the saved analysis of **{result['document_name']}** from {analysis_date}")
+                if st.button("✖ Close Saved Analysis"):
+                    del st.session_state['reopened_analysis_id']
+                    st.rerun()
+            else:
+                st.warning("This saved analysis is no longer available.")
+                del st.session_state['reopened_analysis_id']
+        
+        elif has_input:
             if input_method == "Text Input":
-                text = text_input.strip()
-                file_name = f"Text_Input_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                file_extension = "txt"
+                document_key = hashlib.sha256(text_input.strip().encode('utf-8')).hexdigest()
             else:
-                file_extension = uploaded_file.name.split('.')[-1].lower()
-                file_name = uploaded_file.name
-                
-                with st.spinner(t("processing")):
-                    if file_extension == 'pdf':
-                        text = analyzer.extract_text_from_pdf(uploaded_file)
-                    elif file_extension == 'docx':
-                        text = analyzer.extract_text_from_docx(uploaded_file)
-                    elif file_extension == 'txt':
-                        text = analyzer.extract_text_from_txt(uploaded_file)
-                    else:
-                        st.error("Unsupported file format")
-                        return
-            
-            if not text.strip():
-                st.error("Could not extract text from the document. Please check if the file is valid.")
-                return
-            
-            # Detect language
+                document_key = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+            # Gemini and basic results differ, and Gemini results are per API key
+            engine_id = 'basic'
             if gemini_integration and gemini_integration.is_configured:
-                original_lang = gemini_integration.detect_language(text)
-            else:
-                try:
-                    original_lang = detect(text[:1000])
-                except:
-                    original_lang = 'en'
-            
-            detected_lang_placeholder.info(f"🌐 Detected language: {LANGUAGES.get(original_lang, 'Unknown')} ({original_lang})")
-            
-            # Display document info
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.markdown(f'<div class="metric-container"><h3>{len(text.split())}</h3><p>{t("words")}</p></div>', unsafe_allow_html=True)
-            with col2:
-                st.markdown(f'<div class="metric-container"><h3>{len(text)}</h3><p>{t("characters")}</p></div>', unsafe_allow_html=True)
-            with col3:
-                st.markdown(f'<div class="metric-container"><h3>{len(text.split("."))}</h3><p>{t("sentences")}</p></div>', unsafe_allow_html=True)
-            with col4:
-                st.markdown(f'<div class="metric-container"><h3>{file_extension.upper()}</h3><p>{t("file_type")}</p></div>', unsafe_allow_html=True)
-            
-            # Perform analysis
-            with st.spinner(t("analyzing")):
-                analysis_result = analyzer.analyze_document(text, target_translate_lang)
-                
-                # Get entities using Gemini if available
-                if gemini_integration and gemini_integration.is_configured:
-                    entities = gemini_integration.extract_entities_advanced(text, target_translate_lang)
+                engine_id = 'gemini:' + hashlib.sha256(gemini_integration.api_key.encode('utf-8')).hexdigest()[:16]
+            
+            def analyze_input():
+                """Extract and analyze the current upload or pasted text, and save it to history"""
+                # Extract text based on input method
+                if input_method == "Text Input":
+                    text = text_input.strip()
+                    file_name = f"Text_Input_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                 else:
-                    entities = analyzer._extract_basic_entities(text)
-                
-                # Translate text if needed and Gemini is available
-                translated_text = text
-                if use_gemini_translation and gemini_integration and gemini_integration.is_configured and target_translate_lang != original_lang:
-                    with st.spinner(f"Translating to {LANGUAGES[target_translate_lang]}..."):
-                        translated_text = gemini_integration.translate_text(text, target_translate_lang, original_lang)
-            
-            # Save analysis to history
-            user_manager.save_analysis(
-                st.session_state.user_id,
-                file_name,
-                analysis_result.get('document_type', 'Legal Document'),
-                len(text.split()),
-                original_lang,
-                target_translate_lang,
-                analysis_result.get('summary', 'Analysis completed')
-            )
-            
-            # Create tabs for different sections
-            tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-                f"📋 {t('document_summary')}", 
-                f"👥 {t('parties_entities')}", 
-                f"📜 {t('key_clauses')}", 
-                f"⚠️ {t('risks_obligations')}", 
-                f"📅 {t('important_dates')}", 
-                f"📄 {t('document_text')}"
-            ])
-            
-            with tab1:
-                st.markdown(f'<div class="section-header">{t("document_summary")}</div>', unsafe_allow_html=True)
-                st.markdown(f'<div class="insight-box">{analysis_result.get("summary", "No summary available")}</div>', unsafe_allow_html=True)
-                
-                # Quick insights
-                st.markdown('<div class="section-header">Quick Insights</div>', unsafe_allow_html=True)
-                insight_col1, insight_col2, insight_col3 = st.columns(3)
-                
-                with insight_col1:
-                    st.metric("Document Type", analysis_result.get('document_type', 'Unknown'))
-                    st.metric("Entities Found", sum(len(v) for v in entities.values()))
-                
-                with insight_col2:
-                    st.metric("Key Parties", len(analysis_result.get('parties', [])))
-                    st.metric("Important Dates", len(analysis_result.get('dates', [])))
-                
-                with insight_col3:
-                    st.metric("Risk Indicators", len(analysis_result.get('risks', [])))
-                    st.metric("Obligations Found", len(analysis_result.get('obligations', [])))
-                
-                # Language and AI info
-                st.markdown("### 🤖 Analysis Information")
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.info(f"**Original:** {LANGUAGES.get(original_lang, 'Unknown')}")
-                with col2:
-                    st.info(f"**Target:** {LANGUAGES.get(target_translate_lang, 'English')}")
-                with col3:
-                    ai_status = "Gemini AI" if st.session_state.get('gemini_configured') else "Basic Analysis"
-                    st.info(f"**AI Engine:** {ai_status}")
-                with col4:
-                    st.info(f"**Jurisdiction:** {analysis_result.get('jurisdiction', 'Not specified')}")
-            
-            with tab2:
-                st.markdown(f'<div class="section-header">{t("parties_entities")}</div>', unsafe_allow_html=True)
-                
-                # Display parties from Gemini analysis
-                if analysis_result.get('parties'):
-                    st.markdown("**Key Parties (Gemini Analysis):**")
-                    for i, party in enumerate(analysis_result['parties'][:10], 1):
-                        st.markdown(f"{i}. {party}")
-                    st.markdown("---")
+                    file_extension = uploaded_file.name.split('.')[-1].lower()
+                    file_name = uploaded_file.name
+                    
+                    extractors = {
+                        'pdf': analyzer.extract_text_from_pdf,
+                        'docx': analyzer.extract_text_from_docx,
+                        'txt': analyzer.extract_text_from_txt
+                    }
+                    if file_extension not in extractors:
+                        st.error("Unsupported file format")
+                        return None
+                    
+                    with st.spinner(t("processing")):
+                        text = memoized('text', (document_key, file_extension),
+                                        lambda: extractors[file_extension](uploaded_file))
                 
-                # Display detailed entities
-                for entity_type, entity_list in entities.items():
-                    if entity_list:
-                        st.markdown(f"**{entity_type.replace('_', ' ').title()}:**")
-                        for entity in entity_list[:15]:
-                            st.markdown(f"• {entity}")
-                        st.markdown("---")
-            
-            with tab3:
-                st.markdown(f'<div class="section-header">{t("key_clauses")}</div>', unsafe_allow_html=True)
+                if not text.strip():
+                    st.error("Could not extract text from the document. Please check if the file is valid.")
+                    return None
                 
-                clauses = analysis_result.get('clauses', {})
-                for clause_type, clause_list in clauses.items():
-                    if clause_list:
-                        st.markdown(f"**{clause_type.replace('_', ' ').title()} Clauses:**")
-                        for i, clause in enumerate(clause_list[:5], 1):
-                            st.markdown(f'<div class="clause-highlight">{i}. {clause}</div>', unsafe_allow_html=True)
-                        st.markdown("---")
-            
-            with tab4:
-                st.markdown(f'<div class="section-header">{t("risks_obligations")}</div>', unsafe_allow_html=True)
+                # Detect language, analyze and extract entities in a single pass; results are shared
+                # across sessions, so the same document with the same options is only analyzed once
+                analysis_key = (document_key, target_translate_lang, engine_id)
+                memo_kind, memo_key = 'analysis', analysis_key
                 
-                risk_col1, risk_col2 = st.columns(2)
+                # In versioning mode an upload is diffed against its last saved version and only the
+                # changed sections are re-analyzed
+                previous = None
+                if compare_versions and input_method != "Text Input":
+                    previous = user_manager.find_previous_version(st.session_state.user_id, file_name)
+                    memo_kind, memo_key = 'revision', analysis_key + (previous and previous['analysis_id'],)
                 
-                with risk_col1:
-                    st.markdown("**⚠️ Potential Risks:**")
-                    risks = analysis_result.get('risks', [])
-                    if risks:
-                        for i, risk in enumerate(risks[:10], 1):
-                            st.markdown(f"{i}. {risk}")
-                    else:
-                        st.info("No specific risks identified.")
+                def analyze():
+                    if memo_kind == 'revision':
+                        return list(analyzer.analyze_revision(text, previous, target_translate_lang))
+                    return list(analyzer.analyze_document_full(text, target_translate_lang)) + [None, None]
                 
-                with risk_col2:
-                    st.markdown("**📋 Key Obligations:**")
-                    obligations = analysis_result.get('obligations', [])
-                    if obligations:
-                        for i, obligation in enumerate(obligations[:10], 1):
-                            st.markdown(f"{i}. {obligation}")
+                with show_gemini_messages(), st.spinner(t("analyzing")):
+                    translated_text = text
+                    if gemini_integration and gemini_integration.is_configured:
+                        # Translation does not depend on the analysis, so run both at once
+                        quick_lang = detect_language_local(text)
+                        
+                        analysis_future = gemini_integration.submit(memoized, memo_kind, memo_key, analyze)
+                        if use_gemini_translation and quick_lang != target_translate_lang:
+                            streamed = {}
+                            
+                            def translate():
+                                # Streamed here, on the script thread, so the page can show it filling in
+                                streamed['text'], complete = stream_translation(
+                                    gemini_integration, text, target_translate_lang, quick_lang
+                                )
+                                # Like translate_text, keep a partial translation out of the memo so a
+                                # rerun retries the segments that failed
+                                return streamed['text'] if complete else None
+                            
+                            translated_text = memoized('translation', analysis_key, translate)
+                            if translated_text is None:
+                                translated_text = streamed['text']
+                        
+                        original_lang, analysis_result, entities, units, change_report = analysis_future.result()
+                        if original_lang == target_translate_lang:
+                            translated_text = text
                     else:
-                        st.info("No specific obligations identified.")
-            
-            with tab5:
-                st.markdown(f'<div class="section-header">{t("important_dates")}</div>', unsafe_allow_html=True)
-                
-                dates = analysis_result.get('dates', []) or entities.get('DATES', [])
+                        original_lang, analysis_result, entities, units, change_report = memoized(memo_kind, memo_key, analyze)
                 
-                if dates:
-                    dates_df = pd.DataFrame({'Dates Found': dates})
-                    st.dataframe(dates_df, use_container_width=True)
-                    
-                    # Date analysis
-                    st.markdown("### 📊 Date Analysis")
-                    current_date = datetime.now()
-                    future_dates = []
-                    past_dates = []
-                    
-                    for date_str in dates:
-                        try:
-                            # Simple date parsing (can be enhanced)
-                            if '/' in date_str:
-                                parsed_date = datetime.strptime(date_str, '%m/%d/%Y')
-                            elif '-' in date_str:
-                                parsed_date = datetime.strptime(date_str, '%m-%d-%Y')
-                            else:
-                                continue
-                            
-                            if parsed_date > current_date:
-                                future_dates.append((date_str, parsed_date))
-                            else:
-                                past_dates.append((date_str, parsed_date))
-                        except:
-                            continue
-                    
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.metric("📅 Future Dates", len(future_dates))
-                        if future_dates:
-                            st.write("**Upcoming Deadlines:**")
-                            for date_str, date_obj in sorted(future_dates, key=lambda x: x[1])[:5]:
-                                days_until = (date_obj - current_date).days
-                                st.write(f"• {date_str} ({days_until} days)")
-                    
-                    with col2:
-                        st.metric("📆 Past Dates", len(past_dates))
-                        if past_dates:
-                            st.write("**Historical Dates:**")
-                            for date_str, date_obj in sorted(past_dates, key=lambda x: x[1], reverse=True)[:5]:
-                                days_ago = (current_date - date_obj).days
-                                st.write(f"• {date_str} ({days_ago} days ago)")
-                else:
-                    st.info("No specific dates were identified in the document.")
-            
-            with tab6:
-                st.markdown(f'<div class="section-header">{t("document_text")}</div>', unsafe_allow_html=True)
+                ai_engine = 'Gemini AI' if st.session_state.get('gemini_configured') else 'Basic Analysis'
                 
-                # Language options for text display
-                text_col1, text_col2 = st.columns(2)
-                with text_col1:
-                    display_original = st.checkbox("Show Original Text", value=True)
-                with text_col2:
-                    display_translated = st.checkbox("Show Translated Text", 
-                                                   value=False,
-                                                   disabled=not (use_gemini_translation and original_lang != target_translate_lang))
+                # Save analysis to history, with the full result so it can be reopened from the Dashboard
+                user_manager.save_analysis(
+                    st.session_state.user_id,
+                    file_name,
+                    analysis_result.get('document_type', 'Legal Document'),
+                    len(text.split()),
+                    original_lang,
+                    target_translate_lang,
+                    analysis_result.get('summary', 'Analysis completed'),
+                    analysis_result=analysis_result,
+                    entities=entities,
+                    text=text,
+                    translated_text=translated_text,
+                    entity_offsets=analyzer.extract_entities_with_offsets(text),
+                    ai_engine=ai_engine,
+                    units=units,
+                    change_report=change_report
+                )
                 
-                if show_full_text:
-                    if display_original:
-                        st.markdown("### 📄 Original Text")
-                        if highlight_entities:
-                            # Highlight entities in text
-                            highlighted_text = text
-                            for entity_type, entity_list in entities.items():
-                                for entity in entity_list:
-                                    if entity and len(entity) > 2:
-                                        pattern = re.escape(entity)
-                                        highlighted_text = re.sub(
-                                            f'({pattern})', 
-                                            r'<mark class="entity-highlight">\1</mark>', 
-                                            highlighted_text, 
-                                            flags=re.IGNORECASE
-                                        )
-                            st.markdown(highlighted_text, unsafe_allow_html=True)
-                        else:
-                            st.text_area("Original Document Text", text, height=400)
-                    
-                    if display_translated and translated_text != text:
-                        st.markdown(f"### 🌐 Text in {LANGUAGES[target_translate_lang]}")
-                        st.text_area("Translated Document Text", translated_text, height=400)
-                        
-                else:
-                    st.info("Enable 'Show Full Document Text' in the sidebar to view the complete document.")
-            
-            # Export functionality
-            st.markdown(f'<div class="section-header">📤 {t("export_options")}</div>', unsafe_allow_html=True)
-            
-            export_data = {
-                'document_info': {
-                    'name': file_name,
+                return {
+                    'document_name': file_name,
+                    'text': text,
+                    'translated_text': translated_text,
                     'original_language': original_lang,
                     'target_language': target_translate_lang,
-                    'word_count': len(text.split()),
-                    'character_count': len(text),
-                    'analysis_date': datetime.now().isoformat(),
-                    'ai_engine': 'Gemini AI' if st.session_state.get('gemini_configured') else 'Basic Analysis'
-                },
-                'analysis_result': analysis_result,
-                'entities': entities,
-                'user_info': {
-                    'username': st.session_state.username,
-                    'organization': st.session_state.get('user_organization', '')
+                    'analysis_result': analysis_result,
+                    'entities': entities,
+                    'ai_engine': ai_engine,
+                    'change_report': change_report
                 }
-            }
-            
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                if st.button(f"📄 {t('download_report')}"):
-                    ai_engine = 'Gemini AI' if st.session_state.get('gemini_configured') else 'Basic Analysis'
-                    report = f"""
-LEGAL DOCUMENT ANALYSIS REPORT (Enhanced with {ai_engine})
-Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-Analyzed by: {st.session_state.username}
-Organization: {st.session_state.get('user_organization', 'N/A')}
-Document: {file_name}
-Original Language: {LANGUAGES.get(original_lang, 'Unknown')}
-Target Language: {LANGUAGES.get(target_translate_lang, 'English')}
-AI Engine: {ai_engine}
-
-DOCUMENT SUMMARY:
-{analysis_result.get('summary', 'No summary available')}
-
-DOCUMENT TYPE: {analysis_result.get('document_type', 'Unknown')}
-JURISDICTION: {analysis_result.get('jurisdiction', 'Not specified')}
-
-KEY PARTIES:
-{chr(10).join([f"• {party}" for party in analysis_result.get('parties', [])])}
-
-ENTITIES FOUND:
-{chr(10).join([f"{k}: {', '.join(v[:10])}" for k, v in entities.items() if v])}
-
-IMPORTANT DATES:
-{chr(10).join([f"• {date}" for date in analysis_result.get('dates', [])])}
-
-FINANCIAL TERMS:
-{chr(10).join([f"• {term}" for term in analysis_result.get('financial_terms', [])])}
-
-KEY CLAUSES:
-{chr(10).join([f"{k.replace('_', ' ').title()}: {len(v)} found" for k, v in analysis_result.get('clauses', {}).items() if v])}
-
-RISK ANALYSIS:
-{chr(10).join([f"• {risk}" for risk in analysis_result.get('risks', [])])}
-
-KEY OBLIGATIONS:
-{chr(10).join([f"• {obligation}" for obligation in analysis_result.get('obligations', [])])}
-                    """
-                    st.download_button(
-                        label=f"📄 {t('download_report')}",
-                        data=report,
-                        file_name=f"gemini_legal_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                        mime="text/plain"
-                    )
-            
-            with col2:
-                if st.button("📊 Download JSON Data"):
-                    json_data = json.dumps(export_data, indent=2, default=str, ensure_ascii=False)
-                    st.download_button(
-                        label="📊 Download JSON",
-                        data=json_data,
-                        file_name=f"gemini_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
             
-            with col3:
-                if st.button("📈 Download CSV Summary"):
-                    csv_data = []
-                    csv_data.append(['Category', 'Count', 'Details'])
-                    csv_data.append(['Document', 1, file_name])
-                    csv_data.append(['Words', len(text.split()), ''])
-                    csv_data.append(['Characters', len(text), ''])
-                    csv_data.append(['Original Language', 1, LANGUAGES.get(original_lang, 'Unknown')])
-                    csv_data.append(['AI Engine', 1, 'Gemini AI' if st.session_state.get('gemini_configured') else 'Basic'])
-                    csv_data.append(['Document Type', 1, analysis_result.get('document_type', 'Unknown')])
-                    csv_data.append(['Key Parties', len(analysis_result.get('parties', [])), ''])
-                    csv_data.append(['Total Entities', sum(len(v) for v in entities.values()), ''])
-                    csv_data.append(['Risk Indicators', len(analysis_result.get('risks', [])), ''])
-                    csv_data.append(['Obligations', len(analysis_result.get('obligations', [])), ''])
-                    
-                    df = pd.DataFrame(csv_data[1:], columns=csv_data[0])
-                    csv_string = df.to_csv(index=False)
+            if use_job_queue:
+                # Hand the document to the queue workers; the finished result is opened from history
+                job_queue = get_job_queue()
+                job_key = (document_key, target_translate_lang)
+                queued = st.session_state.get('queued_job')
+                if not queued or queued[0] != job_key:
+                    if input_method == "Text Input":
+                        document_name = f"Text_Input_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                        path = spool_path('text.txt')
+                        content = text_input.strip().encode('utf-8')
+                    else:
+                        document_name = uploaded_file.name
+                        path = spool_path(document_name)
+                        content = uploaded_file.getvalue()
+                    with open(path, 'wb') as file:
+                        file.write(content)
                     
-                    st.download_button(
-                        label="📈 Download CSV",
-                        data=csv_string,
-                        file_name=f"gemini_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        mime="text/csv"
-                    )
+                    try:
+                        job_id = enqueue_analysis(job_queue, path, document_name, target_translate_lang,
+                                                  user_id=st.session_state.user_id)
+                        st.session_state.queued_job = queued = (job_key, job_id)
+                    except QueueFullError:
+                        os.remove(path)
+                        queued = None
+                        st.warning("The analysis queue is full right now. Please try again in a few minutes.")
+                
+                if queued:
+                    job = job_queue.get(queued[1])
+                    if job and job['status'] == 'done':
+                        st.session_state.reopened_analysis_id = job['result']['analysis_id']
+                        del st.session_state['queued_job']
+                        st.rerun()
+                    elif job and job['status'] == 'dead':
+                        st.error(f"Background analysis failed after {job['attempts']} attempts: {job['error']}")
+                    else:
+                        depth = job_queue.get_depth()
+                        status = job['status'] if job else 'queued'
+                        st.info(f"⏳ Document {status} for background analysis "
+                                f"({depth['queued']} waiting, {depth['running']} running)")
+                        st.button("🔄 Refresh Status")
+            else:
+                # Widget changes rerun the script; the same input and options reuse this session's result
+                result = session_result(
+                    'analysis_result',
+                    (document_key, target_translate_lang, use_gemini_translation, engine_id, compare_versions),
+                    analyze_input
+                )
         
-        else:
+        if result:
+            original_lang = result['original_language']
+            detected_lang_placeholder.info(f"🌐 Detected language: {LANGUAGES.get(original_lang, 'Unknown')} ({original_lang})")
+            file_name = result['document_name']
+            file_extension = file_name.split('.')[-1].lower() if '.' in file_name else 'txt'
+            render_analysis_results(
+                file_name, file_extension, result['text'], result['translated_text'], original_lang,
+                result['target_language'], result['analysis_result'], result['entities'],
+                result['ai_engine'] or 'Basic Analysis', show_full_text, highlight_entities,
+                result.get('change_report')
+            )
+        
+        elif not has_input:
             st.info("👆 Please upload a legal document or paste text to begin analysis.")
             
             # Show example of what the tool can do
@@ -1597,7 +1451,7 @@ Gerichtsstand ist München, Deutschland.
             
             with col_sample1:
                 if st.button("📝 Analyze Sample with Basic Engine"):
-                    st.session_state.sample_text = sample_texts[selected_sample]
+                    st.session_state.sample_name = selected_sample
                     st.session_state.analyze_sample = True
                     st.session_state.use_gemini_sample = False
                     st.rerun()
@@ -1606,7 +1460,7 @@ Gerichtsstand ist München, Deutschland.
                 gemini_available = st.session_state.get('gemini_configured', False)
                 if st.button("🤖 Analyze Sample with Gemini AI", disabled=not gemini_available):
                     if gemini_available:
-                        st.session_state.sample_text = sample_texts[selected_sample]
+                        st.session_state.sample_name = selected_sample
                         st.session_state.analyze_sample = True
                         st.session_state.use_gemini_sample = True
                         st.rerun()
@@ -1616,27 +1470,20 @@ Gerichtsstand ist München, Deutschland.
             # Handle sample analysis
             if st.session_state.get('analyze_sample', False):
                 st.session_state.analyze_sample = False
-                text = st.session_state.get('sample_text', '')
+                text = sample_texts.get(st.session_state.get('sample_name'), '')
                 use_gemini = st.session_state.get('use_gemini_sample', False)
                 
                 if text:
                     st.markdown("### 📝 Sample Analysis Results")
                     
-                    with st.spinner("Analyzing sample document..."):
+                    with show_gemini_messages(), st.spinner("Analyzing sample document..."):
                         if use_gemini and gemini_integration and gemini_integration.is_configured:
-                            # Gemini analysis
-                            original_lang = gemini_integration.detect_language(text)
-                            analysis_result = gemini_integration.analyze_legal_document(text, 'en')
-                            entities = gemini_integration.extract_entities_advanced(text, 'en')
+                            # Gemini analysis in a single round trip
+                            original_lang, analysis_result, entities = analyzer.analyze_document_full(text, 'en')
                             ai_engine = "Gemini AI"
                         else:
                             # Basic analysis
-                            try:
-                                original_lang = detect(text[:1000])
-                            except:
-                                original_lang = 'en'
-                            analysis_result = analyzer._basic_analysis(text)
-                            entities = analyzer._extract_basic_entities(text)
+                            original_lang, analysis_result, entities = get_analyzer(None).analyze_document_full(text, 'en')
                             ai_engine = "Basic Analysis"
                     
                     col1, col2 = st.columns(2)
@@ -1670,44 +1517,114 @@ Gerichtsstand ist München, Deutschland.
         # Dashboard tab
         st.markdown('<div class="section-header">📊 User Dashboard</div>', unsafe_allow_html=True)
         
+        # Search past analyses
+        st.markdown("### 🔍 Search Past Analyses")
+        search_query = st.text_input(
+            "Search", placeholder="e.g. contracts with Acme that have an arbitration clause", label_visibility="collapsed",
+            help="Searches document names, summaries, parties, clauses and entities across your full history. "
+                 "Common words are ignored and results matching the most of your words come first."
+        )
+        if search_query.strip():
+            results = user_manager.search_history(st.session_state.user_id, search_query)
+            if results:
+                results_df = pd.DataFrame(results, columns=[
+                    'Document Name', 'Analysis Date', 'Document Type', 'Summary', 'Match', 'Analysis ID', 'Stored'
+                ])
+                results_df['Analysis Date'] = pd.to_datetime(results_df['Analysis Date']).dt.strftime('%Y-%m-%d %H:%M')
+                found_analyses = {
+                    row['Analysis ID']: f"{row['Document Name']} ({row['Analysis Date']})"
+                    for _, row in results_df[results_df['Stored'] == 1].iterrows()
+                }
+                st.dataframe(results_df.drop(columns=['Analysis ID', 'Stored']), use_container_width=True)
+                
+                if found_analyses:
+                    found_col1, found_col2 = st.columns([3, 1])
+                    with found_col1:
+                        selected_result = st.selectbox(
+                            "Open a search result", options=list(found_analyses), format_func=found_analyses.get
+                        )
+                    with found_col2:
+                        st.write("")
+                        if st.button("📂 Open Result"):
+                            st.session_state.reopened_analysis_id = selected_result
+                            st.rerun()
+            else:
+                st.info("No past analyses match your search.")
+        
         # Analysis history
         st.markdown("### 📈 Analysis History")
-        history = user_manager.get_user_history(st.session_state.user_id)
+        user_stats = user_manager.get_user_stats(st.session_state.user_id)
+        
+        # Cursors of the pages already visited, so Previous can step back through keyset pages
+        if 'history_cursors' not in st.session_state:
+            st.session_state.history_cursors = [None]
+        history, next_cursor = user_manager.get_history_page(
+            st.session_state.user_id, page_size=20, cursor=st.session_state.history_cursors[-1]
+        )
         
         if history:
             # Create a comprehensive history display
             history_df = pd.DataFrame(history, columns=[
                 'Document Name', 'Analysis Date', 'Document Type', 'Word Count', 
-                'Original Language', 'Target Language', 'Summary'
+                'Original Language', 'Target Language', 'Summary', 'Analysis ID', 'Stored'
             ])
             
             # Format the dataframe
             history_df['Analysis Date'] = pd.to_datetime(history_df['Analysis Date']).dt.strftime('%Y-%m-%d %H:%M')
             history_df['Original Language'] = history_df['Original Language'].map(lambda x: LANGUAGES.get(x, x))
             history_df['Target Language'] = history_df['Target Language'].map(lambda x: LANGUAGES.get(x, x))
+            stored_analyses = {
+                row['Analysis ID']: f"{row['Document Name']} ({row['Analysis Date']})"
+                for _, row in history_df[history_df['Stored'] == 1].iterrows()
+            }
+            history_df = history_df.drop(columns=['Analysis ID', 'Stored'])
             
             st.dataframe(history_df, use_container_width=True, height=400)
             
+            # Reopen a stored result without re-uploading or re-analyzing the document
+            if stored_analyses:
+                open_col1, open_col2 = st.columns([3, 1])
+                with open_col1:
+                    selected_analysis = st.selectbox(
+                        "Open a past analysis", options=list(stored_analyses), format_func=stored_analyses.get
+                    )
+                with open_col2:
+                    st.write("")
+                    if st.button("📂 Open Analysis"):
+                        # The Document Analysis tab has already rendered this run, so rerun to show it there
+                        st.session_state.reopened_analysis_id = selected_analysis
+                        st.rerun()
+            
+            page_number = len(st.session_state.history_cursors)
+            total_pages = max(1, -(-user_stats['total_analyses'] // 20))
+            nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+            with nav_col1:
+                if st.button("⬅️ Newer", disabled=page_number == 1):
+                    st.session_state.history_cursors.pop()
+                    st.rerun()
+            with nav_col2:
+                st.caption(f"Page {page_number} of {total_pages}")
+            with nav_col3:
+                if st.button("Older ➡️", disabled=next_cursor is None):
+                    st.session_state.history_cursors.append(next_cursor)
+                    st.rerun()
+            
             # Statistics
             st.markdown("### 📊 Usage Statistics")
             stats_col1, stats_col2, stats_col3, stats_col4 = st.columns(4)
             
             with stats_col1:
-                st.metric("Total Analyses", len(history))
+                st.metric("Total Analyses", f"{user_stats['total_analyses']:,}")
             
             with stats_col2:
-                total_words = sum(row[3] for row in history if row[3])
-                st.metric("Total Words Processed", f"{total_words:,}")
+                st.metric("Total Words Processed", f"{user_stats['total_words']:,}")
             
             with stats_col3:
-                doc_types = [row[2] for row in history if row[2]]
-                most_common_type = max(set(doc_types), key=doc_types.count) if doc_types else "N/A"
-                st.metric("Most Common Doc Type", most_common_type)
+                st.metric("Most Common Doc Type", user_stats['top_document_type'] or "N/A")
             
             with stats_col4:
-                languages = [row[4] for row in history if row[4]]
-                most_common_lang = max(set(languages), key=languages.count) if languages else "N/A"
-                lang_display = LANGUAGES.get(most_common_lang, most_common_lang)
+                most_common_lang = user_stats['top_language']
+                lang_display = LANGUAGES.get(most_common_lang, most_common_lang) if most_common_lang else "N/A"
                 st.metric("Most Common Language", lang_display)
             
             # Download history
@@ -1722,6 +1639,77 @@ Gerichtsstand ist München, Deutschland.
         else:
             st.info("No analysis history yet. Start by analyzing your first document!")
         
+        # Analysis cache statistics
+        st.markdown("### ⚡ Analysis Cache")
+        analysis_cache = gemini_integration.cache if gemini_integration else get_analysis_cache()
+        cache_stats = analysis_cache.get_stats()
+        cache_col1, cache_col2, cache_col3, cache_col4 = st.columns(4)
+        
+        with cache_col1:
+            st.metric("Cache Hits", f"{cache_stats['hits']:,}")
+        
+        with cache_col2:
+            st.metric("Cache Misses", f"{cache_stats['misses']:,}")
+        
+        with cache_col3:
+            st.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+        
+        with cache_col4:
+            st.metric("Cached Responses", f"{cache_stats['entries']:,}", 
+                      help=f"{cache_stats['size_bytes'] / (1024 * 1024):.1f} MB on disk")
+        
+        if st.button("🧹 Clear Analysis Cache"):
+            analysis_cache.clear()
+            st.success("Analysis cache cleared!")
+        
+        # Translation memory statistics
+        st.markdown("### 🗂️ Translation Memory")
+        translation_memory = gemini_integration.translation_memory if gemini_integration else get_translation_memory()
+        memory_stats = translation_memory.get_stats()
+        memory_col1, memory_col2, memory_col3 = st.columns(3)
+        
+        with memory_col1:
+            st.metric("Stored Segments", f"{memory_stats['entries']:,}",
+                      help=f"{memory_stats['size_bytes'] / (1024 * 1024):.1f} MB on disk")
+        
+        with memory_col2:
+            st.metric("Segments Reused", f"{memory_stats['hits']:,}")
+        
+        with memory_col3:
+            st.metric("Reuse Rate", f"{memory_stats['hit_rate']:.0%}",
+                      help="Share of segments translated from memory instead of by Gemini")
+        
+        if st.button("🧹 Clear Translation Memory"):
+            translation_memory.clear()
+            st.success("Translation memory cleared!")
+        
+        # Background job queue
+        st.markdown("### 🧵 Background Jobs")
+        job_queue = get_job_queue()
+        depth = job_queue.get_depth()
+        queue_col1, queue_col2, queue_col3, queue_col4 = st.columns(4)
+        
+        with queue_col1:
+            st.metric("Waiting", f"{depth['queued']:,}")
+        
+        with queue_col2:
+            st.metric("Running", f"{depth['running']:,}")
+        
+        with queue_col3:
+            st.metric("Completed", f"{depth['done']:,}")
+        
+        with queue_col4:
+            st.metric("Failed", f"{depth['dead']:,}")
+        
+        user_jobs = job_queue.list_jobs(st.session_state.user_id)
+        if user_jobs:
+            jobs_df = pd.DataFrame([
+                (json.loads(payload).get('document_name'), status, attempts, error, created_date)
+                for _, _, payload, status, attempts, error, created_date, _ in user_jobs
+            ], columns=['Document Name', 'Status', 'Attempts', 'Last Error', 'Submitted'])
+            jobs_df['Submitted'] = pd.to_datetime(jobs_df['Submitted']).dt.strftime('%Y-%m-%d %H:%M')
+            st.dataframe(jobs_df, use_container_width=True)
+        
         # Account settings
         st.markdown("### ⚙️ Account Settings")
         with st.expander("Update Account Information"):
@@ -1733,16 +1721,20 @@ Gerichtsstand ist München, Deutschland.
             
             with col_set2:
                 new_organization = st.text_input("Organization", value=st.session_state.get('user_organization', ''))
-                
+            
             if st.button("💾 Save Changes"):
                 st.success("Account information updated! (Note: This is a demo - changes are not actually saved)")
 
 def main():
     """Main application entry point"""
+    configure_page()
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+    init_session_state()
+    
     if not st.session_state.logged_in:
         login_page()
     else:
         main_app()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,3391 @@
+"""Core legal document analysis engine: text extraction, Gemini integration and persistence.
+
+This module has no Streamlit dependency so it can be reused by the batch CLI
+and other headless entry points. Problems are reported through the optional
+``on_warning``/``on_error`` callbacks, which default to the module logger.
+
+Heavy third-party packages (the Google SDK, PyPDF2, python-docx) are
+imported on first use, so importing this module only costs the standard library.
+"""
+import re
+import json
+import hashlib
+import html
+import logging
+from datetime import datetime, timedelta
+import sqlite3
+import uuid
+import os
+import zlib
+import math
+import difflib
+import atexit
+import contextvars
+import shutil
+import sys
+import tempfile
+import queue
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import FIRST_EXCEPTION, CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Supported languages
+LANGUAGES = {
+    'en': 'English',
+    'es': 'Spanish (Español)',
+    'fr': 'French (Français)',
+    'de': 'German (Deutsch)',
+    'it': 'Italian (Italiano)',
+    'pt': 'Portuguese (Português)',
+    'ru': 'Russian (Русский)',
+    'zh': 'Chinese (中文)',
+    'ja': 'Japanese (日本語)',
+    'ko': 'Korean (한국어)',
+    'ar': 'Arabic (العربية)',
+    'hi': 'Hindi (हिन्दी)',
+    'nl': 'Dutch (Nederlands)',
+    'sv': 'Swedish (Svenska)',
+    'no': 'Norwegian (Norsk)',
+    'da': 'Danish (Dansk)',
+    'fi': 'Finnish (Suomi)',
+    'pl': 'Polish (Polski)',
+    'tr': 'Turkish (Türkçe)',
+    'he': 'Hebrew (עברית)'
+}
+
+# Reference text for each Latin-script language, used to build the local detector's n-gram profiles
+LANGUAGE_SEEDS = {
+    'en': (
+        "This agreement is entered into by and between the parties and shall be governed by the laws of the state. "
+        "The supplier shall deliver the goods within thirty days of the date of the order, and the buyer shall pay "
+        "the invoice in full. Either party may terminate this agreement upon written notice if the other party "
+        "fails to perform any of its obligations. All information disclosed under this contract is confidential "
+        "and must not be shared with any third party without prior consent. The company will indemnify and hold "
+        "harmless the employee against any claims, damages or liabilities arising from the performance of the "
+        "services. Any dispute that cannot be resolved through negotiation will be settled by arbitration. "
+        "We have read the terms and they are what we expected, so we would like to sign them this week."
+    ),
+    'es': (
+        "El presente contrato se celebra entre las partes y se regirá por las leyes del país. El proveedor deberá "
+        "entregar los bienes dentro de los treinta días siguientes a la fecha del pedido, y el comprador pagará la "
+        "factura en su totalidad. Cualquiera de las partes podrá resolver este contrato mediante notificación por "
+        "escrito si la otra parte incumple sus obligaciones. Toda la información revelada en virtud de este "
+        "acuerdo es confidencial y no podrá ser compartida con terceros sin el consentimiento previo. La empresa "
+        "indemnizará al empleado frente a cualquier reclamación, daño o responsabilidad que se derive de la "
+        "prestación de los servicios. Las controversias que no puedan resolverse mediante negociación se "
+        "someterán a arbitraje. Hemos leído las condiciones y queremos firmarlas esta semana."
+    ),
+    'fr': (
+        "Le présent contrat est conclu entre les parties et sera régi par les lois du pays. Le fournisseur devra "
+        "livrer les marchandises dans un délai de trente jours à compter de la date de la commande, et l'acheteur "
+        "paiera la facture dans son intégralité. Chacune des parties peut résilier le présent contrat par "
+        "notification écrite si l'autre partie manque à l'une de ses obligations. Toutes les informations "
+        "communiquées au titre de cet accord sont confidentielles et ne peuvent être divulguées à des tiers sans "
+        "accord préalable. La société garantit et indemnise le salarié contre toute réclamation, tout dommage ou "
+        "toute responsabilité découlant de l'exécution des services. Tout litige qui ne peut être réglé à "
+        "l'amiable sera soumis à l'arbitrage. Nous avons lu les conditions et nous souhaitons les signer."
+    ),
+    'de': (
+        "Dieser Vertrag wird zwischen den Parteien geschlossen und unterliegt dem Recht des Landes. Der Lieferant "
+        "ist verpflichtet, die Waren innerhalb von dreißig Tagen nach dem Datum der Bestellung zu liefern, und der "
+        "Käufer zahlt die Rechnung in voller Höhe. Jede Partei kann diesen Vertrag durch schriftliche Mitteilung "
+        "kündigen, wenn die andere Partei ihre Pflichten nicht erfüllt. Alle im Rahmen dieser Vereinbarung "
+        "offengelegten Informationen sind vertraulich und dürfen nicht ohne vorherige Zustimmung an Dritte "
+        "weitergegeben werden. Das Unternehmen stellt den Arbeitnehmer von allen Ansprüchen, Schäden und "
+        "Haftungen frei, die sich aus der Erbringung der Leistungen ergeben. Streitigkeiten, die nicht durch "
+        "Verhandlungen beigelegt werden können, werden durch ein Schiedsgericht entschieden. Wir haben die "
+        "Bedingungen gelesen und möchten sie noch in dieser Woche unterschreiben."
+    ),
+    'it': (
+        "Il presente contratto è stipulato tra le parti ed è regolato dalle leggi del paese. Il fornitore dovrà "
+        "consegnare la merce entro trenta giorni dalla data dell'ordine e l'acquirente pagherà la fattura per "
+        "intero. Ciascuna delle parti potrà recedere dal presente contratto mediante comunicazione scritta se "
+        "l'altra parte non adempie ai propri obblighi. Tutte le informazioni comunicate ai sensi del presente "
+        "accordo sono riservate e non possono essere divulgate a terzi senza il previo consenso. La società "
+        "terrà indenne il dipendente da qualsiasi pretesa, danno o responsabilità derivante dalla prestazione "
+        "dei servizi. Le controversie che non possono essere risolte mediante trattativa saranno deferite ad "
+        "arbitrato. Abbiamo letto le condizioni e vorremmo firmarle questa settimana."
+    ),
+    'pt': (
+        "O presente contrato é celebrado entre as partes e será regido pelas leis do país. O fornecedor deverá "
+        "entregar os bens no prazo de trinta dias a contar da data da encomenda, e o comprador pagará a fatura na "
+        "sua totalidade. Qualquer das partes poderá rescindir este contrato mediante notificação por escrito se a "
+        "outra parte não cumprir as suas obrigações. Todas as informações divulgadas no âmbito deste acordo são "
+        "confidenciais e não podem ser partilhadas com terceiros sem o consentimento prévio. A empresa "
+        "indemnizará o trabalhador por quaisquer reclamações, danos ou responsabilidades decorrentes da prestação "
+        "dos serviços. Os litígios que não possam ser resolvidos por negociação serão submetidos a arbitragem. "
+        "Nós lemos as condições e gostaríamos de assiná-las ainda esta semana. Pelo presente instrumento "
+        "particular de locação, o locador cede ao locatário o uso do imóvel, e o locatário se obriga a pagar o "
+        "aluguel mensal até o quinto dia útil de cada mês, bem como a mantê-lo em bom estado de conservação e a "
+        "devolvê-lo nas mesmas condições em que o recebeu. Fica eleito o foro da comarca de São Paulo para "
+        "dirimir quaisquer dúvidas oriundas deste contrato, com renúncia de qualquer outro, por mais "
+        "privilegiado que seja. E, por estarem assim justas e contratadas, as partes assinam o presente em duas "
+        "vias de igual teor, na presença das testemunhas abaixo."
+    ),
+    'nl': (
+        "Deze overeenkomst wordt gesloten tussen de partijen en wordt beheerst door het recht van het land. De "
+        "leverancier zal de goederen binnen dertig dagen na de datum van de bestelling leveren, en de koper "
+        "betaalt de factuur volledig. Elk van de partijen kan deze overeenkomst schriftelijk opzeggen indien de "
+        "andere partij haar verplichtingen niet nakomt. Alle informatie die op grond van deze overeenkomst wordt "
+        "verstrekt is vertrouwelijk en mag niet zonder voorafgaande toestemming met derden worden gedeeld. Het "
+        "bedrijf vrijwaart de werknemer tegen alle vorderingen, schade of aansprakelijkheid die voortvloeit uit "
+        "de uitvoering van de diensten. Geschillen die niet door onderhandeling kunnen worden opgelost, worden "
+        "voorgelegd aan arbitrage. Wij hebben de voorwaarden gelezen en willen ze deze week ondertekenen."
+    ),
+    'sv': (
+        "Detta avtal ingås mellan parterna och ska regleras av landets lagar. Leverantören ska leverera varorna "
+        "inom trettio dagar från dagen för beställningen, och köparen ska betala fakturan i sin helhet. Vardera "
+        "parten får säga upp detta avtal genom skriftligt meddelande om den andra parten inte fullgör sina "
+        "skyldigheter. All information som lämnas enligt detta avtal är konfidentiell och får inte delas med "
+        "tredje man utan föregående samtycke. Bolaget ska hålla den anställde skadeslös för alla krav, skador "
+        "eller förpliktelser som uppstår till följd av utförandet av tjänsterna. Tvister som inte kan lösas "
+        "genom förhandling ska avgöras genom skiljeförfarande. Vi har läst villkoren och vill skriva under dem "
+        "redan i veckan, eftersom de är precis vad vi förväntade oss."
+    ),
+    'no': (
+        "Denne avtalen inngås mellom partene og skal reguleres av norsk lov. Leverandøren skal levere varene "
+        "innen tretti dager fra datoen for bestillingen, og kjøperen skal betale fakturaen i sin helhet. Hver av "
+        "partene kan si opp denne avtalen ved skriftlig varsel dersom den andre parten ikke oppfyller sine "
+        "forpliktelser. All informasjon som gis i henhold til denne avtalen er konfidensiell og skal ikke deles "
+        "med tredjeparter uten forutgående samtykke. Selskapet skal holde den ansatte skadesløs for alle krav, "
+        "skader eller ansvar som oppstår som følge av utførelsen av tjenestene. Tvister som ikke kan løses "
+        "gjennom forhandlinger, skal avgjøres ved voldgift. Vi har lest vilkårene og ønsker å signere dem i løpet "
+        "av uken, fordi de er akkurat det vi hadde forventet."
+    ),
+    'da': (
+        "Denne aftale indgås mellem parterne og er underlagt dansk ret. Leverandøren skal levere varerne inden "
+        "for tredive dage fra datoen for bestillingen, og køberen skal betale fakturaen fuldt ud. Hver af "
+        "parterne kan opsige denne aftale ved skriftlig meddelelse, hvis den anden part ikke opfylder sine "
+        "forpligtelser. Alle oplysninger, der videregives i henhold til denne aftale, er fortrolige og må ikke "
+        "deles med tredjemand uden forudgående samtykke. Virksomheden skal holde medarbejderen skadesløs for "
+        "ethvert krav, enhver skade eller ethvert ansvar, der opstår i forbindelse med udførelsen af ydelserne. "
+        "Tvister, som ikke kan løses ved forhandling, skal afgøres ved voldgift. Vi har læst betingelserne og "
+        "vil gerne underskrive dem i denne uge, fordi de er præcis, hvad vi havde forventet."
+    ),
+    'fi': (
+        "Tämä sopimus tehdään osapuolten välillä, ja siihen sovelletaan Suomen lakia. Toimittajan on "
+        "toimitettava tavarat kolmenkymmenen päivän kuluessa tilauksen päivämäärästä, ja ostaja maksaa laskun "
+        "kokonaisuudessaan. Kumpikin osapuoli voi irtisanoa tämän sopimuksen kirjallisella ilmoituksella, jos "
+        "toinen osapuoli ei täytä velvoitteitaan. Kaikki tämän sopimuksen nojalla annetut tiedot ovat "
+        "luottamuksellisia, eikä niitä saa luovuttaa kolmansille osapuolille ilman etukäteen annettua "
+        "suostumusta. Yhtiö korvaa työntekijälle kaikki vaatimukset, vahingot ja vastuut, jotka aiheutuvat "
+        "palvelujen suorittamisesta. Riidat, joita ei voida ratkaista neuvottelemalla, ratkaistaan "
+        "välimiesmenettelyssä. Olemme lukeneet ehdot ja haluaisimme allekirjoittaa ne vielä tällä viikolla."
+    ),
+    'pl': (
+        "Niniejsza umowa zostaje zawarta pomiędzy stronami i podlega prawu polskiemu. Dostawca zobowiązuje się "
+        "dostarczyć towary w terminie trzydziestu dni od daty złożenia zamówienia, a kupujący zapłaci fakturę w "
+        "całości. Każda ze stron może wypowiedzieć niniejszą umowę w drodze pisemnego zawiadomienia, jeżeli "
+        "druga strona nie wykonuje swoich zobowiązań. Wszystkie informacje przekazane na podstawie tej umowy są "
+        "poufne i nie mogą być udostępniane osobom trzecim bez uprzedniej zgody. Spółka zwolni pracownika z "
+        "odpowiedzialności za wszelkie roszczenia, szkody lub zobowiązania wynikające ze świadczenia usług. "
+        "Spory, których nie można rozwiązać w drodze negocjacji, zostaną poddane pod rozstrzygnięcie sądu "
+        "polubownego. Przeczytaliśmy warunki i chcielibyśmy je podpisać jeszcze w tym tygodniu."
+    ),
+    'tr': (
+        "İşbu sözleşme taraflar arasında akdedilmiş olup Türkiye Cumhuriyeti kanunlarına tabidir. Tedarikçi, "
+        "malları sipariş tarihinden itibaren otuz gün içinde teslim edecek ve alıcı faturanın tamamını "
+        "ödeyecektir. Taraflardan herhangi biri, diğer tarafın yükümlülüklerini yerine getirmemesi halinde "
+        "yazılı bildirimde bulunarak bu sözleşmeyi feshedebilir. Bu sözleşme kapsamında açıklanan tüm bilgiler "
+        "gizlidir ve önceden izin alınmadan üçüncü kişilerle paylaşılamaz. Şirket, hizmetlerin ifasından "
+        "doğan her türlü talep, zarar ve sorumluluğa karşı çalışanı tazmin edecektir. Müzakere yoluyla "
+        "çözülemeyen uyuşmazlıklar tahkim yoluyla çözülecektir. Koşulları okuduk ve bu hafta içinde imzalamak "
+        "istiyoruz, çünkü tam olarak beklediğimiz gibiler."
+    ),
+}
+
+class LanguageDetector:
+    """Offline language identification from Unicode scripts and character n-gram profiles
+    
+    Documents in a script used by only one supported language (Cyrillic, Arabic, Hangul, ...)
+    are decided by script counts; Latin-script text is scored against n-gram profiles built
+    from LANGUAGE_SEEDS. Several windows spread over the document are scored together, so a
+    title page in another language does not decide the result. Results are deterministic.
+    """
+    
+    # Script -> language for scripts that identify one supported language; Han is split on kana below
+    SCRIPTS = {
+        'ru': re.compile(r'[\u0400-\u04ff]'),
+        'ar': re.compile(r'[\u0600-\u06ff\u0750-\u077f\ufb50-\ufdff\ufe70-\ufeff]'),
+        'he': re.compile(r'[\u0590-\u05ff]'),
+        'hi': re.compile(r'[\u0900-\u097f]'),
+        'ko': re.compile(r'[\uac00-\ud7af\u1100-\u11ff\u3130-\u318f]'),
+        'ja': re.compile(r'[\u3040-\u30ff]'),
+        'zh': re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]')
+    }
+    LATIN = re.compile(r'[a-zA-Z\u00c0-\u024f]')
+    NON_LETTERS = re.compile(r'[\W\d_]+')
+    
+    def __init__(self, seeds=None, max_ngram=3, smoothing=0.5, sample_chars=500, samples=3):
+        self.max_ngram = max_ngram
+        self.sample_chars = sample_chars
+        self.samples = samples
+        self.profiles = {}
+        for language, seed in (seeds or LANGUAGE_SEEDS).items():
+            counts = Counter(self._ngrams(seed))
+            # Pad the vocabulary so n-grams missing from a short seed are not penalized too hard
+            denominator = sum(counts.values()) + smoothing * (len(counts) + 1000)
+            self.profiles[language] = (
+                {ngram: math.log((count + smoothing) / denominator) for ngram, count in counts.items()},
+                math.log(smoothing / denominator)
+            )
+    
+    def _ngrams(self, text):
+        """Yield the 1- to max_ngram-character n-grams of text's letters, with spaces at word edges"""
+        text = ' ' + self.NON_LETTERS.sub(' ', text.lower()).strip() + ' '
+        for size in range(1, self.max_ngram + 1):
+            for start in range(len(text) - size + 1):
+                ngram = text[start:start + size]
+                if ngram != ' ' and '  ' not in ngram:
+                    yield ngram
+    
+    def _sample(self, text):
+        """Windows of sample_chars spread evenly over the text, cut at spaces"""
+        window_count = self.samples
+        if len(text) <= self.sample_chars * window_count:
+            return text
+        windows = []
+        for window in range(window_count):
+            start = (len(text) - self.sample_chars) * window // (window_count - 1) if window_count > 1 else 0
+            if start:
+                start = text.find(' ', start) + 1 or start
+            windows.append(text[start:start + self.sample_chars])
+        return '\n'.join(windows)
+    
+    def detect(self, text):
+        """Return (language code, confidence between 0 and 1); ('en', 0.0) when there is nothing to go on"""
+        sample = self._sample(text or '')
+        
+        script_counts = {language: len(pattern.findall(sample)) for language, pattern in self.SCRIPTS.items()}
+        latin = len(self.LATIN.findall(sample))
+        # Japanese mixes kana with Han characters; Chinese has no kana
+        if script_counts['ja'] and script_counts['ja'] >= 0.05 * (script_counts['ja'] + script_counts['zh']):
+            script_counts['ja'] += script_counts.pop('zh')
+        total = latin + sum(script_counts.values())
+        if not total:
+            return 'en', 0.0
+        
+        language, count = max(script_counts.items(), key=lambda item: item[1])
+        if count > latin:
+            return language, round(count / total, 3)
+        
+        ngrams = Counter(self._ngrams(sample))
+        ngram_total = sum(ngrams.values())
+        scores = sorted(
+            (sum(count * profile.get(ngram, unseen) for ngram, count in ngrams.items()) / ngram_total, language)
+            for language, (profile, unseen) in self.profiles.items()
+        )
+        (second_score, _), (best_score, language) = scores[-2], scores[-1]
+        # The per-n-gram margin over the runner-up, weighted by how much text backs it up
+        confidence = 1 - math.exp(-(best_score - second_score) * min(ngram_total, 500) / 10)
+        return language, round(confidence * latin / total, 3)
+    
+    def detect_batch(self, texts):
+        """Detect the language of many documents; returns a list of (language, confidence)"""
+        if hasattr(texts, 'to_pylist'):
+            texts = texts.to_pylist()
+        return [self.detect(text if isinstance(text, str) else '') for text in texts]
+
+# Profiles are built once at import and shared by every caller
+_default_language_detector = LanguageDetector()
+
+def detect_language_local(text):
+    """Detect the language of text with the built-in detector, defaulting to English"""
+    return _default_language_detector.detect(text)[0]
+
+# User accounts and analysis history
+DB_PATH = 'legal_analyzer_gemini.db'
+
+class ConnectionPool:
+    """Thread-safe pool of reusable SQLite connections using WAL journaling"""
+    
+    # WAL lets readers proceed while a writer commits; NORMAL sync is safe under WAL
+    PRAGMAS = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA mmap_size=134217728'
+    ]
+    
+    def __init__(self, db_path, max_connections=8, timeout=30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._schemas = set()
+        self._schema_lock = threading.Lock()
+    
+    def _connect(self):
+        """Open a new connection with the pool's pragmas applied"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success, rolls back on error"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Timed out waiting for a database connection to {self.db_path}")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+    
+    def ensure_schema(self, name, init_schema):
+        """Run a schema initializer once per process for this database"""
+        with self._schema_lock:
+            if name not in self._schemas:
+                init_schema()
+                self._schemas.add(name)
+    
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+# One pool per database file, shared by every manager in the process
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+def get_connection_pool(db_path, max_connections=8):
+    """Get the shared connection pool for a database file, creating it on first use"""
+    key = os.path.abspath(db_path)
+    with _connection_pools_lock:
+        if key not in _connection_pools:
+            _connection_pools[key] = ConnectionPool(db_path, max_connections)
+        return _connection_pools[key]
+
+# Gemini model and prompt revision; both are part of the analysis cache key
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+PROMPT_VERSION = 1
+
+# Analysis cache lives in its own SQLite file next to the user database
+CACHE_DB_PATH = 'legal_analyzer_cache.db'
+
+def _evict_oldest(cursor, table, key_column, used_column, excess_bytes):
+    """Delete the least recently used rows of a size-capped table until excess_bytes are freed
+    
+    Walks the table's index on used_column from the oldest row, so only the evicted rows are read.
+    Returns the number of bytes freed.
+    """
+    cursor.execute(f'SELECT {key_column}, size_bytes FROM {table} ORDER BY {used_column}')
+    victims = []
+    freed = 0
+    while freed < excess_bytes:
+        rows = cursor.fetchmany(100)
+        if not rows:
+            break
+        for key, size_bytes in rows:
+            victims.append((key,))
+            freed += size_bytes
+            if freed >= excess_bytes:
+                break
+    cursor.executemany(f'DELETE FROM {table} WHERE {key_column} = ?', victims)
+    return freed
+
+class AnalysisCache:
+    """Persistent content-addressed cache for Gemini analysis responses"""
+    
+    def __init__(self, db_path=CACHE_DB_PATH, max_size_mb=200, ttl_days=30):
+        self.db_path = db_path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl = timedelta(days=ttl_days)
+        self.pool = get_connection_pool(db_path)
+        self.pool.ensure_schema('analysis_cache', self.init_database)
+    
+    def init_database(self):
+        """Initialize SQLite tables for cached responses and hit/miss counters"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_date TEXT NOT NULL,
+                    last_accessed TEXT NOT NULL,
+                    hit_count INTEGER DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_accessed
+                ON analysis_cache (last_accessed)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_cache_created_date
+                ON analysis_cache (created_date)
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cache_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute("INSERT OR IGNORE INTO cache_stats (name, value) VALUES ('hits', 0), ('misses', 0)")
+            # Running total of size_bytes, updated on every write so eviction never has to scan the table
+            cursor.execute('''
+                INSERT OR IGNORE INTO cache_stats (name, value)
+                SELECT 'size_bytes', COALESCE(SUM(size_bytes), 0) FROM analysis_cache
+            ''')
+    
+    def make_key(self, kind, text, model_name, target_lang='', source_lang=''):
+        """Build a cache key from the document text and everything that shapes the response"""
+        digest = hashlib.sha256()
+        header = f"{kind}|{PROMPT_VERSION}|{model_name}|{target_lang or ''}|{source_lang or ''}\n"
+        digest.update(header.encode('utf-8'))
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def get(self, cache_key):
+        """Return the cached value for a key, or None on a miss or expired entry"""
+        now = datetime.now()
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT value, created_date, size_bytes FROM analysis_cache WHERE cache_key = ?', (cache_key,))
+            row = cursor.fetchone()
+            
+            if row and datetime.fromisoformat(row[1]) + self.ttl > now:
+                cursor.execute('''
+                    UPDATE analysis_cache 
+                    SET last_accessed = ?, hit_count = hit_count + 1 
+                    WHERE cache_key = ?
+                ''', (now.isoformat(), cache_key))
+                cursor.execute("UPDATE cache_stats SET value = value + 1 WHERE name = 'hits'")
+                return json.loads(row[0])
+            
+            if row:
+                cursor.execute('DELETE FROM analysis_cache WHERE cache_key = ?', (cache_key,))
+                self._add_size(cursor, -row[2])
+            cursor.execute("UPDATE cache_stats SET value = value + 1 WHERE name = 'misses'")
+            return None
+    
+    def set(self, cache_key, kind, value):
+        """Store a value in the cache and evict stale or excess entries"""
+        payload = json.dumps(value, ensure_ascii=False)
+        size_bytes = len(payload.encode('utf-8'))
+        now = datetime.now().isoformat()
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            replaced = cursor.execute(
+                'DELETE FROM analysis_cache WHERE cache_key = ? RETURNING size_bytes', (cache_key,)
+            ).fetchall()
+            cursor.execute('''
+                INSERT INTO analysis_cache
+                (cache_key, kind, value, size_bytes, created_date, last_accessed, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', (cache_key, kind, payload, size_bytes, now, now))
+            total = self._add_size(cursor, size_bytes - sum(size for size, in replaced))
+            self._evict(cursor, total)
+    
+    def _add_size(self, cursor, delta):
+        """Adjust the running total of cached bytes; returns the new total"""
+        cursor.execute("UPDATE cache_stats SET value = value + ? WHERE name = 'size_bytes' RETURNING value", (delta,))
+        return cursor.fetchone()[0]
+    
+    def _evict(self, cursor, total):
+        """Drop expired entries, then least recently used entries while the cache is over the size limit"""
+        expiry_cutoff = (datetime.now() - self.ttl).isoformat()
+        expired = cursor.execute(
+            'DELETE FROM analysis_cache WHERE created_date < ? RETURNING size_bytes', (expiry_cutoff,)
+        ).fetchall()
+        if expired:
+            total = self._add_size(cursor, -sum(size for size, in expired))
+        
+        if total > self.max_size_bytes:
+            freed = _evict_oldest(cursor, 'analysis_cache', 'cache_key', 'last_accessed', total - self.max_size_bytes)
+            self._add_size(cursor, -freed)
+    
+    def get_stats(self):
+        """Get hit/miss counters and current cache size"""
+        with self.pool.connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM cache_stats').fetchall())
+            entries, size_bytes = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM analysis_cache'
+            ).fetchone()
+        
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size_bytes
+        }
+    
+    def clear(self):
+        """Remove all cached entries and reset counters"""
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM analysis_cache')
+            conn.execute('UPDATE cache_stats SET value = 0')
+
+class TranslationMemory:
+    """Persistent store of translated segments, keyed by normalized segment text and language pair
+    
+    Boilerplate such as confidentiality or governing-law clauses recurs across a portfolio, so
+    a segment translated once is reused by every later document that contains it, regardless
+    of whitespace differences.
+    """
+    
+    def __init__(self, db_path=CACHE_DB_PATH, max_size_mb=200):
+        self.db_path = db_path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.pool = get_connection_pool(db_path)
+        self.pool.ensure_schema('translation_memory', self.init_database)
+    
+    def init_database(self):
+        """Initialize SQLite tables for translated segments and hit/miss counters"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS translation_memory (
+                    segment_key TEXT PRIMARY KEY,
+                    source_lang TEXT NOT NULL,
+                    target_lang TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_date TEXT NOT NULL,
+                    last_used TEXT NOT NULL,
+                    use_count INTEGER DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_translation_memory_last_used
+                ON translation_memory (last_used)
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS translation_memory_stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute("INSERT OR IGNORE INTO translation_memory_stats (name, value) VALUES ('hits', 0), ('misses', 0)")
+            # Running total of size_bytes, updated on every write so eviction never has to scan the table
+            cursor.execute('''
+                INSERT OR IGNORE INTO translation_memory_stats (name, value)
+                SELECT 'size_bytes', COALESCE(SUM(size_bytes), 0) FROM translation_memory
+            ''')
+    
+    def make_key(self, segment, model_name, target_lang, source_lang):
+        """Build a segment key that ignores differences in whitespace"""
+        normalized = re.sub(r'\s+', ' ', segment).strip()
+        header = f"{PROMPT_VERSION}|{model_name}|{source_lang}|{target_lang}\n"
+        return hashlib.sha256((header + normalized).encode('utf-8')).hexdigest()
+    
+    def get_many(self, segment_keys):
+        """Return {segment_key: translation} for the keys already in memory"""
+        segment_keys = list(dict.fromkeys(segment_keys))
+        found = {}
+        now = datetime.now().isoformat()
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(segment_keys), 500):
+                batch = segment_keys[start:start + 500]
+                placeholders = ', '.join('?' * len(batch))
+                cursor.execute(f'''
+                    UPDATE translation_memory 
+                    SET last_used = ?, use_count = use_count + 1
+                    WHERE segment_key IN ({placeholders})
+                    RETURNING segment_key, translation
+                ''', [now] + batch)
+                found.update(cursor.fetchall())
+            
+            cursor.executemany('UPDATE translation_memory_stats SET value = value + ? WHERE name = ?',
+                               [(len(found), 'hits'), (len(segment_keys) - len(found), 'misses')])
+        return found
+    
+    def put_many(self, entries):
+        """Store (segment_key, source_lang, target_lang, translation) tuples and evict beyond the size limit"""
+        now = datetime.now().isoformat()
+        # A key given twice keeps its last translation
+        rows = {
+            segment_key: (segment_key, source_lang, target_lang, translation, len(translation.encode('utf-8')), now, now)
+            for segment_key, source_lang, target_lang, translation in entries
+        }
+        if not rows:
+            return
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            keys = list(rows)
+            replaced_bytes = 0
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ', '.join('?' * len(batch))
+                cursor.execute(
+                    f'DELETE FROM translation_memory WHERE segment_key IN ({placeholders}) RETURNING size_bytes', batch
+                )
+                replaced_bytes += sum(size for size, in cursor.fetchall())
+            cursor.executemany('''
+                INSERT INTO translation_memory
+                (segment_key, source_lang, target_lang, translation, size_bytes, created_date, last_used, use_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 0)
+            ''', list(rows.values()))
+            
+            total = self._add_size(cursor, sum(row[4] for row in rows.values()) - replaced_bytes)
+            if total > self.max_size_bytes:
+                freed = _evict_oldest(cursor, 'translation_memory', 'segment_key', 'last_used',
+                                      total - self.max_size_bytes)
+                self._add_size(cursor, -freed)
+    
+    def _add_size(self, cursor, delta):
+        """Adjust the running total of stored bytes; returns the new total"""
+        cursor.execute(
+            "UPDATE translation_memory_stats SET value = value + ? WHERE name = 'size_bytes' RETURNING value", (delta,)
+        )
+        return cursor.fetchone()[0]
+    
+    def get_stats(self):
+        """Get segment hit/miss counters and current memory size"""
+        with self.pool.connection() as conn:
+            counters = dict(conn.execute('SELECT name, value FROM translation_memory_stats').fetchall())
+            entries, size_bytes = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM translation_memory'
+            ).fetchone()
+        
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'size_bytes': size_bytes
+        }
+    
+    def clear(self):
+        """Remove all translated segments and reset counters"""
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM translation_memory')
+            conn.execute('UPDATE translation_memory_stats SET value = 0')
+
+class DocumentChunker:
+    """Split long documents into overlapping chunks along section and clause boundaries"""
+    
+    # A new section starts at a line like "ARTICLE 5", "Section 2.1", "§ 3" or "4. TERMINATION"
+    SECTION_BOUNDARY = re.compile(
+        r'\n(?=[ \t]*(?:ARTICLE|Article|SECTION|Section|CLAUSE|Clause|§|\d+(?:\.\d+)*[.)]?[ \t]+[A-Z]))'
+    )
+    PARAGRAPH_BOUNDARY = re.compile(r'\n[ \t]*\n')
+    SENTENCE_BOUNDARY = re.compile(r'(?<=[.;:])\s+')
+    
+    def __init__(self, max_chunk_chars=30000, overlap_chars=500):
+        self.max_chunk_chars = max_chunk_chars
+        self.overlap_chars = min(overlap_chars, max_chunk_chars // 4)
+    
+    def needs_chunking(self, text):
+        """Check whether a document is too long for a single prompt"""
+        return len(text) > self.max_chunk_chars
+    
+    def split(self, text):
+        """Split text into ordered chunks no longer than max_chunk_chars, with overlap"""
+        if not self.needs_chunking(text):
+            return [text]
+        return list(self._overlap(self._pack(text)))
+    
+    def iter_chunks(self, pieces):
+        """Chunk an incrementally produced text stream (e.g. PDF pages), yielding each chunk once it is complete"""
+        pending = []
+        pending_len = 0
+        emitted = False
+        raw_chunks = []
+        
+        for piece in pieces:
+            pending.append(piece)
+            pending_len += len(piece)
+            if pending_len <= 2 * self.max_chunk_chars:
+                continue
+            
+            # Hold back the last chunk, since the next piece may continue its section
+            packed = self._pack(''.join(pending))
+            for chunk in packed[:-1]:
+                raw_chunks.append(chunk)
+            pending = [packed[-1]]
+            pending_len = len(packed[-1])
+            
+            for chunk in self._overlap(raw_chunks, emitted):
+                yield chunk
+                emitted = True
+            raw_chunks = raw_chunks[-1:]
+        
+        text = ''.join(pending)
+        if not emitted and not self.needs_chunking(text):
+            if text:
+                yield text
+            return
+        if text:
+            raw_chunks.extend(self._pack(text))
+        yield from self._overlap(raw_chunks, emitted)
+    
+    def split_segments(self, text, max_segment_chars=2000):
+        """Split text into paragraph-sized translation segments, keeping every character
+        
+        Paragraphs longer than max_segment_chars are split into sentences.
+        """
+        segments = []
+        for paragraph in self._split_on(self.PARAGRAPH_BOUNDARY, text):
+            if len(paragraph) <= max_segment_chars:
+                segments.append(paragraph)
+                continue
+            for sentence in self._split_on(self.SENTENCE_BOUNDARY, paragraph):
+                segments.extend(sentence[i:i + max_segment_chars] for i in range(0, len(sentence), max_segment_chars))
+        return segments
+    
+    def split_sections(self, text, max_section_chars=4000):
+        """Split text into clause-sized sections for version comparison, keeping every character
+        
+        Sections start at headings like "ARTICLE 5" or "4. TERMINATION"; sections longer than
+        max_section_chars are split into paragraphs, then sentences.
+        """
+        sections = []
+        for section in self._split_on(self.SECTION_BOUNDARY, text):
+            if len(section) <= max_section_chars:
+                sections.append(section)
+                continue
+            for paragraph in self._split_on(self.PARAGRAPH_BOUNDARY, section):
+                if len(paragraph) <= max_section_chars:
+                    sections.append(paragraph)
+                    continue
+                for sentence in self._split_on(self.SENTENCE_BOUNDARY, paragraph):
+                    sections.extend(sentence[i:i + max_section_chars] for i in range(0, len(sentence), max_section_chars))
+        return sections
+    
+    def _pack(self, text):
+        """Split text at the coarsest boundaries that fit and greedily pack the pieces into chunks"""
+        budget = self.max_chunk_chars - self.overlap_chars
+        if len(text) <= budget:
+            return [text]
+        
+        pieces = []
+        for section in self._split_on(self.SECTION_BOUNDARY, text):
+            if len(section) <= budget:
+                pieces.append(section)
+                continue
+            for paragraph in self._split_on(self.PARAGRAPH_BOUNDARY, section):
+                if len(paragraph) <= budget:
+                    pieces.append(paragraph)
+                    continue
+                for sentence in self._split_on(self.SENTENCE_BOUNDARY, paragraph):
+                    # Last resort for run-on text with no usable boundaries
+                    pieces.extend(sentence[i:i + budget] for i in range(0, len(sentence), budget))
+        
+        chunks = []
+        current = []
+        current_len = 0
+        for piece in pieces:
+            if current and current_len + len(piece) > budget:
+                chunks.append(''.join(current))
+                current = []
+                current_len = 0
+            current.append(piece)
+            current_len += len(piece)
+        if current:
+            chunks.append(''.join(current))
+        return chunks
+    
+    def _overlap(self, chunks, skip_first=False):
+        """Carry the tail of each chunk into the next so clauses spanning a boundary are not lost
+        
+        With skip_first, the first chunk has already been yielded and only serves as overlap source.
+        """
+        previous = None
+        for chunk in chunks:
+            if previous is None:
+                if not skip_first:
+                    yield chunk
+            else:
+                tail = previous[-self.overlap_chars:] if self.overlap_chars else ''
+                space = tail.find(' ')
+                if 0 <= space < len(tail) - 1:
+                    tail = tail[space + 1:]
+                yield tail + chunk
+            previous = chunk
+    
+    def _split_on(self, pattern, text):
+        """Split text at pattern matches, keeping every character"""
+        parts = []
+        start = 0
+        for match in pattern.finditer(text):
+            if match.end() > start:
+                parts.append(text[start:match.end()])
+                start = match.end()
+        parts.append(text[start:])
+        return [part for part in parts if part]
+
+def section_key(section):
+    """Identify a section by its content, ignoring differences in whitespace"""
+    return hashlib.sha256(WHITESPACE_RUN.sub(' ', section).strip().encode('utf-8')).hexdigest()[:24]
+
+def section_heading(section, max_length=80):
+    """First non-empty line of a section, shortened for display"""
+    heading = next((line.strip() for line in section.splitlines() if line.strip()), '')
+    return heading if len(heading) <= max_length else heading[:max_length - 1] + '…'
+
+def diff_sections(old_sections, new_sections, min_similarity=0.3):
+    """Compare two versions of a document section by section
+    
+    Returns one dict per section in document order with the change ('unchanged', 'modified',
+    'added' or 'removed'), the old and new section indexes and texts, and the word-level
+    similarity of modified sections. Replaced sections that share less than min_similarity
+    of their words are reported as a removal plus an addition.
+    """
+    old_keys = [section_key(section) for section in old_sections]
+    new_keys = [section_key(section) for section in new_sections]
+    changes = []
+    
+    def change(kind, old_index=None, new_index=None, similarity=None):
+        changes.append({
+            'change': kind,
+            'old_index': old_index,
+            'new_index': new_index,
+            'old_text': old_sections[old_index] if old_index is not None else None,
+            'new_text': new_sections[new_index] if new_index is not None else None,
+            'similarity': similarity
+        })
+    
+    matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == 'equal':
+            for offset in range(old_end - old_start):
+                change('unchanged', old_start + offset, new_start + offset, 1.0)
+            continue
+        
+        # Pair replaced sections in order; whatever is left over was deleted or inserted
+        old_index, new_index = old_start, new_start
+        while old_index < old_end and new_index < new_end:
+            similarity = difflib.SequenceMatcher(
+                None, old_sections[old_index].split(), new_sections[new_index].split(), autojunk=False
+            ).ratio()
+            if similarity >= min_similarity:
+                change('modified', old_index, new_index, round(similarity, 3))
+            else:
+                change('removed', old_index)
+                change('added', new_index=new_index)
+            old_index += 1
+            new_index += 1
+        for index in range(old_index, old_end):
+            change('removed', index)
+        for index in range(new_index, new_end):
+            change('added', new_index=index)
+    return changes
+
+class RateLimiter:
+    """Token-bucket scheduler that paces requests within requests-per-minute and tokens-per-minute quotas"""
+    
+    def __init__(self, requests_per_minute=15, tokens_per_minute=1000000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'tokens': 0, 'throttled': 0, 'rate_limited': 0}
+    
+    def _refill(self, now):
+        """Top up both buckets for the time elapsed since the last refill"""
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        # A quota under one request per minute still needs room in the bucket for a whole request
+        self._request_budget = min(max(1, self.requests_per_minute),
+                                   self._request_budget + elapsed * self.requests_per_minute / 60)
+        self._token_budget = min(self.tokens_per_minute, self._token_budget + elapsed * self.tokens_per_minute / 60)
+    
+    def acquire(self, tokens=0, timeout=None):
+        """Block until a request of the given token size fits in both budgets
+        
+        Returns False if the timeout expires first.
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        throttled = False
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                
+                if now >= self._paused_until and self._request_budget >= 1 and self._token_budget >= tokens:
+                    self._request_budget -= 1
+                    self._token_budget -= tokens
+                    self.stats['requests'] += 1
+                    self.stats['tokens'] += tokens
+                    if throttled:
+                        self.stats['throttled'] += 1
+                    return True
+                
+                # Work out how long until both buckets can cover this request
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._request_budget) * 60 / self.requests_per_minute,
+                    (tokens - self._token_budget) * 60 / self.tokens_per_minute,
+                    0.01
+                )
+            
+            throttled = True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+    
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Correct the token budget once the real token count of a request is known"""
+        with self._lock:
+            self._token_budget -= actual_tokens - estimated_tokens
+            self.stats['tokens'] += actual_tokens - estimated_tokens
+    
+    def pause(self, seconds):
+        """Hold back every caller after the server reports the quota is exhausted"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.stats['rate_limited'] += 1
+    
+    def get_stats(self):
+        """Get counters and the currently available budgets"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return dict(self.stats, 
+                        available_requests=int(self._request_budget), 
+                        available_tokens=int(self._token_budget))
+
+# One limiter per API key, shared by every GeminiIntegration using that key
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(api_key, requests_per_minute=15, tokens_per_minute=1000000):
+    """Get the shared rate limiter for an API key, creating it on first use"""
+    key_id = hashlib.sha256((api_key or '').encode()).hexdigest()
+    with _rate_limiters_lock:
+        if key_id not in _rate_limiters:
+            _rate_limiters[key_id] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _rate_limiters[key_id]
+
+# Messages reported by GeminiIntegration go to this list instead of its callbacks (see collect_messages)
+_collected_messages = contextvars.ContextVar('gemini_collected_messages', default=None)
+
+@contextmanager
+def collect_messages():
+    """Collect the warnings and errors GeminiIntegration reports in this context as (level, message) pairs
+    
+    Work the integration hands to its worker threads carries the context along. A shared integration
+    thus reports to whoever started the work, e.g. the session that shows the messages once its
+    results are ready, rather than to the callbacks of whichever session created it.
+    """
+    messages = []
+    token = _collected_messages.set(messages)
+    try:
+        yield messages
+    finally:
+        _collected_messages.reset(token)
+
+# Set by GeminiIntegration.map_concurrent for the work it fans out; once set, that work's Gemini requests
+# stop before their next attempt while other callers of a shared integration carry on
+_cancel_event = contextvars.ContextVar('gemini_cancel_event', default=None)
+
+# Usage metadata and streamed chunks of a LocalResponse, shaped like the Google client's
+LocalUsage = namedtuple('LocalUsage', ['prompt_token_count', 'candidates_token_count', 'total_token_count'])
+LocalChunk = namedtuple('LocalChunk', ['text'])
+
+class LocalModelError(Exception):
+    """Failure injected by a local model; code carries the HTTP status like the Google client's errors"""
+    
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+class LocalResponse:
+    """Reply of a local model: the full text, token usage and, for streams, the text in chunks"""
+    
+    def __init__(self, text, prompt_tokens, chunk_size=100, chunk_delay=0.0):
+        self.text = text
+        self.usage_metadata = LocalUsage(prompt_tokens, len(text) // 4 + 1, prompt_tokens + len(text) // 4 + 1)
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+    
+    def __iter__(self):
+        for start in range(0, len(self.text), self.chunk_size):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield LocalChunk(self.text[start:start + self.chunk_size])
+
+def recording_key(prompt, generation_config=None):
+    """Identify a request in a recording by its prompt and generation settings"""
+    config = json.dumps(generation_config or {}, sort_keys=True)
+    return hashlib.sha256(f"{config}\n{prompt}".encode('utf-8')).hexdigest()
+
+class LocalModel:
+    """Base for offline stand-ins of genai.GenerativeModel, with injected latency and failures
+    
+    Every reply waits latency seconds plus up to latency_jitter, then token_latency seconds per
+    output token (about 4 characters); streamed replies spread the token time over their chunks.
+    error_rate and rate_limit_rate are the fractions of requests failing with a 500 or a 429, and
+    quota_per_minute answers 429 to requests beyond that many in any 60 seconds, like an exhausted
+    API quota. Replies slower than the request timeout fail with a 504. seed makes the injected
+    delays and failures repeatable. Subclasses implement _respond.
+    """
+    
+    model_name = 'local'
+    
+    def __init__(self, latency=0.0, latency_jitter=0.0, token_latency=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 quota_per_minute=None, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.quota_per_minute = quota_per_minute
+        self._random = random.Random(seed)
+        self._recent_requests = deque()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'timeouts': 0, 'peak_concurrency': 0}
+    
+    def generate_content(self, prompt, generation_config=None, request_options=None, stream=False):
+        """Answer a prompt the way genai.GenerativeModel.generate_content does"""
+        timeout = (request_options or {}).get('timeout')
+        with self._lock:
+            now = time.monotonic()
+            self.stats['requests'] += 1
+            self._in_flight += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self._in_flight)
+            draw = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            
+            while self._recent_requests and now - self._recent_requests[0] >= 60:
+                self._recent_requests.popleft()
+            over_quota = self.quota_per_minute is not None and len(self._recent_requests) >= self.quota_per_minute
+            if not over_quota:
+                self._recent_requests.append(now)
+        
+        try:
+            if over_quota or draw < self.rate_limit_rate:
+                self._count('rate_limited')
+                raise LocalModelError(429, "Resource has been exhausted (e.g. check quota).")
+            if draw < self.rate_limit_rate + self.error_rate:
+                time.sleep(delay)
+                self._count('errors')
+                raise LocalModelError(500, "An internal error has occurred. Please retry.")
+            
+            text = self._respond(prompt, generation_config)
+            generation_time = self.token_latency * (len(text) // 4 + 1)
+            if timeout is not None and delay + (0 if stream else generation_time) > timeout:
+                time.sleep(timeout)
+                self._count('timeouts')
+                raise LocalModelError(504, "Deadline Exceeded")
+            time.sleep(delay if stream else delay + generation_time)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        
+        response = LocalResponse(text, len(prompt) // 4 + 1)
+        if stream:
+            response.chunk_delay = generation_time / max(1, math.ceil(len(text) / response.chunk_size))
+        return response
+    
+    def _count(self, counter):
+        with self._lock:
+            self.stats[counter] += 1
+    
+    def get_stats(self):
+        """Get request, failure and peak concurrency counters"""
+        with self._lock:
+            return dict(self.stats, in_flight=self._in_flight)
+    
+    def _respond(self, prompt, generation_config=None):
+        """Return the reply text for a prompt"""
+        raise NotImplementedError
+
+class FakeGeminiModel(LocalModel):
+    """Local model that answers the GeminiIntegration prompts without a network or API key
+    
+    Replies are schema-valid JSON (or plain text where the prompt asks for it) built from the
+    prompt's document with the basic analyzer: clauses, parties and entities are the ones the
+    regex patterns find, languages come from the local detector, and "translations" are the
+    source text tagged with the target language code, e.g. "[fr] ...". Output is deterministic.
+    """
+    
+    model_name = 'local-fake'
+    
+    def __init__(self, **faults):
+        super().__init__(**faults)
+        self._analyzer = None
+    
+    def _respond(self, prompt, generation_config=None):
+        if 'Translations (JSON array):' in prompt:
+            segments = json.loads(self._between(prompt, 'Segments:', 'Translations (JSON array):'))
+            return json.dumps([self._translate(prompt, segment) for segment in segments], ensure_ascii=False)
+        if 'Text to translate:' in prompt:
+            return self._translate(prompt, self._between(prompt, 'Text to translate:', 'Translation:'))
+        if 'Language code:' in prompt:
+            return detect_language_local(self._between(prompt, 'Text:', 'Language code:'))
+        if 'Entities (JSON):' in prompt:
+            return json.dumps(self._entities(self._between(prompt, 'Text:', 'Entities (JSON):')), ensure_ascii=False)
+        if 'Analysis (JSON format):' in prompt:
+            text = self._between(prompt, 'Legal Document Text:', 'Analysis (JSON format):')
+            if '"language": "ISO 639-1 code"' not in prompt:
+                return json.dumps(self._analysis(text), ensure_ascii=False)
+            return json.dumps({
+                'language': detect_language_local(text),
+                'analysis': self._analysis(text),
+                'entities': self._entities(text)
+            }, ensure_ascii=False)
+        raise LocalModelError(400, "Request contains an invalid argument: prompt not recognized by FakeGeminiModel")
+    
+    def _between(self, prompt, start_marker, end_marker):
+        """The part of a prompt after the first start_marker and before the last end_marker"""
+        start = prompt.index(start_marker) + len(start_marker)
+        return prompt[start:prompt.rindex(end_marker)].strip()
+    
+    def _translate(self, prompt, segment):
+        match = re.search(r' to (.+?)\. ', prompt)
+        names = {name: code for code, name in LANGUAGES.items()}
+        target_lang = names.get(match.group(1), 'en') if match else 'en'
+        return f"[{target_lang}] {segment}"
+    
+    def _entities(self, text):
+        entities = {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+        entities.update(_default_entity_extractor.extract_names(text))
+        return entities
+    
+    def _analysis(self, text):
+        if self._analyzer is None:
+            self._analyzer = LegalDocumentAnalyzer()
+        analysis = self._analyzer._basic_analysis(text)
+        analysis['clauses'] = {
+            clause_type.replace('_clauses', ''): found for clause_type, found in analysis['clauses'].items()
+        }
+        analysis.update({
+            "risks": [],
+            "obligations": [],
+            "jurisdiction": "Not specified",
+            "summary": f"Local fake analysis of {len(text.split())} words."
+        })
+        return analysis
+
+class RecordingModel:
+    """Wraps a real Gemini model and appends every prompt's reply to a JSON Lines file for ReplayModel
+    
+    It has a model name of its own, so replies cached from earlier runs under the real model's
+    name don't keep prompts from reaching the model and being recorded.
+    """
+    
+    model_name = f"{GEMINI_MODEL_NAME}-recording"
+    
+    def __init__(self, model, path):
+        self.model = model
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def generate_content(self, prompt, generation_config=None, request_options=None, stream=False):
+        response = self.model.generate_content(
+            prompt, generation_config=generation_config, request_options=request_options, stream=stream
+        )
+        if stream:
+            return self._record_stream(prompt, generation_config, response)
+        self._record(prompt, generation_config, response.text)
+        return response
+    
+    def _record_stream(self, prompt, generation_config, response):
+        received = []
+        for chunk in response:
+            received.append(chunk.text)
+            yield chunk
+        self._record(prompt, generation_config, ''.join(received))
+    
+    def _record(self, prompt, generation_config, text):
+        line = json.dumps({'key': recording_key(prompt, generation_config), 'text': text}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+
+class ReplayModel(LocalModel):
+    """Local model that answers with replies recorded by RecordingModel
+    
+    Prompts that were never recorded go to fallback (e.g. a FakeGeminiModel) when given and
+    otherwise fail with a 404. Latency and failures are injected as for any LocalModel.
+    """
+    
+    model_name = 'local-replay'
+    
+    def __init__(self, path, fallback=None, **faults):
+        super().__init__(**faults)
+        self.fallback = fallback
+        self.replies = {}
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    recorded = json.loads(line)
+                    self.replies[recorded['key']] = recorded['text']
+    
+    def _respond(self, prompt, generation_config=None):
+        reply = self.replies.get(recording_key(prompt, generation_config))
+        if reply is not None:
+            return reply
+        if self.fallback is not None:
+            return self.fallback._respond(prompt, generation_config)
+        raise LocalModelError(404, "No recorded reply for this prompt")
+
+class GeminiIntegration:
+    """Google Gemini AI integration for multilingual legal document analysis"""
+    
+    # HTTP status codes worth retrying: quota exhausted and transient server errors
+    RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+    # Source text sent per translation request, so the reply stays within the output token limit
+    TRANSLATION_BATCH_CHARS = 12000
+    
+    def __init__(self, api_key=None, cache=None, chunker=None, max_workers=4, max_concurrency=4, request_timeout=120,
+                 requests_per_minute=15, tokens_per_minute=1000000, max_retries=5, backoff_base=1.0, backoff_max=60.0,
+                 language_confidence=0.8, translation_memory=None, model=None, on_warning=None, on_error=None):
+        self.api_key = api_key
+        self.on_warning = self._reporter('warning', on_warning or logger.warning)
+        self.on_error = self._reporter('error', on_error or logger.error)
+        self.model = None
+        self.model_name = GEMINI_MODEL_NAME
+        self.is_configured = False
+        self.cache = cache if cache is not None else AnalysisCache()
+        self.translation_memory = (translation_memory if translation_memory is not None
+                                   else TranslationMemory(self.cache.db_path))
+        self.chunker = chunker or DocumentChunker()
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Local language detections below this confidence are checked with Gemini
+        self.language_confidence = language_confidence
+        self.rate_limiter = get_rate_limiter(api_key, requests_per_minute, tokens_per_minute)
+        
+        # Caps the number of Gemini requests in flight across all threads using this integration
+        self._request_slots = threading.BoundedSemaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gemini')
+        
+        if model is not None:
+            self.use_model(model)
+        elif api_key:
+            self.configure_gemini(api_key)
+    
+    def configure_gemini(self, api_key):
+        """Configure Gemini AI with API key"""
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(self.model_name)
+            self.api_key = api_key
+            self.rate_limiter = get_rate_limiter(api_key, self.requests_per_minute, self.tokens_per_minute)
+            self.is_configured = True
+            return True, "Gemini AI configured successfully!"
+        except Exception as e:
+            self.is_configured = False
+            return False, f"Failed to configure Gemini: {str(e)}"
+    
+    def use_model(self, model):
+        """Send requests to another model object, e.g. a FakeGeminiModel, ReplayModel or RecordingModel
+        
+        No API key is needed. Cached results and translation memory are kept under the model's own
+        name, so replies from a local model never mix with real Gemini output.
+        """
+        self.model = model
+        self.model_name = getattr(model, 'model_name', self.model_name)
+        self.is_configured = True
+    
+    def _generate(self, prompt, generation_config=None, stream=False):
+        """Send one request to Gemini, paced by the rate limiter and retried on quota/server errors
+        
+        With stream, the response is returned before generation finishes; iterate it for text chunks.
+        """
+        # Rough token estimate (~4 characters per token), corrected from usage metadata afterwards
+        estimated_tokens = len(prompt) // 4 + 1
+        
+        for attempt in range(self.max_retries + 1):
+            self._check_cancelled()
+            self.rate_limiter.acquire(estimated_tokens)
+            
+            if not self._acquire_slot():
+                # Every slot stayed busy (slow or hung requests); back off and retry like a server error
+                if attempt >= self.max_retries:
+                    raise TimeoutError("Timed out waiting for a free Gemini request slot")
+                self._backoff(attempt)
+                continue
+            try:
+                self._check_cancelled()
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config=generation_config,
+                    request_options={"timeout": self.request_timeout},
+                    stream=stream
+                )
+            except Exception as e:
+                status = self._error_status(e)
+                if attempt >= self.max_retries or status not in self.RETRYABLE_STATUS_CODES:
+                    raise
+                self._backoff(attempt, pause_all=status == 429)
+                continue
+            finally:
+                self._request_slots.release()
+            
+            # Streamed responses only report usage once fully read
+            usage = None if stream else getattr(response, 'usage_metadata', None)
+            actual_tokens = getattr(usage, 'total_token_count', None)
+            if isinstance(actual_tokens, int) and actual_tokens > 0:
+                self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
+            return response
+    
+    def _acquire_slot(self):
+        """Wait up to request_timeout for a request slot, giving up early if the caller's work is cancelled"""
+        deadline = time.monotonic() + self.request_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._request_slots.acquire(timeout=min(remaining, 0.5)):
+                return True
+            self._check_cancelled()
+    
+    def _backoff(self, attempt, pause_all=False):
+        """Sleep before a retry with full-jitter exponential backoff; pause_all holds back every caller of the key"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if pause_all:
+            self.rate_limiter.pause(delay)
+        time.sleep(delay)
+    
+    def _check_cancelled(self):
+        """Raise CancelledError if the map_concurrent call this work belongs to was cancelled or timed out"""
+        cancel_event = _cancel_event.get()
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("Gemini request cancelled")
+    
+    def _error_status(self, error):
+        """Extract an HTTP status code from a Gemini client exception, if there is one"""
+        code = getattr(error, 'code', None)
+        if isinstance(code, int):
+            return code
+        message = str(error)
+        for status in self.RETRYABLE_STATUS_CODES:
+            if message.startswith(str(status)) or f" {status} " in f" {message} ":
+                return status
+        if any(marker in message.lower() for marker in ('quota', 'rate limit', 'resource_exhausted', 'resource exhausted')):
+            return 429
+        return None
+    
+    def _reporter(self, level, callback):
+        """Route messages to the caller's collect_messages list when there is one, else to callback"""
+        def report(message):
+            messages = _collected_messages.get()
+            if messages is None:
+                callback(message)
+            else:
+                messages.append((level, message))
+        return report
+    
+    def _in_context(self, fn):
+        """Wrap fn to run in a copy of the caller's context, so worker threads report to its collect_messages"""
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+    
+    def submit(self, fn, *args, **kwargs):
+        """Run a call on the shared worker pool and return its Future"""
+        return self.executor.submit(self._in_context(fn), *args, **kwargs)
+    
+    def map_concurrent(self, fn, items, timeout=None, cancel=None):
+        """Apply fn to every item concurrently on the worker pool, returning results in input order
+        
+        cancel is an optional threading.Event the caller sets to abandon the call. When it is set, the
+        timeout expires or a call fails, calls that have not started are cancelled and Gemini requests
+        made by the running ones stop before their next attempt; CancelledError, TimeoutError or the
+        call's exception is then raised. Only this call's work is stopped, so it is safe to use on an
+        integration shared between sessions.
+        """
+        stop = threading.Event()
+        token = _cancel_event.set(stop)
+        try:
+            futures = [self.submit(fn, item) for item in items]
+        finally:
+            _cancel_event.reset(token)
+        
+        deadline = None if timeout is None else time.monotonic() + timeout
+        pending = futures
+        try:
+            while pending:
+                if cancel is not None and cancel.is_set():
+                    raise CancelledError("Gemini fan-out cancelled")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Gemini fan-out did not finish within {timeout} seconds")
+                # Wake up regularly to notice the caller's cancel event
+                done, pending = wait(pending, timeout=0.1 if remaining is None else min(remaining, 0.1),
+                                     return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+            return [future.result() for future in futures]
+        except BaseException:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+    
+    def detect_language(self, text):
+        """Detect language locally, asking Gemini only when the local detector is unsure"""
+        local_lang, confidence = _default_language_detector.detect(text)
+        if confidence >= self.language_confidence or not self.is_configured:
+            return local_lang
+        
+        try:
+            prompt = f"""
+            Detect the primary language of the following text and return only the ISO 639-1 language code (e.g., 'en' for English, 'es' for Spanish, 'fr' for French):
+            
+            Text: {text[:500]}
+            
+            Language code:
+            """
+            
+            response = self._generate(prompt)
+            detected_lang = response.text.strip().lower()
+            
+            # Validate the response
+            if detected_lang in LANGUAGES:
+                return detected_lang
+            else:
+                return local_lang
+        except Exception as e:
+            self.on_warning(f"Gemini language detection failed: {str(e)}")
+            return local_lang
+    
+    def translate_text(self, text, target_lang, source_lang=None):
+        """Translate text using Gemini AI
+        
+        Segments already in the translation memory are reused; see iter_translation. Segments
+        that could not be translated are left in the original language.
+        """
+        if not self.is_configured:
+            return text  # Return original text if Gemini not configured
+        
+        cache_key = self.cache.make_key('translation', text, self.model_name, target_lang, source_lang)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        source_lang = source_lang or detect_language_local(text)
+        segments = self.chunker.split_segments(text)
+        translated = {}
+        for index, translation, complete in self.iter_translation(segments, target_lang, source_lang):
+            if complete:
+                translated[index] = translation
+        translation = ''.join(translated.get(index, segment) for index, segment in enumerate(segments))
+        
+        if len(translated) == len(segments):
+            self.cache.set(cache_key, 'translation', translation)
+        return translation
+    
+    def iter_translation(self, segments, target_lang, source_lang):
+        """Translate ordered segments (from chunker.split_segments), yielding results as they arrive
+        
+        Yields (index, translation, complete) tuples; translations keep the segment's surrounding
+        whitespace, so joining the final translation of every segment in index order rebuilds the
+        document. Segments in the translation memory or without letters come first. The first
+        remaining segment is streamed from Gemini as it is generated (complete=False updates),
+        while the rest are translated concurrently in batches that start small and grow, so the
+        opening paragraphs arrive quickly. Segments that fail are never yielded as complete.
+        """
+        def rewrap(index, translation):
+            segment = segments[index]
+            return segment[:len(segment) - len(segment.lstrip())] + translation + segment[len(segment.rstrip()):]
+        
+        # Segments without letters (numbering, amounts, blank lines) are kept as they are
+        keys = [
+            self.translation_memory.make_key(segment, self.model_name, target_lang, source_lang)
+            if LETTER.search(segment) else None
+            for segment in segments
+        ]
+        remembered = self.translation_memory.get_many(key for key in keys if key)
+        
+        missing = {}
+        for index, key in enumerate(keys):
+            if key is None:
+                yield index, segments[index], True
+            elif key in remembered:
+                yield index, rewrap(index, remembered[key]), True
+            else:
+                missing.setdefault(key, []).append(index)
+        if not missing:
+            return
+        
+        events = queue.Queue()
+        items = [(key, segments[indexes[0]].strip()) for key, indexes in missing.items()]
+        
+        def stream_first():
+            key, segment = items[0]
+            for translation, complete in self._stream_segment(key, segment, target_lang, source_lang):
+                events.put(({key: translation}, complete))
+        
+        def translate_batch(batch):
+            events.put((self._translate_segments(batch, target_lang, source_lang), True))
+        
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='translation')
+        try:
+            futures = [executor.submit(self._in_context(stream_first))]
+            futures.extend(executor.submit(self._in_context(translate_batch), batch)
+                           for batch in self._pack_segments(items[1:]))
+            for future in futures:
+                future.add_done_callback(lambda future: events.put(None))
+            
+            finished = 0
+            while finished < len(futures):
+                event = events.get()
+                if event is None:
+                    finished += 1
+                    continue
+                translations, complete = event
+                for key, translation in translations.items():
+                    for index in missing[key]:
+                        yield index, rewrap(index, translation), complete
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _pack_segments(self, items, first_batch_chars=2000):
+        """Group (key, segment) pairs into batches of at most TRANSLATION_BATCH_CHARS characters
+        
+        The first batch holds about first_batch_chars and each following one twice the last, so
+        the start of a document comes back quickly without sending the rest in tiny requests.
+        """
+        batches = []
+        current = []
+        current_len = 0
+        budget = min(first_batch_chars, self.TRANSLATION_BATCH_CHARS)
+        for key, segment in items:
+            if current and current_len + len(segment) > budget:
+                batches.append(current)
+                current = []
+                current_len = 0
+                budget = min(budget * 2, self.TRANSLATION_BATCH_CHARS)
+            current.append((key, segment))
+            current_len += len(segment)
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _stream_segment(self, key, segment, target_lang, source_lang):
+        """Translate one segment with a streamed response, yielding (translation so far, complete)
+        
+        The finished translation is added to the translation memory.
+        """
+        source_lang_name = LANGUAGES.get(source_lang, 'auto-detect') if source_lang else 'auto-detect'
+        target_lang_name = LANGUAGES.get(target_lang, 'English')
+        prompt = f"""
+        Translate the following legal document text from {source_lang_name} to {target_lang_name}. 
+        Preserve legal terminology and maintain the formal tone. Ensure accuracy of legal concepts:
+        
+        Text to translate: {segment}
+        
+        Translation:
+        """
+        
+        try:
+            received = []
+            for chunk in self._generate(prompt, stream=True):
+                received.append(chunk.text)
+                yield ''.join(received).strip(), False
+        except Exception as e:
+            self.on_warning(f"Gemini translation failed: {str(e)}")
+            return
+        
+        translation = ''.join(received).strip()
+        self.translation_memory.put_many([(key, source_lang, target_lang, translation)])
+        yield translation, True
+    
+    def _translate_segments(self, batch, target_lang, source_lang):
+        """Translate a batch of (key, segment) pairs in one request and add them to the translation memory
+        
+        Returns {key: translation}. If the reply does not line up with the batch, segments are
+        translated one request at a time instead.
+        """
+        source_lang_name = LANGUAGES.get(source_lang, 'auto-detect') if source_lang else 'auto-detect'
+        target_lang_name = LANGUAGES.get(target_lang, 'English')
+        translations = {}
+        
+        if len(batch) > 1:
+            try:
+                prompt = f"""
+                Translate each legal text segment in the JSON array below from {source_lang_name} to {target_lang_name}. 
+                Preserve legal terminology and maintain the formal tone. Ensure accuracy of legal concepts.
+                Return only a JSON array with exactly {len(batch)} translated strings, in the same order.
+                
+                Segments: {json.dumps([segment for _, segment in batch], ensure_ascii=False)}
+                
+                Translations (JSON array):
+                """
+                
+                response = self._generate(prompt, generation_config={"response_mime_type": "application/json"})
+                translated = json.loads(response.text)
+                if (isinstance(translated, list) and len(translated) == len(batch)
+                        and all(isinstance(item, str) for item in translated)):
+                    translations = {key: item.strip() for (key, _), item in zip(batch, translated)}
+            except Exception as e:
+                self.on_warning(f"Gemini batch translation failed, translating segments one by one: {str(e)}")
+        
+        if not translations:
+            for key, segment in batch:
+                try:
+                    prompt = f"""
+                    Translate the following legal document text from {source_lang_name} to {target_lang_name}. 
+                    Preserve legal terminology and maintain the formal tone. Ensure accuracy of legal concepts:
+                    
+                    Text to translate: {segment}
+                    
+                    Translation:
+                    """
+                    
+                    translations[key] = self._generate(prompt).text.strip()
+                except Exception as e:
+                    self.on_warning(f"Gemini translation failed: {str(e)}")
+        
+        if translations:
+            self.translation_memory.put_many(
+                (key, source_lang, target_lang, translation) for key, translation in translations.items()
+            )
+        return translations
+    
+    def analyze_legal_document(self, text, target_lang='en'):
+        """Comprehensive legal document analysis using Gemini AI"""
+        if not self.is_configured:
+            return self._fallback_analysis(text)
+        
+        if self.chunker.needs_chunking(text):
+            results = self._map_chunks(self._analyze_legal_chunk, self.chunker.split(text), target_lang)
+            return self._merge_analyses(results)
+        return self._analyze_legal_chunk(text, target_lang)
+    
+    def _analyze_legal_chunk(self, text, target_lang='en'):
+        """Analyze a single prompt-sized piece of a legal document"""
+        cache_key = self.cache.make_key('analysis', text, self.model_name, target_lang)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            prompt = f"""
+            Analyze the following legal document and provide a comprehensive analysis in {LANGUAGES.get(target_lang, 'English')}. 
+            
+            Please provide:
+            1. Document type and purpose
+            2. Key parties involved (names, organizations)
+            3. Important dates and deadlines
+            4. Financial terms and amounts
+            5. Key legal clauses (termination, confidentiality, indemnity, payment, dispute resolution)
+            6. Potential risks and liabilities
+            7. Key obligations for each party
+            8. Jurisdiction and governing law
+            9. Document summary
+            
+            Format the response as JSON with the following structure:
+            {{
+                "document_type": "string",
+                "parties": ["list of parties"],
+                "dates": ["list of important dates"],
+                "financial_terms": ["list of amounts and terms"],
+                "clauses": {{
+                    "termination": ["termination clauses"],
+                    "confidentiality": ["confidentiality clauses"],
+                    "indemnity": ["indemnity clauses"],
+                    "payment": ["payment clauses"],
+                    "dispute_resolution": ["dispute resolution clauses"]
+                }},
+                "risks": ["list of potential risks"],
+                "obligations": ["list of key obligations"],
+                "jurisdiction": "string",
+                "summary": "comprehensive summary"
+            }}
+            
+            Legal Document Text:
+            {text}
+            
+            Analysis (JSON format):
+            """
+            
+            response = self._generate(prompt)
+            
+            # Try to parse JSON response
+            try:
+                analysis = json.loads(response.text)
+                self.cache.set(cache_key, 'analysis', analysis)
+                return analysis
+            except json.JSONDecodeError:
+                # If JSON parsing fails, return structured text analysis
+                return {
+                    "document_type": "Legal Document",
+                    "parties": [],
+                    "dates": [],
+                    "financial_terms": [],
+                    "clauses": {
+                        "termination": [],
+                        "confidentiality": [],
+                        "indemnity": [],
+                        "payment": [],
+                        "dispute_resolution": []
+                    },
+                    "risks": [],
+                    "obligations": [],
+                    "jurisdiction": "Not specified",
+                    "summary": response.text[:1000] + "..." if len(response.text) > 1000 else response.text
+                }
+        
+        except Exception as e:
+            self.on_error(f"Gemini analysis failed: {str(e)}")
+            return self._fallback_analysis(text)
+    
+    def _fallback_analysis(self, text):
+        """Fallback analysis when Gemini is not available"""
+        return {
+            "document_type": "Legal Document",
+            "parties": [],
+            "dates": [],
+            "financial_terms": [],
+            "clauses": {
+                "termination": [],
+                "confidentiality": [],
+                "indemnity": [],
+                "payment": [],
+                "dispute_resolution": []
+            },
+            "risks": [],
+            "obligations": [],
+            "jurisdiction": "Analysis requires Gemini AI configuration",
+            "summary": "Please configure Gemini AI for detailed analysis."
+        }
+    
+    def extract_entities_advanced(self, text, target_lang='en'):
+        """Advanced entity extraction using Gemini AI"""
+        if not self.is_configured:
+            return {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+        
+        if self.chunker.needs_chunking(text):
+            results = self._map_chunks(self._extract_entities_chunk, self.chunker.split(text), target_lang)
+            return self._merge_entities(results)
+        return self._extract_entities_chunk(text, target_lang)
+    
+    def _extract_entities_chunk(self, text, target_lang='en'):
+        """Extract entities from a single prompt-sized piece of a legal document"""
+        cache_key = self.cache.make_key('entities', text, self.model_name, target_lang)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            prompt = f"""
+            Extract the following entities from the legal document text. Respond in {LANGUAGES.get(target_lang, 'English')}:
+            
+            1. PERSONS: Names of individuals
+            2. ORGANIZATIONS: Company names, institutions
+            3. DATES: All dates mentioned
+            4. MONEY: Financial amounts, currencies
+            5. LOCATIONS: Places, addresses, jurisdictions
+            
+            Format as JSON:
+            {{
+                "PERSONS": ["list of person names"],
+                "ORGANIZATIONS": ["list of organizations"],
+                "DATES": ["list of dates"],
+                "MONEY": ["list of monetary amounts"],
+                "LOCATIONS": ["list of locations"]
+            }}
+            
+            Text: {text}
+            
+            Entities (JSON):
+            """
+            
+            response = self._generate(prompt)
+            
+            try:
+                entities = json.loads(response.text)
+                self.cache.set(cache_key, 'entities', entities)
+                return entities
+            except json.JSONDecodeError:
+                return {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+        
+        except Exception as e:
+            self.on_warning(f"Gemini entity extraction failed: {str(e)}")
+            return {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+    
+    def analyze_combined(self, text, target_lang='en'):
+        """Detect language, analyze and extract entities in a single Gemini call"""
+        if not self.is_configured:
+            return {
+                "language": self.detect_language(text),
+                "analysis": self._fallback_analysis(text),
+                "entities": {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+            }
+        
+        if self.chunker.needs_chunking(text):
+            chunks = self.chunker.split(text)
+            results = self._map_chunks(self._analyze_combined_chunk, chunks, target_lang)
+            return self._merge_combined(results, [len(chunk) for chunk in chunks])
+        return self._analyze_combined_chunk(text, target_lang)
+    
+    def analyze_combined_stream(self, pieces, target_lang='en'):
+        """Run the combined analysis over a text stream, starting on each chunk as soon as it is complete
+        
+        Returns (text, combined_result) where text is the full reassembled document.
+        """
+        received = []
+        
+        def collect():
+            for piece in pieces:
+                received.append(piece)
+                yield piece
+        
+        if not self.is_configured:
+            text = ''.join(collect())
+            return text, self.analyze_combined(text, target_lang)
+        
+        chunks = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk in self.chunker.iter_chunks(collect()):
+                chunks.append(chunk)
+                futures.append(executor.submit(self._in_context(self._analyze_combined_chunk), chunk, target_lang))
+            results = [future.result() for future in futures]
+        
+        text = ''.join(received)
+        if not results:
+            return text, {
+                "language": detect_language_local(text),
+                "analysis": self._fallback_analysis(text),
+                "entities": {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+            }
+        if len(results) == 1:
+            return text, results[0]
+        return text, self._merge_combined(results, [len(chunk) for chunk in chunks])
+    
+    def analyze_sections(self, sections, target_lang='en', previous_units=None, max_unit_chars=8000):
+        """Run the combined analysis over a document split into sections, reusing an earlier version's results
+        
+        Sections are analyzed in units of consecutive sections up to max_unit_chars. A unit from
+        previous_units whose sections all reappear unchanged and in order keeps its result; only the
+        remaining sections are packed into new units and sent to Gemini, so an amendment costs about
+        as much as the text it changes. Returns (combined_result, units, reanalyzed_chars); pass the
+        units back in when the next version arrives.
+        """
+        keys = [section_key(section) for section in sections]
+        units_by_first_key = {}
+        for unit in previous_units or []:
+            units_by_first_key.setdefault(unit['sections'][0], []).append(unit)
+        
+        units = []
+        pending = []
+        
+        def pack_pending():
+            current = []
+            current_len = 0
+            for index in pending:
+                if current and current_len + len(sections[index]) > max_unit_chars:
+                    units.append({'indexes': current})
+                    current = []
+                    current_len = 0
+                current.append(index)
+                current_len += len(sections[index])
+            if current:
+                units.append({'indexes': current})
+            pending.clear()
+        
+        position = 0
+        while position < len(keys):
+            candidates = [
+                unit for unit in units_by_first_key.get(keys[position], [])
+                if keys[position:position + len(unit['sections'])] == unit['sections']
+            ]
+            if not candidates:
+                pending.append(position)
+                position += 1
+                continue
+            pack_pending()
+            reused = max(candidates, key=lambda unit: len(unit['sections']))
+            units.append({'indexes': list(range(position, position + len(reused['sections']))), 'result': reused['result']})
+            position += len(reused['sections'])
+        pack_pending()
+        
+        new_units = [unit for unit in units if 'result' not in unit]
+        new_texts = [''.join(sections[index] for index in unit['indexes']) for unit in new_units]
+        if new_texts:
+            for unit, result in zip(new_units, self._map_chunks(self._analyze_combined_chunk, new_texts, target_lang)):
+                unit['result'] = result
+        
+        sizes = [sum(len(sections[index]) for index in unit['indexes']) for unit in units]
+        units = [
+            {'sections': [keys[index] for index in unit['indexes']], 'chars': size, 'result': unit['result']}
+            for unit, size in zip(units, sizes)
+        ]
+        if not units:
+            text = ''.join(sections)
+            return self.analyze_combined(text, target_lang), units, 0
+        combined = units[0]['result'] if len(units) == 1 else self._merge_combined(
+            [unit['result'] for unit in units], sizes
+        )
+        return combined, units, sum(len(text) for text in new_texts)
+    
+    def _merge_combined(self, results, sizes):
+        """Merge per-chunk combined results; the language is the one covering the most text
+        
+        sizes holds the length of the text behind each result.
+        """
+        chunk_sizes = Counter()
+        for result, size in zip(results, sizes):
+            chunk_sizes[result['language']] += size
+        return {
+            "language": chunk_sizes.most_common(1)[0][0],
+            "analysis": self._merge_analyses([result['analysis'] for result in results]),
+            "entities": self._merge_entities([result['entities'] for result in results])
+        }
+    
+    def _analyze_combined_chunk(self, text, target_lang='en'):
+        """Run the combined analysis on a single prompt-sized piece of a legal document"""
+        cache_key = self.cache.make_key('combined', text, self.model_name, target_lang)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            prompt = f"""
+            Analyze the following legal document. Write all analysis and entity values in {LANGUAGES.get(target_lang, 'English')}.
+            
+            Please provide:
+            1. The ISO 639-1 code of the document's primary language (e.g., 'en', 'es', 'fr')
+            2. Document type and purpose
+            3. Key parties involved (names, organizations)
+            4. Important dates and deadlines
+            5. Financial terms and amounts
+            6. Key legal clauses (termination, confidentiality, indemnity, payment, dispute resolution)
+            7. Potential risks and liabilities
+            8. Key obligations for each party
+            9. Jurisdiction and governing law
+            10. Document summary
+            11. Named entities: persons, organizations, dates, monetary amounts, locations
+            
+            Format the response as JSON with the following structure:
+            {{
+                "language": "ISO 639-1 code",
+                "analysis": {{
+                    "document_type": "string",
+                    "parties": ["list of parties"],
+                    "dates": ["list of important dates"],
+                    "financial_terms": ["list of amounts and terms"],
+                    "clauses": {{
+                        "termination": ["termination clauses"],
+                        "confidentiality": ["confidentiality clauses"],
+                        "indemnity": ["indemnity clauses"],
+                        "payment": ["payment clauses"],
+                        "dispute_resolution": ["dispute resolution clauses"]
+                    }},
+                    "risks": ["list of potential risks"],
+                    "obligations": ["list of key obligations"],
+                    "jurisdiction": "string",
+                    "summary": "comprehensive summary"
+                }},
+                "entities": {{
+                    "PERSONS": ["list of person names"],
+                    "ORGANIZATIONS": ["list of organizations"],
+                    "DATES": ["list of dates"],
+                    "MONEY": ["list of monetary amounts"],
+                    "LOCATIONS": ["list of locations"]
+                }}
+            }}
+            
+            Legal Document Text:
+            {text}
+            
+            Analysis (JSON format):
+            """
+            
+            try:
+                response = self._generate(
+                    prompt,
+                    generation_config={"response_mime_type": "application/json"}
+                )
+            except Exception as e:
+                # The request failed after its retries (quota, outage); separate calls would only add load
+                self.on_warning(f"Gemini combined analysis failed: {str(e)}")
+                return self._unavailable_result(text, e)
+            combined = json.loads(response.text)
+            
+            # Fill in anything the model left out so callers can rely on the schema
+            language = str(combined.get('language', '')).strip().lower()
+            if language not in LANGUAGES:
+                language = detect_language_local(text)
+            
+            analysis = self._fallback_analysis(text)
+            analysis.update({"jurisdiction": "Not specified", "summary": "Analysis completed"})
+            analysis.update(combined.get('analysis') or {})
+            entities = {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+            entities.update(combined.get('entities') or {})
+            
+            result = {"language": language, "analysis": analysis, "entities": entities}
+            self.cache.set(cache_key, 'combined', result)
+            return result
+        
+        except Exception as e:
+            self.on_warning(f"Gemini combined analysis returned an unusable response, falling back to separate calls: {str(e)}")
+            return {
+                "language": self.detect_language(text),
+                "analysis": self._analyze_legal_chunk(text, target_lang),
+                "entities": self._extract_entities_chunk(text, target_lang)
+            }
+    
+    def _unavailable_result(self, text, error):
+        """Combined result built locally, without more requests, when Gemini could not answer"""
+        reason = "Gemini quota exhausted" if self._error_status(error) == 429 else "Gemini request failed"
+        analysis = self._fallback_analysis(text)
+        analysis.update({
+            "jurisdiction": "Not specified",
+            "summary": f"{reason}; only local entity extraction was performed. Try again later."
+        })
+        entities = {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+        entities.update(_default_entity_extractor.extract_names(text))
+        return {"language": detect_language_local(text), "analysis": analysis, "entities": entities}
+    
+    def _map_chunks(self, analyze_chunk, chunks, target_lang):
+        """Run a per-chunk analysis over every chunk in parallel, preserving order"""
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            return list(executor.map(self._in_context(lambda chunk: analyze_chunk(chunk, target_lang)), chunks))
+    
+    def _dedupe(self, items):
+        """Deduplicate list items case- and whitespace-insensitively, keeping first-seen order"""
+        seen = set()
+        unique = []
+        for item in items:
+            key = re.sub(r'\s+', ' ', str(item)).strip().lower()
+            if key and key not in seen:
+                seen.add(key)
+                unique.append(item)
+        return unique
+    
+    def _merge_analyses(self, results):
+        """Merge per-chunk analysis results into the single-document result schema"""
+        merged = self._fallback_analysis('')
+        merged['jurisdiction'] = 'Not specified'
+        
+        for key in ['parties', 'dates', 'financial_terms', 'risks', 'obligations']:
+            merged[key] = self._dedupe(item for result in results for item in (result.get(key) or []))
+        
+        clause_types = list(merged['clauses'])
+        for result in results:
+            clause_types.extend(k for k in (result.get('clauses') or {}) if k not in clause_types)
+        merged['clauses'] = {
+            clause_type: self._dedupe(
+                clause for result in results for clause in ((result.get('clauses') or {}).get(clause_type) or [])
+            )
+            for clause_type in clause_types
+        }
+        
+        document_types = Counter(
+            result.get('document_type') for result in results
+            if result.get('document_type') and result.get('document_type') != 'Legal Document'
+        )
+        if document_types:
+            merged['document_type'] = document_types.most_common(1)[0][0]
+        
+        for result in results:
+            jurisdiction = result.get('jurisdiction')
+            if jurisdiction and jurisdiction not in ('Not specified', 'Not detected'):
+                merged['jurisdiction'] = jurisdiction
+                break
+        
+        summaries = self._dedupe(result.get('summary') for result in results if result.get('summary'))
+        merged['summary'] = ' '.join(summaries) if summaries else 'Analysis completed'
+        return merged
+    
+    def _merge_entities(self, results):
+        """Merge per-chunk entity results, deduplicating within each entity type"""
+        merged = {"PERSONS": [], "ORGANIZATIONS": [], "DATES": [], "MONEY": [], "LOCATIONS": []}
+        for result in results:
+            for entity_type, entity_list in result.items():
+                merged.setdefault(entity_type, []).extend(entity_list or [])
+        return {entity_type: self._dedupe(entity_list) for entity_type, entity_list in merged.items()}
+
+# One configured Gemini client per API key, shared by every session in the process
+_gemini_integrations = {}
+_gemini_integrations_lock = threading.Lock()
+
+def get_gemini_integration(api_key):
+    """Get the shared Gemini integration for an API key, creating it on first use
+    
+    Clients that fail to configure are returned but not kept, so a corrected key or a
+    transient failure is retried on the next call. The shared client only logs problems;
+    callers that want to show them wrap their calls in collect_messages.
+    """
+    key_id = hashlib.sha256((api_key or '').encode()).hexdigest()
+    with _gemini_integrations_lock:
+        gemini_integration = _gemini_integrations.get(key_id)
+        if gemini_integration is None:
+            gemini_integration = GeminiIntegration(api_key)
+            if gemini_integration.is_configured:
+                _gemini_integrations[key_id] = gemini_integration
+        return gemini_integration
+
+# Trailing version markers: v7, rev 2, (3), final, draft, redline, 2024-05-01 ...
+VERSION_SUFFIX = re.compile(
+    r'(?:[\s_.-]*\(\d+\)|[\s_.-]+\(?(?:v|ver|version|rev|revision|draft|redline|amended|final|clean|copy)'
+    r'[\s_.-]*\d*(?:\.\d+)*\)?|[\s_.-]+(?:\d{4}-\d{2}-\d{2}|\d{8}))+$',
+    re.IGNORECASE
+)
+
+def document_family(document_name):
+    """Name shared by every version of a document: no extension, version markers or separators"""
+    stem = os.path.splitext(document_name or '')[0]
+    family = VERSION_SUFFIX.sub('', stem) or stem
+    return re.sub(r'[\s_.-]+', ' ', family).strip().lower()
+
+class UserManager:
+    """User management system with database integration"""
+    
+    # analysis_stats dimension -> analysis_history column it groups by
+    STATS_DIMENSIONS = {
+        'total': "'all'",
+        'document_type': 'document_type',
+        'original_language': 'original_language',
+        'target_language': 'target_language'
+    }
+    # Words left out of search queries, so questions like "which contracts mention Acme" find documents.
+    # "clause" is here too: every analysis with a clause category has it indexed, so it can't rank anything
+    SEARCH_STOPWORDS = frozenset('''
+        a about all an and any are as at be by can clause clauses contain containing contains could did do
+        does find for from had has have how i in include includes including is it its list me mention
+        mentioning mentions my named of on or our show some that the their them these this those to was
+        were what when where which who whose why will with would you your
+    '''.split())
+    
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.pool = get_connection_pool(db_path)
+        self.pool.ensure_schema('users', self.init_database)
+    
+    def init_database(self):
+        """Initialize SQLite database for user management"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id TEXT PRIMARY KEY,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    email TEXT,
+                    full_name TEXT,
+                    organization TEXT,
+                    created_date TEXT,
+                    last_login TEXT,
+                    gemini_api_key TEXT
+                )
+            ''')
+            
+            # Analysis history table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_history (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    document_name TEXT,
+                    analysis_date TEXT,
+                    document_type TEXT,
+                    word_count INTEGER,
+                    original_language TEXT,
+                    target_language TEXT,
+                    summary TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+            # Serves newest-first history pages without scanning or sorting other users' rows
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_history_user_date
+                ON analysis_history (user_id, analysis_date DESC, id DESC)
+            ''')
+            
+            # Running per-user totals, kept up to date by save_analysis so dashboard metrics
+            # cost the same whether a user has ten analyses or hundreds of thousands
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_stats (
+                    user_id TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    analyses INTEGER NOT NULL DEFAULT 0,
+                    words INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, dimension, value)
+                )
+            ''')
+            cursor.execute('SELECT 1 FROM analysis_stats LIMIT 1')
+            if cursor.fetchone() is None:
+                self._rebuild_stats(cursor)
+            
+            # Full-text index over each analysis; rowids are not stable, so rows carry their analysis id
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'analysis_search'")
+            search_index_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS analysis_search USING fts5(
+                    analysis_id UNINDEXED,
+                    user_id UNINDEXED,
+                    document_name,
+                    summary,
+                    parties,
+                    clauses,
+                    entities,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            ''')
+            if not search_index_exists:
+                # Older rows only have a name and summary to index
+                cursor.execute('''
+                    INSERT INTO analysis_search (analysis_id, user_id, document_name, summary, parties, clauses, entities)
+                    SELECT id, user_id, document_name, summary, '', '', '' FROM analysis_history
+                ''')
+            
+            # Full results, zlib-compressed JSON keyed by content hash so identical results are stored once
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_results (
+                    content_hash TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    stored_bytes INTEGER NOT NULL
+                )
+            ''')
+            cursor.execute('PRAGMA table_info(analysis_history)')
+            history_columns = {column[1] for column in cursor.fetchall()}
+            if 'content_hash' not in history_columns:
+                cursor.execute('ALTER TABLE analysis_history ADD COLUMN content_hash TEXT')
+            
+            # Versions of the same document share a family name, e.g. Agreement_v6.docx and Agreement_v7.docx
+            if 'document_family' not in history_columns:
+                cursor.execute('ALTER TABLE analysis_history ADD COLUMN document_family TEXT')
+                cursor.execute('SELECT id, document_name FROM analysis_history')
+                cursor.executemany('UPDATE analysis_history SET document_family = ? WHERE id = ?',
+                                   [(document_family(name), analysis_id) for analysis_id, name in cursor.fetchall()])
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_analysis_history_family
+                ON analysis_history (user_id, document_family, analysis_date DESC)
+            ''')
+    
+    def _rebuild_stats(self, cursor):
+        """Recompute the per-user totals from the full analysis history"""
+        cursor.execute('DELETE FROM analysis_stats')
+        for dimension, column in self.STATS_DIMENSIONS.items():
+            cursor.execute(f'''
+                INSERT INTO analysis_stats (user_id, dimension, value, analyses, words)
+                SELECT user_id, ?, {column}, COUNT(*), COALESCE(SUM(word_count), 0)
+                FROM analysis_history
+                WHERE {column} IS NOT NULL AND {column} != ''
+                GROUP BY user_id, {column}
+            ''', (dimension,))
+    
+    def hash_password(self, password):
+        """Hash password using SHA256"""
+        return hashlib.sha256(password.encode()).hexdigest()
+    
+    def register_user(self, username, password, email="", full_name="", organization=""):
+        """Register a new user"""
+        try:
+            user_id = str(uuid.uuid4())
+            password_hash = self.hash_password(password)
+            created_date = datetime.now().isoformat()
+            
+            with self.pool.connection() as conn:
+                conn.execute('''
+                    INSERT INTO users (id, username, password_hash, email, full_name, organization, created_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, username, password_hash, email, full_name, organization, created_date))
+            return True, "User registered successfully!"
+        except sqlite3.IntegrityError:
+            return False, "Username already exists!"
+        except Exception as e:
+            return False, f"Registration failed: {str(e)}"
+    
+    def login_user(self, username, password):
+        """Authenticate user login"""
+        password_hash = self.hash_password(password)
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, username, email, full_name, organization, gemini_api_key 
+                FROM users 
+                WHERE username = ? AND password_hash = ?
+            ''', (username, password_hash))
+            
+            user = cursor.fetchone()
+            
+            if user:
+                # Update last login
+                cursor.execute('''
+                    UPDATE users 
+                    SET last_login = ? 
+                    WHERE id = ?
+                ''', (datetime.now().isoformat(), user[0]))
+                return True, user
+            else:
+                return False, None
+    
+    def update_gemini_key(self, user_id, api_key):
+        """Update user's Gemini API key"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                UPDATE users 
+                SET gemini_api_key = ? 
+                WHERE id = ?
+            ''', (api_key, user_id))
+    
+    def get_gemini_key(self, user_id):
+        """Get user's Gemini API key"""
+        with self.pool.connection() as conn:
+            result = conn.execute('SELECT gemini_api_key FROM users WHERE id = ?', (user_id,)).fetchone()
+        
+        return result[0] if result and result[0] else None
+    
+    def save_analysis(self, user_id, document_name, document_type, word_count, original_lang, target_lang, summary,
+                      analysis_result=None, entities=None, text=None, translated_text=None,
+                      entity_offsets=None, ai_engine=None, units=None, change_report=None):
+        """Save analysis to history and add it to the search index
+        
+        When the document text is given, the complete result is stored as well so it can be reopened
+        with load_analysis instead of being recomputed. units and change_report come from an
+        incremental analysis (LegalDocumentAnalyzer.analyze_revision) and let the next version reuse it.
+        """
+        analysis_id = str(uuid.uuid4())
+        analysis_date = datetime.now().isoformat()
+        
+        content_hash = None
+        if text is not None:
+            payload = json.dumps({
+                'text': text,
+                'translated_text': translated_text if translated_text is not None else text,
+                'analysis_result': analysis_result,
+                'entities': entities,
+                'entity_offsets': entity_offsets,
+                'ai_engine': ai_engine,
+                'units': units,
+                'change_report': change_report
+            }, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+            content_hash = hashlib.sha256(payload).hexdigest()
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            if content_hash:
+                compressed = zlib.compress(payload, 6)
+                cursor.execute('''
+                    INSERT OR IGNORE INTO analysis_results (content_hash, payload, size_bytes, stored_bytes)
+                    VALUES (?, ?, ?, ?)
+                ''', (content_hash, compressed, len(payload), len(compressed)))
+            
+            cursor.execute('''
+                INSERT INTO analysis_history (id, user_id, document_name, analysis_date, document_type, 
+                                            word_count, original_language, target_language, summary, content_hash,
+                                            document_family)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (analysis_id, user_id, document_name, analysis_date, document_type, 
+                  word_count, original_lang, target_lang, summary, content_hash, document_family(document_name)))
+            
+            values = {
+                'total': 'all',
+                'document_type': document_type,
+                'original_language': original_lang,
+                'target_language': target_lang
+            }
+            cursor.executemany('''
+                INSERT INTO analysis_stats (user_id, dimension, value, analyses, words)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (user_id, dimension, value) 
+                DO UPDATE SET analyses = analyses + 1, words = words + excluded.words
+            ''', [(user_id, dimension, value, word_count or 0) for dimension, value in values.items() if value])
+            
+            analysis_result = analysis_result or {}
+            clauses = analysis_result.get('clauses') or {}
+            cursor.execute('''
+                INSERT INTO analysis_search (analysis_id, user_id, document_name, summary, parties, clauses, entities)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (analysis_id, user_id, document_name, summary,
+                  _flatten_search_text(analysis_result.get('parties')),
+                  # Index the clause categories too, so "arbitration clause" finds documents that have one
+                  _flatten_search_text({name.replace('_', ' '): found for name, found in clauses.items() if found}
+                                       if isinstance(clauses, dict) else clauses),
+                  _flatten_search_text(entities)))
+        
+        return analysis_id
+    
+    def load_analysis(self, user_id, analysis_id):
+        """Load a stored analysis with its full result, or None if it was saved without one
+        
+        The returned dict has the history fields (analysis_id, document_name, analysis_date,
+        document_type, word_count, original_language, target_language) plus text, translated_text,
+        analysis_result, entities, entity_offsets, ai_engine, units and change_report.
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT h.document_name, h.analysis_date, h.document_type, h.word_count,
+                       h.original_language, h.target_language, h.content_hash, r.payload
+                FROM analysis_history h
+                JOIN analysis_results r ON r.content_hash = h.content_hash
+                WHERE h.id = ? AND h.user_id = ?
+            ''', (analysis_id, user_id)).fetchone()
+        
+        if not row:
+            return None
+        
+        payload = zlib.decompress(row[7])
+        if hashlib.sha256(payload).hexdigest() != row[6]:
+            logger.error("Stored analysis %s failed its integrity check", analysis_id)
+            return None
+        
+        result = {'units': None, 'change_report': None}
+        result.update(json.loads(payload))
+        result.update(zip(
+            ('document_name', 'analysis_date', 'document_type', 'word_count', 'original_language', 'target_language'),
+            row[:6]
+        ))
+        result['analysis_id'] = analysis_id
+        return result
+    
+    def find_previous_version(self, user_id, document_name, exclude_id=None):
+        """Load the latest stored analysis of an earlier version of a document, or None
+        
+        Versions are matched on document_family, so "Agreement_v7.docx" finds "Agreement_v6.docx"
+        or "Agreement (final).docx". Only analyses saved with their full result are considered.
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id FROM analysis_history
+                WHERE user_id = ? AND document_family = ? AND content_hash IS NOT NULL AND id != ?
+                ORDER BY analysis_date DESC, id DESC
+                LIMIT 5
+            ''', (user_id, document_family(document_name), exclude_id or '')).fetchall()
+        
+        for (analysis_id,) in rows:
+            previous = self.load_analysis(user_id, analysis_id)
+            if previous is not None:
+                return previous
+        return None
+    
+    def search_history(self, user_id, query, limit=20):
+        """Full-text search over a user's past analyses, best matches first
+        
+        Queries can be keywords or plain questions: common words are dropped, and an analysis
+        matches if any remaining word matches (as a prefix) in an indexed field. bm25 ranking puts
+        analyses matching more and rarer words first. Returns rows of document name, analysis
+        date, document type, summary, a highlighted snippet, the analysis id and whether the full
+        result was stored (so it can be opened with load_analysis).
+        """
+        words = [word.lower() for word in re.findall(r'\w+', query)]
+        terms = [word for word in words if word not in self.SEARCH_STOPWORDS] or words
+        if not terms:
+            return []
+        match = ' OR '.join(f'"{term}"*' for term in dict.fromkeys(terms))
+        
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT h.document_name, h.analysis_date, h.document_type, h.summary,
+                       snippet(analysis_search, -1, '[', ']', '…', 12), h.id, h.content_hash IS NOT NULL
+                FROM analysis_search
+                JOIN analysis_history h ON h.id = analysis_search.analysis_id
+                WHERE analysis_search MATCH ? AND analysis_search.user_id = ?
+                ORDER BY bm25(analysis_search, 0, 0, 4.0, 1.0, 2.0, 2.0, 1.0)
+                LIMIT ?
+            ''', (match, user_id, limit)).fetchall()
+    
+    def get_user_history(self, user_id, limit=20):
+        """Get user's most recent analyses"""
+        rows, _ = self.get_history_page(user_id, page_size=limit)
+        return [row[:7] for row in rows]
+    
+    def get_history_page(self, user_id, page_size=20, cursor=None):
+        """Get one page of a user's history, newest first
+        
+        Rows have the same columns as get_user_history followed by the analysis id and whether the
+        full result was stored. Pass the returned next_cursor back in to fetch the following page; it
+        is None on the last page. Pages are keyed on (analysis_date, id) rather than OFFSET, so deep
+        pages are as fast as the first.
+        """
+        query = '''
+            SELECT document_name, analysis_date, document_type, word_count, 
+                   original_language, target_language, summary, id, content_hash IS NOT NULL
+            FROM analysis_history 
+            WHERE user_id = ?
+        '''
+        params = [user_id]
+        if cursor:
+            query += ' AND (analysis_date, id) < (?, ?)'
+            params.extend(cursor)
+        query += ' ORDER BY analysis_date DESC, id DESC LIMIT ?'
+        params.append(page_size + 1)
+        
+        with self.pool.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1][1], rows[-1][7])
+        return rows, next_cursor
+    
+    def get_user_stats(self, user_id):
+        """Get totals and per-type/per-language breakdowns over a user's whole history"""
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT dimension, value, analyses, words
+                FROM analysis_stats
+                WHERE user_id = ?
+                ORDER BY dimension, analyses DESC, value
+            ''', (user_id,)).fetchall()
+        
+        stats = {
+            'total_analyses': 0,
+            'total_words': 0,
+            'document_types': {},
+            'original_languages': {},
+            'target_languages': {}
+        }
+        for dimension, value, analyses, words in rows:
+            if dimension == 'total':
+                stats['total_analyses'] = analyses
+                stats['total_words'] = words
+            else:
+                stats[dimension + 's'][value] = analyses
+        
+        stats['top_document_type'] = next(iter(stats['document_types']), None)
+        stats['top_language'] = next(iter(stats['original_languages']), None)
+        return stats
+
+def _estimate_size(value):
+    """Approximate in-memory size of a JSON-like value in bytes"""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+class ResultStore:
+    """Size-capped LRU store for analysis results, shared by every session in the process
+    
+    Sessions keep only the string handle returned by put. When the in-memory total passes
+    max_memory_mb the least recently used results are compressed to spill files and loaded
+    back on demand; spill files are in turn dropped beyond max_disk_mb, after which get
+    returns None and the caller recomputes.
+    """
+    
+    def __init__(self, max_memory_mb=256, max_disk_mb=2048, spill_dir=None):
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        # Results this large would churn the whole memory tier, so they live on disk only
+        self.max_item_bytes = self.max_memory_bytes // 4
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix='legal_analyzer_results_')
+        os.makedirs(self.spill_dir, exist_ok=True)
+        
+        self._memory = OrderedDict()  # handle -> (value, estimated bytes)
+        self._disk = OrderedDict()  # handle -> compressed bytes on disk
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'spilled': 0, 'dropped': 0}
+    
+    def put(self, value, handle=None):
+        """Store a JSON-serializable result and return its handle
+        
+        Pass a handle derived from the inputs to use the store as a memo shared across sessions;
+        an existing result under that handle is replaced.
+        """
+        handle = handle or uuid.uuid4().hex
+        size = _estimate_size(value)
+        with self._lock:
+            self._remove(handle)
+            self._admit(handle, value, size)
+        return handle
+    
+    def get(self, handle):
+        """Return the result for a handle, or None if it was never stored or has been dropped"""
+        with self._lock:
+            if handle in self._memory:
+                self._memory.move_to_end(handle)
+                self.stats['hits'] += 1
+                return self._memory[handle][0]
+            
+            if handle in self._disk:
+                path = self._spill_path(handle)
+                with open(path, 'rb') as file:
+                    value = json.loads(zlib.decompress(file.read()))
+                self._disk_bytes -= self._disk.pop(handle)
+                os.remove(path)
+                self.stats['disk_hits'] += 1
+                self._admit(handle, value, _estimate_size(value))
+                return value
+            
+            self.stats['misses'] += 1
+            return None
+    
+    def discard(self, handle):
+        """Forget a result, e.g. when a session replaces it with a newer one"""
+        with self._lock:
+            self._remove(handle)
+    
+    def get_stats(self):
+        """Get hit counters and current memory/disk usage"""
+        with self._lock:
+            return dict(self.stats, entries=len(self._memory) + len(self._disk),
+                        memory_bytes=self._memory_bytes, disk_bytes=self._disk_bytes)
+    
+    def close(self):
+        """Drop every result and remove the spill directory"""
+        with self._lock:
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = self._disk_bytes = 0
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+    
+    def _remove(self, handle):
+        if handle in self._memory:
+            self._memory_bytes -= self._memory.pop(handle)[1]
+        elif handle in self._disk:
+            self._disk_bytes -= self._disk.pop(handle)
+            os.remove(self._spill_path(handle))
+    
+    def _spill_path(self, handle):
+        return os.path.join(self.spill_dir, f"{handle}.json.z")
+    
+    def _admit(self, handle, value, size):
+        """Add a result to the memory tier, spilling least recently used results past the cap"""
+        if size > self.max_item_bytes:
+            self._spill(handle, value)
+            return
+        
+        self._memory[handle] = (value, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            old_handle, (old_value, old_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_size
+            self._spill(old_handle, old_value)
+    
+    def _spill(self, handle, value):
+        """Write a result to a compressed file, dropping the oldest files past the disk cap"""
+        payload = zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'), 1)
+        with open(self._spill_path(handle), 'wb') as file:
+            file.write(payload)
+        self._disk[handle] = len(payload)
+        self._disk_bytes += len(payload)
+        self.stats['spilled'] += 1
+        
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            old_handle, old_size = self._disk.popitem(last=False)
+            self._disk_bytes -= old_size
+            os.remove(self._spill_path(old_handle))
+            self.stats['dropped'] += 1
+
+# One result store per process, so the memory cap covers all sessions together
+_result_store = None
+_result_store_lock = threading.Lock()
+
+def get_result_store(max_memory_mb=256, max_disk_mb=2048):
+    """Get the process-wide result store, creating it on first use"""
+    global _result_store
+    with _result_store_lock:
+        if _result_store is None:
+            _result_store = ResultStore(max_memory_mb, max_disk_mb)
+            atexit.register(_result_store.close)
+        return _result_store
+
+# Durable background job queue
+JOBS_DB_PATH = 'legal_analyzer_jobs.db'
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.enqueue when the backlog is at its limit"""
+
+class JobQueue:
+    """SQLite-backed job queue with leases, retries and dead-lettering
+    
+    Workers claim a job by leasing it; a job whose worker dies is claimed again once the
+    lease runs out. Failed jobs are retried with exponential backoff until max_attempts,
+    then moved to the 'dead' state for inspection and manual requeue.
+    """
+    
+    STATUSES = ('queued', 'running', 'done', 'dead')
+    
+    def __init__(self, db_path=JOBS_DB_PATH, max_depth=1000, max_attempts=3, backoff_base=30.0, backoff_max=3600.0):
+        self.db_path = db_path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool = get_connection_pool(db_path)
+        self.pool.ensure_schema('jobs', self.init_database)
+    
+    def init_database(self):
+        """Initialize the jobs table"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    user_id TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    available_at REAL NOT NULL,
+                    leased_until REAL,
+                    worker TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_date TEXT NOT NULL,
+                    updated_date TEXT NOT NULL
+                )
+            ''')
+            # Claiming scans only runnable jobs in order; users list their own jobs newest first
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_available
+                ON jobs (status, available_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_user_created
+                ON jobs (user_id, created_date DESC)
+            ''')
+    
+    def enqueue(self, kind, payload, user_id=None, max_attempts=None):
+        """Add a job and return its id; raises QueueFullError when the backlog is full"""
+        job_id = uuid.uuid4().hex
+        now = datetime.now().isoformat()
+        
+        max_depth = self.max_depth or 0
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # Depth check and insert in one statement, so concurrent producers can't both pass the check
+            cursor.execute('''
+                INSERT INTO jobs (id, kind, payload, user_id, status, max_attempts, available_at, created_date, updated_date)
+                SELECT ?, ?, ?, ?, 'queued', ?, ?, ?, ?
+                WHERE ? = 0 OR (SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')) < ?
+            ''', (job_id, kind, json.dumps(payload, ensure_ascii=False), user_id,
+                  max_attempts or self.max_attempts, time.time(), now, now, max_depth, max_depth))
+            if cursor.rowcount == 0:
+                raise QueueFullError(f"Job queue is full ({self.max_depth} jobs pending)")
+        return job_id
+    
+    def claim(self, worker_id, lease_seconds=600):
+        """Lease the next runnable job to a worker, or return None when there is none"""
+        now = time.time()
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            # Jobs whose worker died on their final attempt go to the dead letter state
+            cursor.execute('''
+                UPDATE jobs 
+                SET status = 'dead', error = COALESCE(error, 'Worker lease expired'), updated_date = ?
+                WHERE status = 'running' AND leased_until < ? AND attempts >= max_attempts
+            ''', (datetime.now().isoformat(), now))
+            
+            cursor.execute('''
+                UPDATE jobs 
+                SET status = 'running', attempts = attempts + 1, leased_until = ?, worker = ?, updated_date = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND leased_until < ?)
+                    ORDER BY available_at
+                    LIMIT 1
+                )
+                RETURNING id, kind, payload, user_id, attempts
+            ''', (now + lease_seconds, worker_id, datetime.now().isoformat(), now, now))
+            row = cursor.fetchone()
+        
+        if not row:
+            return None
+        return {'id': row[0], 'kind': row[1], 'payload': json.loads(row[2]), 'user_id': row[3], 'attempts': row[4]}
+    
+    def extend_lease(self, job_id, lease_seconds=600):
+        """Keep a long-running job leased to its worker"""
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE jobs SET leased_until = ? WHERE id = ? AND status = 'running'",
+                         (time.time() + lease_seconds, job_id))
+    
+    def complete(self, job_id, result):
+        """Mark a job done and store its JSON-serializable result"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                UPDATE jobs 
+                SET status = 'done', result = ?, error = NULL, leased_until = NULL, updated_date = ?
+                WHERE id = ?
+            ''', (json.dumps(result, ensure_ascii=False, default=str), datetime.now().isoformat(), job_id))
+    
+    def fail(self, job_id, error, retryable=True):
+        """Record a failure; the job is retried with backoff, or dead-lettered when out of attempts
+        
+        Returns the job's new status.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT attempts, max_attempts FROM jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            attempts, max_attempts = row
+            status = 'queued' if retryable and attempts < max_attempts else 'dead'
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+            cursor.execute('''
+                UPDATE jobs 
+                SET status = ?, error = ?, available_at = ?, leased_until = NULL, updated_date = ?
+                WHERE id = ?
+            ''', (status, str(error), time.time() + delay, datetime.now().isoformat(), job_id))
+            return status
+    
+    def requeue(self, job_id):
+        """Give a dead job a fresh set of attempts"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE jobs 
+                SET status = 'queued', attempts = 0, available_at = ?, updated_date = ?
+                WHERE id = ? AND status = 'dead'
+            ''', (time.time(), datetime.now().isoformat(), job_id))
+            return cursor.rowcount > 0
+    
+    def get(self, job_id):
+        """Get a job's status, attempts, result and error"""
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT id, kind, user_id, status, attempts, max_attempts, result, error, created_date, updated_date
+                FROM jobs WHERE id = ?
+            ''', (job_id,)).fetchone()
+        
+        if not row:
+            return None
+        job = dict(zip(('id', 'kind', 'user_id', 'status', 'attempts', 'max_attempts', 'result', 'error',
+                        'created_date', 'updated_date'), row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+    
+    def list_jobs(self, user_id, limit=20):
+        """Get a user's most recent jobs, without their results"""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT id, kind, payload, status, attempts, error, created_date, updated_date
+                FROM jobs 
+                WHERE user_id = ?
+                ORDER BY created_date DESC
+                LIMIT ?
+            ''', (user_id, limit)).fetchall()
+    
+    def get_depth(self):
+        """Count jobs in each state"""
+        with self.pool.connection() as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {status: counts.get(status, 0) for status in self.STATUSES}
+    
+    def purge(self, older_than_days=7):
+        """Delete finished and dead jobs older than the given age"""
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM jobs WHERE status IN ('done', 'dead') AND updated_date < ?", (cutoff,))
+            return cursor.rowcount
+
+WHITESPACE_RUN = re.compile(r'\s+')
+LETTER = re.compile(r'[^\W\d_]')
+
+def _flatten_search_text(value):
+    """Flatten nested analysis output (dicts, lists, strings) into one searchable string"""
+    if not value:
+        return ''
+    if isinstance(value, dict):
+        return ' '.join(f"{key} {_flatten_search_text(item)}" for key, item in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return ' '.join(_flatten_search_text(item) for item in value)
+    return str(value)
+
+def _compile_by_type(patterns_by_type, flags=0, leading_chars=None):
+    """Compile one alternation per type, for scans where matches of different types may overlap
+    
+    Returns {type: compiled pattern}. A lookahead on the characters a match can start with lets
+    the scan skip other positions without trying each alternative. leading_chars optionally maps
+    types to those characters; otherwise they are inferred when every pattern starts with a letter.
+    """
+    compiled = {}
+    for pattern_type, patterns in patterns_by_type.items():
+        type_leading_chars = (leading_chars or {}).get(pattern_type)
+        if type_leading_chars is None:
+            first_chars = {pattern[0] for pattern in patterns if pattern}
+            if first_chars and all(char.isalpha() for char in first_chars):
+                type_leading_chars = ''.join(sorted(first_chars))
+        guard = f"(?=[{type_leading_chars}])" if type_leading_chars else ''
+        alternation = '|'.join(f"(?:{pattern})" for pattern in patterns)
+        compiled[pattern_type] = re.compile(f"{guard}(?:{alternation})", flags)
+    return compiled
+
+EntityMention = namedtuple('EntityMention', ['entity_type', 'text', 'start', 'end'])
+
+class EntityExtractor:
+    """Regex entity extractor with one compiled pass per entity type, with character offsets"""
+    
+    ENTITY_TYPES = ['PERSONS', 'ORGANIZATIONS', 'DATES', 'MONEY', 'LOCATIONS']
+    
+    ENTITY_PATTERNS = {
+        'ORGANIZATIONS': [r'\b[A-Z][a-z]*(?:\s+[A-Z][a-z]*)*\s+(?:Inc\.|LLC|Corp\.|Company|Corporation|Ltd\.)(?!\w)'],
+        'MONEY': [r'\$[\d,]+(?:\.\d{2})?', r'€[\d,]+(?:\.\d{2})?', r'£[\d,]+(?:\.\d{2})?'],
+        'DATES': [r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'],
+        'PERSONS': [r'\b[A-Z][a-z]+\s+[A-Z][a-z]+\b']
+    }
+    
+    LEADING_CHARS = {'ORGANIZATIONS': 'A-Z', 'MONEY': '$€£', 'DATES': '\\d', 'PERSONS': 'A-Z'}
+    
+    # Types are scanned separately, so mentions of different types may overlap: "Smith Company"
+    # is reported as an organization and as a person name
+    MATCHERS = _compile_by_type(ENTITY_PATTERNS, leading_chars=LEADING_CHARS)
+    
+    def iter_mentions(self, text):
+        """Yield every entity mention in text order"""
+        mentions = [
+            EntityMention(entity_type, match.group(), match.start(), match.end())
+            for entity_type, matcher in self.MATCHERS.items()
+            for match in matcher.finditer(text)
+        ]
+        # Stable sort: mentions starting at the same offset keep the ENTITY_PATTERNS order
+        mentions.sort(key=lambda mention: mention.start)
+        return iter(mentions)
+    
+    def extract(self, text):
+        """Extract entities grouped by type, in first-seen order
+        
+        Each entity is a dict with its text, mention count and [start, end] offsets.
+        """
+        entities = {entity_type: {} for entity_type in self.ENTITY_TYPES}
+        for mention in self.iter_mentions(text):
+            found = entities[mention.entity_type].get(mention.text)
+            if found is None:
+                found = entities[mention.entity_type][mention.text] = {'text': mention.text, 'count': 0, 'offsets': []}
+            found['count'] += 1
+            found['offsets'].append([mention.start, mention.end])
+        return {entity_type: list(found.values()) for entity_type, found in entities.items()}
+    
+    def extract_names(self, text):
+        """Extract unique entity strings grouped by type, in first-seen order"""
+        entities = {entity_type: {} for entity_type in self.ENTITY_TYPES}
+        for mention in self.iter_mentions(text):
+            entities[mention.entity_type].setdefault(mention.text, None)
+        return {entity_type: list(found) for entity_type, found in entities.items()}
+    
+    def extract_batch(self, texts, workers=1):
+        """Extract entities from many documents
+        
+        Accepts any iterable of strings, including a pandas Series or pyarrow array;
+        missing values are treated as empty documents. With workers > 1 the
+        documents are spread over a process pool.
+        """
+        if hasattr(texts, 'to_pylist'):
+            texts = texts.to_pylist()
+        texts = [text if isinstance(text, str) else '' for text in texts]
+        if workers <= 1:
+            return [self.extract(text) for text in texts]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(_extract_entities, texts, chunksize=max(1, len(texts) // (workers * 4))))
+    
+    def extract_frame(self, texts):
+        """Extract entity mentions from many documents into one long-format pandas DataFrame
+        
+        Columns are doc_index, entity_type, text, start and end.
+        """
+        import pandas as pd
+        if hasattr(texts, 'to_pylist'):
+            texts = texts.to_pylist()
+        rows = [
+            (doc_index,) + tuple(mention)
+            for doc_index, text in enumerate(texts) if isinstance(text, str)
+            for mention in self.iter_mentions(text)
+        ]
+        return pd.DataFrame(rows, columns=['doc_index', 'entity_type', 'text', 'start', 'end'])
+
+_default_entity_extractor = EntityExtractor()
+
+class EntityHighlighter:
+    """Wraps every occurrence of a set of entity strings in <mark> tags in one pass over the text
+    
+    The entity strings are compiled into a single trie-shaped regex, so each text
+    position is checked against all entities at once (longest match wins) instead
+    of rescanning the document once per entity. Entities nested inside a longer
+    match are highlighted inside it rather than dropped.
+    """
+    
+    def __init__(self, entity_strings, min_length=3, css_class='entity-highlight'):
+        self.css_class = css_class
+        # Case-insensitive matching: build the trie from lowercased strings
+        words = {entity.strip().lower() for entity in entity_strings 
+                 if isinstance(entity, str) and len(entity.strip()) >= min_length}
+        self.pattern = re.compile(self._trie_regex(words), re.IGNORECASE) if words else None
+    
+    def _trie_regex(self, words):
+        """Build a regex matching any of the words, structured as a trie"""
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        return self._node_regex(trie)
+    
+    def _node_regex(self, node):
+        """Regex for the suffixes below one trie node, preferring longer matches"""
+        is_end = '' in node
+        branches = []
+        single_chars = []
+        for char in sorted(key for key in node if key):
+            child = node[char]
+            if list(child) == ['']:
+                single_chars.append(re.escape(char))
+            else:
+                branches.append(re.escape(char) + self._node_regex(child))
+        
+        if len(single_chars) == 1:
+            branches.append(single_chars[0])
+        elif single_chars:
+            branches.append('[' + ''.join(single_chars) + ']')
+        
+        if not branches:
+            return ''
+        result = branches[0] if len(branches) == 1 and not is_end else '(?:' + '|'.join(branches) + ')'
+        return result + '?' if is_end else result
+    
+    def iter_spans(self, text, start=0, end=None, nested=False):
+        """Yield (start, end) offsets of entity occurrences within text[start:end]
+        
+        Overlapping entities resolve to the longest match starting first. With
+        nested=True the range is itself a match, and the entities inside it are
+        yielded instead (the shorter prefix match, then any later ones).
+        """
+        if self.pattern is None:
+            return
+        end = len(text) if end is None else end
+        position = start
+        while position < end:
+            match = self.pattern.search(text, position, end)
+            if match is None:
+                return
+            if nested and match.span() == (start, end):
+                # Cap endpos to find the longest entity that is a proper prefix of the range
+                match = self.pattern.match(text, start, end - 1)
+                if match is None:
+                    position = start + 1
+                    continue
+            yield match.start(), match.end()
+            position = match.end()
+    
+    def to_html(self, text, start=0, end=None, nested=False):
+        """Render text[start:end] as HTML-escaped text with entity occurrences highlighted
+        
+        Entities inside a longer highlighted entity (a name inside an organization,
+        "Smith" in "Smith & Co") get their own <mark> nested in the outer one.
+        """
+        end = len(text) if end is None else end
+        parts = []
+        position = start
+        for span_start, span_end in self.iter_spans(text, start, end, nested):
+            parts.append(html.escape(text[position:span_start]))
+            inner = self.to_html(text, span_start, span_end, nested=True)
+            parts.append(f'<mark class="{self.css_class}">{inner}</mark>')
+            position = span_end
+        parts.append(html.escape(text[position:end]))
+        return ''.join(parts)
+
+def paginate_text(text, page_size=20000):
+    """Split text into (start, end) pages of roughly page_size characters, breaking at line ends"""
+    pages = []
+    start = 0
+    while start < len(text):
+        end = min(start + page_size, len(text))
+        if end < len(text):
+            newline = text.rfind('\n', start + page_size // 2, end)
+            if newline != -1:
+                end = newline + 1
+        pages.append((start, end))
+        start = end
+    return pages or [(0, 0)]
+
+def _extract_entities(text):
+    """Extract entities with the shared extractor; runs in a worker process for batch extraction"""
+    return _default_entity_extractor.extract(text)
+
+def _count_pdf_pages(source):
+    """Count the pages of a PDF given as a path or bytes"""
+    import PyPDF2
+    from io import BytesIO
+    return len(PyPDF2.PdfReader(source if isinstance(source, str) else BytesIO(source)).pages)
+
+def _extract_pdf_page_range(source, start, stop):
+    """Extract the text of pages [start, stop) of a PDF; runs in a worker process"""
+    import PyPDF2
+    from io import BytesIO
+    reader = PyPDF2.PdfReader(source if isinstance(source, str) else BytesIO(source))
+    return [reader.pages[index].extract_text() + "\n" for index in range(start, stop)]
+
+class LegalDocumentAnalyzer:
+    """Enhanced legal document analyzer with Gemini AI integration"""
+    
+    def __init__(self, gemini_integration=None, on_error=None):
+        self.gemini = gemini_integration
+        self.on_error = on_error or logger.error
+        
+        # Fallback patterns for basic analysis when Gemini is not available
+        self.legal_patterns = {
+            'termination_clauses': [
+                r'terminat[ei](?:on|ng)', r'end(?:ing)?\s+(?:of\s+)?(?:this\s+)?(?:agreement|contract)',
+                r'expir[ey](?:ation)?', r'breach\s+of\s+contract'
+            ],
+            'confidentiality_clauses': [
+                r'confidential(?:ity)?', r'non-disclos(?:ure|e)', r'proprietary\s+information'
+            ],
+            'indemnity_clauses': [
+                r'indemnif(?:y|ication)', r'hold\s+harmless', r'liability\s+(?:for\s+)?damages'
+            ],
+            'payment_clauses': [
+                r'payment\s+terms?', r'invoice', r'compensation', r'fee(?:s)?'
+            ],
+            'dispute_resolution': [
+                r'arbitration', r'mediation', r'dispute\s+resolution', r'governing\s+law'
+            ]
+        }
+        # One pass per clause type, so a passage can count towards several types
+        self.clause_matchers = _compile_by_type(self.legal_patterns, re.IGNORECASE)
+        self.entity_extractor = _default_entity_extractor
+    
+    def extract_text_from_pdf(self, file, workers=1) -> str:
+        """Extract text from PDF file"""
+        try:
+            return ''.join(self.iter_pdf_pages(file, workers))
+        except Exception as e:
+            self.on_error(f"Error reading PDF: {str(e)}")
+            return ""
+    
+    def iter_pdf_pages(self, file, workers=1, pages_per_task=16):
+        """Yield the text of each PDF page, in order, as soon as it is decoded
+        
+        With workers > 1, page ranges are extracted in a process pool. Errors are raised.
+        """
+        if workers <= 1:
+            import PyPDF2
+            for page in PyPDF2.PdfReader(file).pages:
+                yield page.extract_text() + "\n"
+            return
+        
+        # Worker processes need something picklable: a path, or the raw bytes of an upload
+        source = file if isinstance(file, str) else file.read()
+        page_count = _count_pdf_pages(source)
+        ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_extract_pdf_page_range, source, start, stop) for start, stop in ranges]
+            for future in futures:
+                yield from future.result()
+    
+    def iter_text_from_path(self, path, pdf_workers=1):
+        """Yield the text of a PDF, DOCX or TXT file on disk in pieces (pages for PDFs). Errors are raised."""
+        file_extension = os.path.splitext(path)[1].lower().lstrip('.')
+        if file_extension == 'pdf':
+            yield from self.iter_pdf_pages(path, pdf_workers)
+        elif file_extension == 'docx':
+            import docx
+            for paragraph in docx.Document(path).paragraphs:
+                yield paragraph.text + "\n"
+        elif file_extension == 'txt':
+            with open(path, 'rb') as file:
+                yield str(file.read(), "utf-8")
+        else:
+            raise ValueError(f"Unsupported file format: {path}")
+    
+    def extract_text_from_docx(self, file) -> str:
+        """Extract text from DOCX file"""
+        try:
+            import docx
+            doc = docx.Document(file)
+            return ''.join(paragraph.text + "\n" for paragraph in doc.paragraphs)
+        except Exception as e:
+            self.on_error(f"Error reading DOCX: {str(e)}")
+            return ""
+    
+    def extract_text_from_txt(self, file) -> str:
+        """Extract text from TXT file"""
+        try:
+            return str(file.read(), "utf-8")
+        except Exception as e:
+            self.on_error(f"Error reading TXT: {str(e)}")
+            return ""
+    
+    def extract_text_from_path(self, path, pdf_workers=1) -> str:
+        """Extract text from a PDF, DOCX or TXT file on disk"""
+        try:
+            return ''.join(self.iter_text_from_path(path, pdf_workers))
+        except Exception as e:
+            self.on_error(f"Error reading {os.path.basename(path)}: {str(e)}")
+            return ""
+    
+    def analyze_document(self, text, target_lang='en'):
+        """Main document analysis function"""
+        if self.gemini and self.gemini.is_configured:
+            return self.gemini.analyze_legal_document(text, target_lang)
+        else:
+            return self._basic_analysis(text)
+    
+    def analyze_document_full(self, text, target_lang='en'):
+        """Return (language, analysis, entities), using one Gemini round trip when available"""
+        if self.gemini and self.gemini.is_configured:
+            combined = self.gemini.analyze_combined(text, target_lang)
+            return combined['language'], combined['analysis'], combined['entities']
+        
+        original_lang = detect_language_local(text)
+        return original_lang, self._basic_analysis(text), self._extract_basic_entities(text)
+    
+    def analyze_text_stream(self, pieces, target_lang='en'):
+        """Analyze a streamed document (e.g. PDF pages) as it is extracted
+        
+        Returns (text, language, analysis, entities). With Gemini, chunks are sent for
+        analysis while later pages are still being decoded.
+        """
+        if self.gemini and self.gemini.is_configured:
+            text, combined = self.gemini.analyze_combined_stream(pieces, target_lang)
+            return text, combined['language'], combined['analysis'], combined['entities']
+        
+        text = ''.join(pieces)
+        return (text,) + self.analyze_document_full(text, target_lang)
+    
+    def analyze_documents(self, texts, target_lang='en', timeout=None, cancel=None):
+        """Analyze many documents, fanning out across the Gemini worker pool when available
+        
+        Returns (language, analysis, entities) per text, in order. See GeminiIntegration.map_concurrent
+        for timeout and cancel.
+        """
+        if self.gemini and self.gemini.is_configured:
+            return self.gemini.map_concurrent(
+                lambda text: self.analyze_document_full(text, target_lang), texts, timeout=timeout, cancel=cancel
+            )
+        return [self.analyze_document_full(text, target_lang) for text in texts]
+    
+    def analyze_revision(self, text, previous=None, target_lang='en'):
+        """Analyze a new version of a document against a stored earlier version
+        
+        previous is a stored analysis as returned by UserManager.find_previous_version. With Gemini,
+        only the sections that changed since that version are re-analyzed and merged with its stored
+        per-section results; basic analysis is cheap and simply reruns. Returns (language, analysis,
+        entities, units, change_report); change_report is None without a previous version.
+        """
+        chunker = self.gemini.chunker if self.gemini else DocumentChunker()
+        sections = chunker.split_sections(text)
+        
+        if self.gemini and self.gemini.is_configured:
+            # Stored results only carry over when they were written in the same output language
+            previous_units = None
+            if previous and previous.get('target_language') == target_lang:
+                previous_units = previous.get('units')
+            combined, units, reanalyzed_chars = self.gemini.analyze_sections(sections, target_lang, previous_units)
+            original_lang, analysis, entities = combined['language'], combined['analysis'], combined['entities']
+        else:
+            original_lang, analysis, entities = self.analyze_document_full(text, target_lang)
+            units, reanalyzed_chars = None, len(text)
+        
+        if not previous:
+            return original_lang, analysis, entities, units, None
+        
+        changes = []
+        for change in diff_sections(chunker.split_sections(previous['text']), sections):
+            if change['change'] == 'unchanged':
+                continue
+            changes.append({
+                'change': change['change'],
+                'heading': section_heading(change['new_text'] if change['new_text'] is not None else change['old_text']),
+                'clause_types': sorted(self._clause_types(change['old_text']) | self._clause_types(change['new_text'])),
+                'similarity': change['similarity'],
+                'old_text': change['old_text'],
+                'new_text': change['new_text']
+            })
+        counts = Counter(change['change'] for change in changes)
+        
+        change_report = {
+            'previous_analysis_id': previous.get('analysis_id'),
+            'previous_document_name': previous.get('document_name'),
+            'previous_analysis_date': previous.get('analysis_date'),
+            'counts': {
+                'unchanged': len(sections) - counts['modified'] - counts['added'],
+                'modified': counts['modified'],
+                'added': counts['added'],
+                'removed': counts['removed']
+            },
+            'changed_clause_types': sorted({clause_type for change in changes for clause_type in change['clause_types']}),
+            'changes': changes,
+            'reanalyzed_chars': reanalyzed_chars,
+            'total_chars': len(text)
+        }
+        return original_lang, analysis, entities, units, change_report
+    
+    def _clause_types(self, text):
+        """Clause categories (termination, payment, ...) the basic patterns find in a piece of text"""
+        if not text:
+            return set()
+        return {clause_type for clause_type, matcher in self.clause_matchers.items() if matcher.search(text)}
+    
+    def _basic_analysis(self, text):
+        """Basic analysis when Gemini is not available"""
+        # Basic entity extraction
+        entities = self._extract_basic_entities(text)
+        
+        # Basic clause extraction: the context window is cut from the original text, then its
+        # whitespace collapsed; dicts keep the unique contexts in text order
+        clauses = {}
+        for clause_type, matcher in self.clause_matchers.items():
+            contexts = {}
+            for match in matcher.finditer(text):
+                start = max(0, match.start() - 50)
+                end = min(len(text), match.end() + 100)
+                contexts.setdefault(WHITESPACE_RUN.sub(' ', text[start:end].strip()), None)
+            clauses[clause_type] = list(contexts)
+        
+        return {
+            "document_type": "Legal Document",
+            "parties": entities.get('PERSONS', []) + entities.get('ORGANIZATIONS', []),
+            "dates": entities.get('DATES', []),
+            "financial_terms": entities.get('MONEY', []),
+            "clauses": clauses,
+            "risks": ["Basic analysis - configure Gemini for detailed risk assessment"],
+            "obligations": ["Basic analysis - configure Gemini for detailed obligation analysis"],
+            "jurisdiction": "Not detected",
+            "summary": f"Document contains {len(text.split())} words. Basic analysis performed."
+        }
+    
+    def _extract_basic_entities(self, text):
+        """Basic entity extraction fallback"""
+        return self.entity_extractor.extract_names(text)
+    
+    def extract_entities_with_offsets(self, text):
+        """Basic entity extraction with mention counts and character offsets"""
+        return self.entity_extractor.extract(text)
@@ -0,0 +1,86 @@
+"""Shared fixtures for the headless component tests"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from legal_core import AnalysisCache, FakeGeminiModel, GeminiIntegration, TranslationMemory
+
+CONTRACT_TEXT = """SERVICES AGREEMENT
+
+This Agreement is made on 01/05/2024 between Acme Corporation and John Smith.
+
+1. PAYMENT
+The Client shall pay a fee of $12,000 within thirty days of each invoice.
+
+2. CONFIDENTIALITY
+Each party shall keep all proprietary information confidential.
+
+3. TERMINATION
+Either party may terminate this Agreement upon breach of contract by the other party.
+
+4. GOVERNING LAW
+This Agreement is governed by the laws of the State of New York. Any dispute shall go to arbitration.
+"""
+
+@pytest.fixture
+def contract_text():
+    return CONTRACT_TEXT
+
+@pytest.fixture
+def cache_db(tmp_path):
+    return str(tmp_path / 'cache.db')
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one page per string in pages (ASCII text, one line per text line)"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None, '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    page_ids = []
+    for page in pages:
+        lines = ' T* '.join(
+            '(' + line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ') Tj' for line in page.split('\n')
+        )
+        content = f"BT /F1 10 Tf 12 TL 50 750 Td {lines} ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+    
+    output = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += ''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, 'wb') as file:
+        file.write(output)
+    return str(path)
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Build PDFs under tmp_path; returns the file path"""
+    def make(pages, name='document.pdf'):
+        return write_pdf(tmp_path / name, pages)
+    return make
+
+@pytest.fixture
+def make_integration(cache_db):
+    """Build GeminiIntegrations backed by a FakeGeminiModel and a private cache database"""
+    integrations = []
+    
+    def make(model=None, **kwargs):
+        cache = AnalysisCache(cache_db)
+        kwargs.setdefault('backoff_base', 0.0)
+        integration = GeminiIntegration(cache=cache, translation_memory=TranslationMemory(cache_db),
+                                        model=model or FakeGeminiModel(), **kwargs)
+        integrations.append(integration)
+        return integration
+    
+    yield make
+    for integration in integrations:
+        integration.executor.shutdown(wait=True)
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api_server import create_app
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.delenv('GOOGLE_API_KEY', raising=False)
+    # Uploads for /jobs are spooled under the working directory
+    monkeypatch.chdir(tmp_path)
+    app = create_app(workers=2, max_upload_mb=0.01, max_active_jobs=2, queue_db=str(tmp_path / 'jobs.db'))
+    with TestClient(app) as client:
+        yield client
+
+def test_health_reports_engine_and_queue(client):
+    body = client.get('/health').json()
+    assert body['status'] == 'ok'
+    assert body['ai_engine'] == 'Basic Analysis'
+    assert body['queue'] == {'queued': 0, 'running': 0, 'done': 0, 'dead': 0}
+
+def test_extract_returns_uploaded_text(client, contract_text):
+    response = client.post('/extract', params={'filename': 'contract.txt'}, content=contract_text.encode())
+    assert response.status_code == 200
+    assert response.json()['text'] == contract_text
+    assert response.json()['word_count'] == len(contract_text.split())
+
+def test_uploads_are_validated(client):
+    assert client.post('/extract', params={'filename': 'contract.exe'}, content=b'x').status_code == 415
+    assert client.post('/extract', params={'filename': 'contract.txt'}, content=b'').status_code == 400
+    assert client.post('/extract', params={'filename': 'big.txt'}, content=b'x' * 20000).status_code == 413
+    assert client.post('/analyze', params={'filename': 'a.txt', 'target_lang': 'xx'}, content=b'x').status_code == 422
+
+def test_analyze_file_and_text(client, contract_text):
+    record = client.post('/analyze', params={'filename': 'contract.txt'}, content=contract_text.encode()).json()
+    assert record['document_name'] == 'contract.txt'
+    assert record['analysis_result']['clauses']['payment_clauses']
+    
+    body = client.post('/analyze/text', json={'text': contract_text}).json()
+    assert body['analysis_result']['clauses'] == record['analysis_result']['clauses']
+    assert body['entities']['MONEY'] == ['$12,000']
+
+def test_entities_come_with_offsets(client, contract_text):
+    entities = client.post('/entities', json={'text': contract_text}).json()['entities']
+    money = entities['MONEY'][0]
+    assert money['text'] == '$12,000' and money['count'] == 1
+    start, end = money['offsets'][0]
+    assert contract_text[start:end] == '$12,000'
+
+def test_translate_needs_gemini(client):
+    assert client.post('/translate', json={'text': 'Hello', 'target_lang': 'fr'}).status_code == 503
+
+def test_jobs_are_queued_until_the_queue_is_full(client, contract_text):
+    job_ids = []
+    for _ in range(2):
+        response = client.post('/jobs', params={'filename': 'contract.txt'}, content=contract_text.encode())
+        assert response.status_code == 202
+        job_ids.append(response.json()['job_id'])
+    
+    response = client.post('/jobs', params={'filename': 'contract.txt'}, content=contract_text.encode())
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    # The refused upload is not left behind in the spool directory
+    assert len(os.listdir('job_uploads')) == 2
+    
+    assert client.get(f'/jobs/{job_ids[0]}').json()['status'] == 'queued'
+    assert client.get('/jobs/unknown').status_code == 404
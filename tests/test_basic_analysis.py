@@ -0,0 +1,38 @@
+from legal_core import LegalDocumentAnalyzer
+
+def test_basic_analysis_finds_clauses(contract_text):
+    clauses = LegalDocumentAnalyzer()._basic_analysis(contract_text)['clauses']
+    
+    assert clauses['payment_clauses'] and clauses['termination_clauses']
+    assert clauses['confidentiality_clauses'] and clauses['dispute_resolution']
+    assert clauses['indemnity_clauses'] == []
+    assert any('arbitration' in context for context in clauses['dispute_resolution'])
+
+def test_clause_contexts_are_whitespace_collapsed_and_unique(contract_text):
+    clauses = LegalDocumentAnalyzer()._basic_analysis(contract_text + contract_text.replace('\n', '\n\n'))['clauses']
+    for contexts in clauses.values():
+        assert all('\n' not in context and '  ' not in context for context in contexts)
+        assert len(contexts) == len(set(contexts))
+
+def test_basic_analysis_reports_parties_and_amounts(contract_text):
+    analysis = LegalDocumentAnalyzer()._basic_analysis(contract_text)
+    assert 'Acme Corporation' in analysis['parties']
+    assert analysis['financial_terms'] == ['$12,000']
+    assert analysis['dates'] == ['01/05/2024']
+
+def test_revision_report_lists_changed_sections_and_clause_types(contract_text):
+    analyzer = LegalDocumentAnalyzer()
+    amended = contract_text.replace('$12,000', '$15,000').replace(
+        '4. GOVERNING LAW', '5. AUDIT\nRecords may be inspected.\n\n4. GOVERNING LAW'
+    )
+    previous = {'text': contract_text, 'document_name': 'contract.txt', 'analysis_id': 'a1',
+                'analysis_date': '2024-01-01'}
+    
+    language, analysis, entities, units, report = analyzer.analyze_revision(amended, previous)
+    assert entities['MONEY'] == ['$15,000']
+    assert units is None
+    assert report['counts']['modified'] == 1 and report['counts']['added'] == 1
+    assert report['changed_clause_types'] == ['payment_clauses']
+    assert [change['heading'] for change in report['changes']] == ['1. PAYMENT', '5. AUDIT']
+    
+    assert analyzer.analyze_revision(contract_text)[4] is None
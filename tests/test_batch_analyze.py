@@ -0,0 +1,68 @@
+import hashlib
+import json
+from pathlib import Path
+
+import pytest
+
+from batch_analyze import ParquetWriter, iter_input_files, run_batch
+
+CONTRACT = "This Agreement between Acme Corporation and John Smith may be terminated on notice. Fees are $500."
+
+@pytest.fixture
+def documents(tmp_path):
+    folder = tmp_path / 'contracts'
+    (folder / 'nested').mkdir(parents=True)
+    for index in range(3):
+        (folder / f"contract_{index}.txt").write_text(f"{CONTRACT} Schedule {index}.", encoding='utf-8')
+    (folder / 'nested' / 'amendment.txt').write_text(CONTRACT, encoding='utf-8')
+    (folder / 'notes.md').write_text('not a contract', encoding='utf-8')
+    return folder
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+def test_iter_input_files_finds_supported_files_once(documents):
+    paths = list(iter_input_files([str(documents), str(documents / '*.txt')]))
+    assert len(paths) == 4
+    assert not any(path.endswith('.md') for path in paths)
+    assert len(list(iter_input_files([str(documents)], recursive=False))) == 3
+
+def test_results_stream_to_jsonl_and_resume_skips_finished_files(documents, tmp_path):
+    output = str(tmp_path / 'results.jsonl')
+    assert run_batch([str(documents)], output, workers=2) == {'processed': 4, 'failed': 0, 'skipped': 0}
+    
+    records = read_jsonl(output)
+    assert len(records) == 4
+    assert all(record['error'] is None and record['analysis_result'] for record in records)
+    assert all(record['sha256'] == hashlib.sha256(Path(record['path']).read_bytes()).hexdigest() for record in records)
+    
+    (documents / 'late.txt').write_text(CONTRACT, encoding='utf-8')
+    assert run_batch([str(documents)], output, workers=2) == {'processed': 1, 'failed': 0, 'skipped': 4}
+    assert len(read_jsonl(output)) == 5
+
+def test_failed_files_are_retried_with_retry_failed(documents, tmp_path):
+    (documents / 'empty.txt').write_text('', encoding='utf-8')
+    output = str(tmp_path / 'results.jsonl')
+    
+    counts = run_batch([str(documents)], output, workers=2, retry_failed=True)
+    assert (counts['processed'], counts['failed']) == (4, 1)
+    assert run_batch([str(documents)], output, workers=2, retry_failed=True)['failed'] == 1
+
+def test_parquet_output(documents, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    output = str(tmp_path / 'results.parquet')
+    run_batch([str(documents)], output, workers=2)
+    
+    table = pq.read_table(output)
+    assert table.num_rows == 4
+    assert json.loads(table.column('entities')[0].as_py())['MONEY'] == ['$500']
+
+def test_parquet_rows_count_as_done_only_once_their_row_group_is_written(tmp_path):
+    pytest.importorskip('pyarrow')
+    writer = ParquetWriter(str(tmp_path / 'results.parquet'), row_group_size=2)
+    
+    assert writer.write({'path': 'a.txt'}) == []
+    assert writer.write({'path': 'b.txt'}) == ['a.txt', 'b.txt']
+    assert writer.write({'path': 'c.txt'}) == []
+    assert writer.close() == ['c.txt']
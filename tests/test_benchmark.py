@@ -0,0 +1,38 @@
+import io
+
+from benchmark import SyntheticContractGenerator, compare_results, run_benchmarks
+from legal_core import LegalDocumentAnalyzer
+
+def test_synthetic_documents_are_reproducible_and_extractable():
+    text = SyntheticContractGenerator(seed=3).text(2)
+    assert text == SyntheticContractGenerator(seed=3).text(2)
+    assert text != SyntheticContractGenerator(seed=4).text(2)
+    
+    pdf_bytes = SyntheticContractGenerator(seed=3).to_pdf(2)
+    assert LegalDocumentAnalyzer().extract_text_from_pdf(io.BytesIO(pdf_bytes)).strip()
+
+def test_run_benchmarks_reports_each_selected_stage():
+    results = run_benchmarks([1], ['en'], stages={'extract_txt', 'basic_analysis', 'db_user_stats'},
+                             min_iterations=1, max_iterations=1, min_seconds=0, db_operations=5)
+    
+    assert set(results) == {'extract_txt[en,1p]', 'basic_analysis[en,1p]', 'db_user_stats[en,5rows]'}
+    for result in results.values():
+        assert result['iterations'] >= 1
+        assert result['p50_ms'] >= 0 and result['peak_memory_kb'] > 0
+
+def test_pdf_stage_is_skipped_when_extraction_fails(monkeypatch):
+    options = dict(stages={'extract_pdf'}, min_iterations=1, max_iterations=1, min_seconds=0)
+    assert set(run_benchmarks([1], ['en'], **options)) == {'extract_pdf[en,1p]'}
+    
+    monkeypatch.setattr(LegalDocumentAnalyzer, 'extract_text_from_pdf', lambda self, file: '')
+    assert run_benchmarks([1], ['en'], **options) == {}
+
+def test_compare_results_flags_slowdowns_past_the_threshold():
+    baseline = {'results': {'a': {'p50_ms': 10.0, 'peak_memory_kb': 100.0},
+                            'b': {'p50_ms': 10.0, 'peak_memory_kb': 100.0}}}
+    results = {'a': {'p50_ms': 11.0, 'peak_memory_kb': 100.0},
+               'b': {'p50_ms': 10.0, 'peak_memory_kb': 130.0},
+               'c': {'p50_ms': 99.0, 'peak_memory_kb': 999.0}}
+    
+    regressions = compare_results(results, baseline, threshold=0.15)
+    assert [(key, metric) for key, metric, *_ in regressions] == [('b', 'peak_memory_kb')]
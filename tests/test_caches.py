@@ -0,0 +1,88 @@
+from legal_core import AnalysisCache, TranslationMemory
+
+def test_analysis_cache_round_trip_and_stats(cache_db):
+    cache = AnalysisCache(cache_db)
+    key = cache.make_key('analysis', 'text', 'model', 'en')
+    
+    assert cache.get(key) is None
+    cache.set(key, 'analysis', {'summary': 'ok', 'parties': ['Acme']})
+    assert cache.get(key) == {'summary': 'ok', 'parties': ['Acme']}
+    
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    assert stats['hit_rate'] == 0.5
+    
+    cache.clear()
+    assert cache.get(key) is None
+
+def test_analysis_cache_key_covers_everything_that_shapes_the_response(cache_db):
+    cache = AnalysisCache(cache_db)
+    base = cache.make_key('analysis', 'text', 'model', 'en')
+    assert base == cache.make_key('analysis', 'text', 'model', 'en')
+    assert base != cache.make_key('analysis', 'text', 'model', 'fr')
+    assert base != cache.make_key('analysis', 'text', 'other-model', 'en')
+    assert base != cache.make_key('entities', 'text', 'model', 'en')
+    assert base != cache.make_key('analysis', 'text.', 'model', 'en')
+
+def test_analysis_cache_expires_entries(cache_db):
+    cache = AnalysisCache(cache_db, ttl_days=0)
+    cache.set('key', 'analysis', {'summary': 'old'})
+    
+    assert cache.get('key') is None
+    assert cache.get_stats()['entries'] == 0
+
+def test_analysis_cache_evicts_least_recently_used_past_size_limit(cache_db):
+    cache = AnalysisCache(cache_db, max_size_mb=250 / (1024 * 1024))
+    cache.set('first', 'analysis', 'a' * 100)
+    cache.set('second', 'analysis', 'b' * 100)
+    cache.get('first')
+    cache.set('third', 'analysis', 'c' * 100)
+    
+    assert cache.get('second') is None
+    assert cache.get('first') == 'a' * 100
+    assert cache.get('third') == 'c' * 100
+
+def running_total(pool, stats_table, table):
+    with pool.connection() as conn:
+        total = conn.execute(f"SELECT value FROM {stats_table} WHERE name = 'size_bytes'").fetchone()[0]
+        actual = conn.execute(f'SELECT COALESCE(SUM(size_bytes), 0) FROM {table}').fetchone()[0]
+    return total, actual
+
+def test_analysis_cache_keeps_a_running_size_total(cache_db):
+    cache = AnalysisCache(cache_db, max_size_mb=1000 / (1024 * 1024))
+    for index in range(20):
+        cache.set(f"key-{index % 7}", 'analysis', 'x' * (index * 10))
+        total, actual = running_total(cache.pool, 'cache_stats', 'analysis_cache')
+        assert total == actual <= 1000
+    
+    # A second instance picks up the stored total instead of recounting
+    assert running_total(AnalysisCache(cache_db).pool, 'cache_stats', 'analysis_cache')[0] == actual
+    cache.clear()
+    assert running_total(cache.pool, 'cache_stats', 'analysis_cache') == (0, 0)
+
+def test_translation_memory_ignores_whitespace_differences(cache_db):
+    memory = TranslationMemory(cache_db)
+    key = memory.make_key('Governing  law\n clause.', 'model', 'fr', 'en')
+    assert key == memory.make_key(' Governing law clause. ', 'model', 'fr', 'en')
+    assert key != memory.make_key('Governing law clause.', 'model', 'es', 'en')
+    
+    memory.put_many([(key, 'en', 'fr', 'Clause de droit applicable.')])
+    assert memory.get_many([key, 'missing', key]) == {key: 'Clause de droit applicable.'}
+    
+    stats = memory.get_stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+    
+    memory.clear()
+    assert memory.get_many([key]) == {}
+
+def test_translation_memory_evicts_least_recently_used_segments(cache_db):
+    memory = TranslationMemory(cache_db, max_size_mb=250 / (1024 * 1024))
+    memory.put_many([('first', 'en', 'fr', 'a' * 100), ('second', 'en', 'fr', 'b' * 100)])
+    memory.get_many(['first'])
+    memory.put_many([('third', 'en', 'fr', 'c' * 50), ('third', 'en', 'fr', 'c' * 100)])
+    
+    assert memory.get_many(['first', 'second', 'third']) == {'first': 'a' * 100, 'third': 'c' * 100}
+    assert running_total(memory.pool, 'translation_memory_stats', 'translation_memory') == (200, 200)
+    
+    memory.put_many([('first', 'en', 'fr', 'a' * 10)])
+    assert running_total(memory.pool, 'translation_memory_stats', 'translation_memory') == (110, 110)
@@ -0,0 +1,71 @@
+from legal_core import DocumentChunker, diff_sections
+
+def make_document(sections=40, sentences=12):
+    return ''.join(
+        f"{number}. SECTION {number}\n" + ' '.join(f"The parties agree to term {number}.{i}." for i in range(sentences)) + '\n\n'
+        for number in range(1, sections + 1)
+    )
+
+def test_short_documents_are_not_chunked():
+    chunker = DocumentChunker(max_chunk_chars=1000)
+    assert chunker.split('short text') == ['short text']
+
+def test_chunks_fit_the_limit_and_rebuild_the_document():
+    text = make_document()
+    chunks = DocumentChunker(max_chunk_chars=2000, overlap_chars=0).split(text)
+    
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    assert ''.join(chunks) == text
+
+def test_chunks_break_at_section_headings():
+    chunks = DocumentChunker(max_chunk_chars=2000, overlap_chars=0).split(make_document())
+    assert all(chunk.startswith(tuple(f"{n}. SECTION" for n in range(1, 41))) for chunk in chunks)
+
+def test_each_chunk_starts_with_the_tail_of_the_previous_one():
+    chunks = DocumentChunker(max_chunk_chars=2000, overlap_chars=200).split(make_document())
+    
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk[:50] in previous[-200:]
+
+def test_iter_chunks_matches_split_for_streamed_pages():
+    text = make_document()
+    chunker = DocumentChunker(max_chunk_chars=2000, overlap_chars=200)
+    pages = [text[i:i + 700] for i in range(0, len(text), 700)]
+    assert list(chunker.iter_chunks(pages)) == chunker.split(text)
+    assert list(chunker.iter_chunks(['short ', 'text'])) == ['short text']
+
+def test_segments_and_sections_keep_every_character():
+    text = make_document(sections=5, sentences=40)
+    chunker = DocumentChunker()
+    
+    segments = chunker.split_segments(text, max_segment_chars=300)
+    assert ''.join(segments) == text
+    assert all(len(segment) <= 300 for segment in segments)
+    
+    sections = chunker.split_sections(text)
+    assert ''.join(sections) == text
+    assert len(sections) == 5
+    
+    long_sections = chunker.split_sections(text, max_section_chars=300)
+    assert ''.join(long_sections) == text
+    assert all(len(section) <= 300 for section in long_sections)
+
+def test_diff_sections_reports_modified_added_and_removed():
+    old = ['1. Intro\nThe parties agree.\n', '2. Payment\nPay $100 within 30 days of invoice.\n', '3. Term\nOne year.\n']
+    new = ['1. Intro\nThe  parties agree.\n', '2. Payment\nPay $200 within 30 days of invoice.\n',
+           '4. Audit\nRecords may be inspected.\n']
+    changes = diff_sections(old, new)
+    
+    assert [change['change'] for change in changes] == ['unchanged', 'modified', 'removed', 'added']
+    modified = changes[1]
+    assert (modified['old_index'], modified['new_index']) == (1, 1)
+    assert 0.3 <= modified['similarity'] < 1
+    assert changes[2]['old_text'] == old[2] and changes[2]['new_text'] is None
+    assert changes[3]['new_text'] == new[2] and changes[3]['old_text'] is None
+
+def test_diff_sections_detects_insertions_without_pairing():
+    old = ['A first.\n', 'C third.\n']
+    new = ['A first.\n', 'B second.\n', 'C third.\n']
+    assert [change['change'] for change in diff_sections(old, new)] == ['unchanged', 'added', 'unchanged']
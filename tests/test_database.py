@@ -0,0 +1,57 @@
+import sqlite3
+import threading
+
+import pytest
+
+from legal_core import AnalysisCache, UserManager, get_connection_pool
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'app.db')
+
+def test_pool_is_shared_per_file_and_uses_wal(db_path):
+    pool = get_connection_pool(db_path)
+    assert get_connection_pool(db_path) is pool
+    with pool.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+def test_connections_are_reused_and_roll_back_on_error(db_path):
+    pool = get_connection_pool(db_path)
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE items (name TEXT)')
+        first = conn
+    
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.connection() as conn:
+            assert conn is first
+            conn.execute("INSERT INTO items VALUES ('lost')")
+            conn.execute('SELECT missing FROM items')
+    
+    with pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+
+def test_concurrent_writers_share_the_pool(db_path):
+    cache = AnalysisCache(db_path)
+    
+    def write(worker):
+        for index in range(20):
+            cache.set(f"{worker}-{index}", 'analysis', {'worker': worker})
+    
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get_stats()['entries'] == 160
+
+def test_user_manager_registers_and_logs_in(db_path):
+    users = UserManager(db_path)
+    assert users.register_user('alice', 'secret', email='alice@example.com')[0]
+    assert users.register_user('alice', 'other') == (False, "Username already exists!")
+    
+    assert users.login_user('alice', 'wrong') == (False, None)
+    ok, user = users.login_user('alice', 'secret')
+    assert ok and user[1] == 'alice'
+    
+    users.update_gemini_key(user[0], 'key-123')
+    assert users.get_gemini_key(user[0]) == 'key-123'
@@ -0,0 +1,66 @@
+from legal_core import EntityExtractor, EntityHighlighter, paginate_text
+
+def test_mentions_carry_offsets_counts_and_first_seen_order():
+    text = "Payment of $5,000 is due from Beta LLC on 03/01/2024. Beta LLC may pay €200 instead."
+    entities = EntityExtractor().extract(text)
+    
+    assert entities['ORGANIZATIONS'] == [{'text': 'Beta LLC', 'count': 2, 'offsets': [[30, 38], [54, 62]]}]
+    assert [entity['text'] for entity in entities['MONEY']] == ['$5,000', '€200']
+    assert entities['DATES'][0]['text'] == '03/01/2024'
+    for found in entities.values():
+        for entity in found:
+            assert all(text[start:end] == entity['text'] for start, end in entity['offsets'])
+
+def test_mentions_may_overlap_across_types():
+    text = "Payment of $5,000 is due from Smith Company on March 1, 2024."
+    mentions = list(EntityExtractor().iter_mentions(text))
+    
+    assert all(text[mention.start:mention.end] == mention.text for mention in mentions)
+    assert [mention.start for mention in mentions] == sorted(mention.start for mention in mentions)
+    found = {(mention.entity_type, mention.text) for mention in mentions}
+    assert ('MONEY', '$5,000') in found
+    assert ('ORGANIZATIONS', 'Smith Company') in found
+    assert ('PERSONS', 'Smith Company') in found
+
+def test_organization_names_ending_in_a_period():
+    # The pattern ends in (?!\w) rather than \b, so "Inc." and "Corp." match before a space or at the end
+    # of the text, but not when the period runs straight into a word
+    text = "Acme Inc. and Beta Corp. signed with Delta LLC; see Gamma Inc.net for details. Signed by Omega Corp."
+    organizations = EntityExtractor().extract_names(text)['ORGANIZATIONS']
+    assert organizations == ['Acme Inc.', 'Beta Corp.', 'Delta LLC', 'Omega Corp.']
+
+def test_extract_batch_matches_single_documents():
+    texts = ["Acme Corporation pays $10.", "Nothing to see here.", "John Smith signed on 1/2/2023."]
+    extractor = EntityExtractor()
+    assert extractor.extract_batch(texts) == [extractor.extract(text) for text in texts]
+
+def test_highlighter_marks_entities_case_insensitively_and_escapes():
+    highlighter = EntityHighlighter(['Acme Corporation', 'x'])
+    html = highlighter.to_html('acme corporation <b> and Acme Corporation')
+    assert html == ('<mark class="entity-highlight">acme corporation</mark> &lt;b&gt; and '
+                    '<mark class="entity-highlight">Acme Corporation</mark>')
+
+def test_highlighter_marks_nested_entities_inside_longer_ones():
+    highlighter = EntityHighlighter(['Smith', 'Smith & Co', 'Acme'])
+    html = highlighter.to_html('Smith & Co <Acme>')
+    assert html == ('<mark class="entity-highlight"><mark class="entity-highlight">Smith</mark> &amp; Co</mark> '
+                    '&lt;<mark class="entity-highlight">Acme</mark>&gt;')
+
+def test_highlighter_renders_a_page_of_the_text():
+    highlighter = EntityHighlighter(['Acme'])
+    text = 'Acme one. Acme two.'
+    assert list(highlighter.iter_spans(text, 5)) == [(10, 14)]
+    assert highlighter.to_html(text, 10, 19) == '<mark class="entity-highlight">Acme</mark> two.'
+
+def test_highlighter_without_entities_only_escapes():
+    assert EntityHighlighter(['ab']).to_html('a < b') == 'a &lt; b'
+    assert EntityHighlighter([]).to_html('a < b') == 'a &lt; b'
+
+def test_paginate_text_breaks_at_line_ends_and_covers_the_text():
+    text = ''.join(f"Line {number} of the agreement.\n" for number in range(1000))
+    pages = paginate_text(text, page_size=1000)
+    
+    assert pages[0][0] == 0 and pages[-1][1] == len(text)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(pages, pages[1:]))
+    assert all(text[end - 1] == '\n' and end - start <= 1000 for start, end in pages)
+    assert paginate_text('') == [(0, 0)]
@@ -0,0 +1,32 @@
+import pytest
+
+from legal_core import LegalDocumentAnalyzer
+
+PAGES = [f"Page {number}\nThe Supplier shall deliver batch {number} within ten days." for number in range(1, 8)]
+
+def test_pdf_pages_stream_in_order(make_pdf):
+    path = make_pdf(PAGES)
+    pages = list(LegalDocumentAnalyzer().iter_pdf_pages(path))
+    assert [page.strip() for page in pages] == PAGES
+
+def test_pdf_pages_stay_in_order_with_worker_processes(make_pdf):
+    path = make_pdf(PAGES)
+    analyzer = LegalDocumentAnalyzer()
+    assert list(analyzer.iter_pdf_pages(path, workers=2, pages_per_task=2)) == list(analyzer.iter_pdf_pages(path))
+
+def test_extract_text_from_path(make_pdf, tmp_path):
+    analyzer = LegalDocumentAnalyzer()
+    assert analyzer.extract_text_from_path(make_pdf(PAGES[:2])).split('\n')[0] == 'Page 1'
+    
+    text_file = tmp_path / 'contract.txt'
+    text_file.write_text('Plain contract text', encoding='utf-8')
+    assert analyzer.extract_text_from_path(str(text_file)) == 'Plain contract text'
+
+def test_unreadable_files_report_errors_instead_of_raising(tmp_path):
+    errors = []
+    broken = tmp_path / 'broken.pdf'
+    broken.write_bytes(b'not a pdf')
+    assert LegalDocumentAnalyzer(on_error=errors.append).extract_text_from_path(str(broken)) == ''
+    assert len(errors) == 1
+    with pytest.raises(Exception):
+        list(LegalDocumentAnalyzer().iter_text_from_path(str(broken)))
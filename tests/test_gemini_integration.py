@@ -0,0 +1,290 @@
+import json
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from legal_core import (AnalysisCache, FakeGeminiModel, GeminiIntegration, LegalDocumentAnalyzer, RateLimiter,
+                        collect_messages, get_gemini_integration)
+
+CONTRACT = "This Agreement between Acme Corporation and John Smith may be terminated on notice. Fees are $500."
+
+class ScriptedResponse:
+    def __init__(self, text):
+        self.text = text
+
+class ScriptedModel:
+    """Stands in for genai.GenerativeModel, answering every prompt with reply(prompt)"""
+    
+    def __init__(self, reply, delay=0.0):
+        self.reply = reply
+        self.delay = delay
+        self.prompts = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+    
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        with self._lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            text = self.reply(prompt)
+            if stream:
+                return [ScriptedResponse(text[i:i + 8]) for i in range(0, len(text), 8)]
+            return ScriptedResponse(text)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def combined_reply(prompt):
+    return json.dumps({
+        'language': 'en',
+        'analysis': {'document_type': 'Services Agreement', 'summary': 'A services agreement.'},
+        'entities': {'ORGANIZATIONS': ['Acme Corporation']}
+    })
+
+@pytest.fixture
+def integration(cache_db):
+    integration = GeminiIntegration(cache=AnalysisCache(cache_db), max_workers=8, max_concurrency=2, backoff_base=0.0)
+    integration.is_configured = True
+    # A private limiter, so tests don't share the per-key quota
+    integration.rate_limiter = RateLimiter(requests_per_minute=6000)
+    yield integration
+    integration.executor.shutdown(wait=True)
+
+def test_combined_analysis_is_one_cached_call(integration):
+    integration.model = ScriptedModel(combined_reply)
+    result = integration.analyze_combined(CONTRACT)
+    
+    assert result['language'] == 'en'
+    assert result['analysis']['document_type'] == 'Services Agreement'
+    # Fields the model left out are filled in, so callers can rely on the schema
+    assert result['analysis']['jurisdiction'] == 'Not specified'
+    assert result['entities']['ORGANIZATIONS'] == ['Acme Corporation']
+    assert result['entities']['PERSONS'] == []
+    
+    assert integration.analyze_combined(CONTRACT) == result
+    assert len(integration.model.prompts) == 1
+
+def test_unparseable_combined_reply_falls_back_to_separate_calls(integration):
+    integration.model = ScriptedModel(lambda prompt: 'not json')
+    result = integration.analyze_combined(CONTRACT)
+    
+    assert len(integration.model.prompts) > 1
+    assert set(result) == {'language', 'analysis', 'entities'}
+    assert 'summary' in result['analysis']
+
+def test_long_documents_are_analyzed_per_chunk_and_merged(integration):
+    def reply(prompt):
+        names = ['Acme Corporation'] + (['Beta LLC'] if 'Beta LLC' in prompt else [])
+        return json.dumps({'language': 'en', 'analysis': {'parties': names}, 'entities': {'ORGANIZATIONS': names}})
+    
+    integration.model = ScriptedModel(reply)
+    integration.chunker.max_chunk_chars = 400
+    integration.chunker.overlap_chars = 0
+    text = '\n\n'.join([CONTRACT] * 6 + ["Beta LLC joins as guarantor."])
+    result = integration.analyze_combined(text)
+    
+    assert len(integration.model.prompts) == len(integration.chunker.split(text)) > 1
+    assert result['entities']['ORGANIZATIONS'] == ['Acme Corporation', 'Beta LLC']
+    assert result['analysis']['parties'] == ['Acme Corporation', 'Beta LLC']
+
+def test_documents_fan_out_within_the_concurrency_limit(integration):
+    integration.model = ScriptedModel(combined_reply, delay=0.05)
+    texts = [f"{CONTRACT} Schedule {index}." for index in range(6)]
+    results = LegalDocumentAnalyzer(integration).analyze_documents(texts)
+    
+    assert len(results) == 6
+    assert all(language == 'en' for language, _, _ in results)
+    assert integration.model.peak_in_flight == 2
+
+def test_map_concurrent_keeps_order_and_times_out(integration):
+    assert integration.map_concurrent(lambda item: item * 2, [3, 1, 2]) == [6, 2, 4]
+    with pytest.raises(TimeoutError):
+        integration.map_concurrent(time.sleep, [0.5, 0.5], timeout=0.05)
+
+def test_cancelling_a_fan_out_stops_only_its_own_requests(integration):
+    integration.model = ScriptedModel(lambda prompt: prompt, delay=0.1)
+    cancel = threading.Event()
+    outcome = []
+    
+    def cancelled_caller():
+        try:
+            integration.map_concurrent(lambda item: integration._generate(f"a{item}").text, range(8), cancel=cancel)
+        except CancelledError:
+            outcome.append('cancelled')
+    
+    thread = threading.Thread(target=cancelled_caller)
+    thread.start()
+    time.sleep(0.05)
+    cancel.set()
+    other = integration.map_concurrent(lambda item: integration._generate(f"b{item}").text, range(3))
+    thread.join()
+    
+    assert outcome == ['cancelled']
+    assert other == ['b0', 'b1', 'b2']
+    assert sum(prompt.startswith('a') for prompt in integration.model.prompts) < 8
+
+def test_waiting_too_long_for_a_request_slot_is_retried(integration):
+    integration.model = ScriptedModel(combined_reply)
+    integration.request_timeout = 0.05
+    # Both slots are busy until a slow request finishes after the first wait has timed out
+    integration._request_slots.acquire()
+    integration._request_slots.acquire()
+    threading.Timer(0.08, integration._request_slots.release).start()
+    
+    assert integration._generate('prompt').text
+    assert len(integration.model.prompts) == 1
+    
+    integration._request_slots.acquire()
+    integration.max_retries = 0
+    with pytest.raises(TimeoutError):
+        integration._generate('prompt')
+
+def test_quota_and_server_errors_are_retried(integration):
+    failures = ['429 Resource has been exhausted', '503 Service Unavailable']
+    
+    def reply(prompt):
+        if failures:
+            raise RuntimeError(failures.pop(0))
+        return combined_reply(prompt)
+    
+    integration.model = ScriptedModel(reply)
+    assert integration.analyze_combined(CONTRACT)['language'] == 'en'
+    assert len(integration.model.prompts) == 3
+    assert integration.rate_limiter.get_stats()['rate_limited'] == 1
+
+def test_client_errors_are_not_retried(integration):
+    def reply(prompt):
+        raise RuntimeError('400 Request contains an invalid argument')
+    
+    integration.model = ScriptedModel(reply)
+    integration.max_retries = 3
+    with pytest.raises(RuntimeError):
+        integration._generate('prompt')
+    assert len(integration.model.prompts) == 1
+
+def test_streamed_documents_are_analyzed_chunk_by_chunk(integration):
+    integration.model = ScriptedModel(combined_reply)
+    integration.chunker.max_chunk_chars = 400
+    integration.chunker.overlap_chars = 0
+    pages = [f"{CONTRACT} Page {number}.\n\n" for number in range(8)]
+    
+    text, result = integration.analyze_combined_stream(iter(pages))
+    assert text == ''.join(pages)
+    assert len(integration.model.prompts) == len(integration.chunker.split(text))
+    assert result['entities']['ORGANIZATIONS'] == ['Acme Corporation']
+
+def test_one_shared_client_per_api_key(tmp_path, monkeypatch):
+    pytest.importorskip('google.generativeai')
+    # The shared clients use the default cache database in the working directory
+    monkeypatch.chdir(tmp_path)
+    first = get_gemini_integration('test-key-1')
+    assert first.is_configured
+    assert get_gemini_integration('test-key-1') is first
+    assert get_gemini_integration('test-key-2') is not first
+
+def test_amended_documents_only_resend_changed_sections(integration):
+    integration.model = ScriptedModel(combined_reply)
+    sections = [f"{number}. SECTION {number}\n{CONTRACT}\n\n" for number in range(1, 7)]
+    
+    _, units, reanalyzed = integration.analyze_sections(sections, max_unit_chars=250)
+    assert len(units) > 1
+    assert len(integration.model.prompts) == len(units)
+    assert reanalyzed == len(''.join(sections))
+    
+    sections[2] = sections[2].replace('$500', '$900')
+    combined, _, reanalyzed = integration.analyze_sections(sections, previous_units=units, max_unit_chars=250)
+    assert len(integration.model.prompts) == len(units) + 1
+    assert 0 < reanalyzed < len(''.join(sections))
+    assert combined['entities']['ORGANIZATIONS'] == ['Acme Corporation']
+
+def shouting_reply(prompt):
+    """Translates by upper-casing, for both batched (JSON) and single-segment prompts"""
+    if 'Segments: ' in prompt:
+        segments = json.loads(prompt.split('Segments: ')[1].split('\n')[0])
+        return json.dumps([segment.upper() for segment in segments])
+    segment = prompt.split('Text to translate: ')[1].split('\n')[0]
+    return segment.upper()
+
+def test_translation_streams_the_first_segment_and_reuses_memory(integration):
+    integration.model = ScriptedModel(shouting_reply)
+    text = "\n\n".join(f"Clause {n}. The tenant shall pay rent number {n} on time." for n in range(1, 6))
+    segments = integration.chunker.split_segments(text, max_segment_chars=60)
+    
+    events = list(integration.iter_translation(segments, 'fr', 'en'))
+    final = {index: translation for index, translation, complete in events if complete}
+    assert ''.join(final[index] for index in range(len(segments))) == text.upper()
+    assert any(not complete for _, _, complete in events)
+    
+    prompts = len(integration.model.prompts)
+    assert integration.translate_text(text, 'fr', 'en') == text.upper()
+    assert len(integration.model.prompts) == prompts
+
+def test_combined_analysis_is_cached(make_integration, contract_text):
+    model = FakeGeminiModel()
+    integration = make_integration(model)
+    
+    first = integration.analyze_combined(contract_text)
+    assert first['language'] == 'en'
+    assert first['analysis']['clauses']['payment']
+    assert 'Acme Corporation' in first['entities']['ORGANIZATIONS']
+    
+    assert integration.analyze_combined(contract_text) == first
+    assert model.get_stats()['requests'] == 1
+
+def test_long_documents_are_analyzed_in_chunks_and_merged(make_integration, contract_text):
+    integration = make_integration()
+    integration.chunker.max_chunk_chars = 400
+    integration.chunker.overlap_chars = 50
+    
+    result = integration.analyze_combined(contract_text)
+    assert integration.model.get_stats()['requests'] > 1
+    assert result['analysis']['clauses']['termination']
+    assert 'John Smith' in result['entities']['PERSONS']
+
+def test_translation_reuses_translation_memory(make_integration):
+    model = FakeGeminiModel()
+    integration = make_integration(model)
+    text = "The supplier shall deliver the goods.\n\nThe buyer shall pay on delivery.\n"
+    
+    translated = integration.translate_text(text, 'fr', 'en')
+    assert translated == "[fr] The supplier shall deliver the goods.\n\n[fr] The buyer shall pay on delivery.\n"
+    requests = model.get_stats()['requests']
+    
+    # Only the new paragraph is sent; the shared one comes from the translation memory
+    integration.translate_text("The buyer shall pay on delivery.\n\nNotices must be in writing.\n", 'fr', 'en')
+    assert model.get_stats()['requests'] == requests + 1
+    assert integration.translation_memory.get_stats()['hits'] >= 1
+
+def test_analyzer_uses_gemini_when_configured(make_integration, contract_text):
+    analyzer = LegalDocumentAnalyzer(make_integration())
+    language, analysis, entities = analyzer.analyze_document_full(contract_text)
+    assert language == 'en'
+    assert analysis['summary'].startswith('Local fake analysis')
+    assert entities['MONEY'] == ['$12,000']
+
+def test_exhausted_quota_skips_the_split_call_fallback(make_integration, contract_text):
+    model = FakeGeminiModel(quota_per_minute=0)
+    integration = make_integration(model, max_retries=1)
+    
+    with collect_messages() as messages:
+        result = integration.analyze_combined(contract_text)
+    
+    assert model.get_stats()['requests'] == 2
+    assert 'quota exhausted' in result['analysis']['summary']
+    assert 'Acme Corporation' in result['entities']['ORGANIZATIONS']
+    assert [level for level, _ in messages] == ['warning']
+
+def test_warnings_from_worker_threads_are_collected(make_integration, contract_text):
+    integration = make_integration(FakeGeminiModel(quota_per_minute=0), max_retries=1)
+    integration.chunker.max_chunk_chars = 400
+    integration.chunker.overlap_chars = 50
+    
+    with collect_messages() as messages:
+        integration.analyze_combined(contract_text)
+    assert messages and all(level == 'warning' for level, _ in messages)
@@ -0,0 +1,90 @@
+import zlib
+
+import pytest
+
+from legal_core import UserManager
+
+@pytest.fixture
+def users(tmp_path):
+    return UserManager(str(tmp_path / 'app.db'))
+
+def save(users, user_id, name, document_type='Lease', words=100, language='en'):
+    return users.save_analysis(user_id, name, document_type, words, language, 'en', f"Summary of {name}")
+
+def test_history_pages_walk_every_analysis_newest_first(users):
+    for index in range(7):
+        save(users, 'alice', f"doc-{index}.pdf")
+    save(users, 'bob', 'other.pdf')
+    
+    names = []
+    cursor = None
+    while True:
+        rows, cursor = users.get_history_page('alice', page_size=3, cursor=cursor)
+        names.extend(row[0] for row in rows)
+        if cursor is None:
+            break
+    assert names == [f"doc-{index}.pdf" for index in reversed(range(7))]
+    assert [row[0] for row in users.get_user_history('alice', limit=2)] == ['doc-6.pdf', 'doc-5.pdf']
+
+def test_stats_cover_the_whole_history(users):
+    save(users, 'alice', 'a.pdf', 'Lease', 100, 'en')
+    save(users, 'alice', 'b.pdf', 'Lease', 50, 'fr')
+    save(users, 'alice', 'c.pdf', 'NDA', 25, 'fr')
+    
+    stats = users.get_user_stats('alice')
+    assert (stats['total_analyses'], stats['total_words']) == (3, 175)
+    assert stats['document_types'] == {'Lease': 2, 'NDA': 1}
+    assert stats['original_languages'] == {'fr': 2, 'en': 1}
+    assert (stats['top_document_type'], stats['top_language']) == ('Lease', 'fr')
+    assert users.get_user_stats('nobody')['total_analyses'] == 0
+
+def save_with_results(users, user_id, name, summary, organizations, clauses):
+    return users.save_analysis(user_id, name, 'Agreement', 100, 'en', 'en', summary,
+                               analysis_result={'summary': summary, 'clauses': clauses},
+                               entities={'ORGANIZATIONS': organizations})
+
+def test_search_finds_analyses_by_entity_and_clause_text(users):
+    save_with_results(users, 'alice', 'msa.pdf', 'Master services agreement', ['Acme Corporation'],
+                      {'indemnity': ['Supplier shall indemnify the Customer']})
+    save_with_results(users, 'alice', 'nda.pdf', 'Mutual confidentiality agreement', ['Globex LLC'],
+                      {'confidentiality': ['Recipient shall keep information confidential']})
+    save_with_results(users, 'bob', 'bob.pdf', 'Acme lease', ['Acme Corporation'], {})
+    
+    assert [row[0] for row in users.search_history('alice', 'Acme')] == ['msa.pdf']
+    assert [row[0] for row in users.search_history('alice', 'indemn')] == ['msa.pdf']
+    assert [row[0] for row in users.search_history('alice', 'globex')] == ['nda.pdf']
+    assert '[' in users.search_history('alice', 'Globex')[0][4]
+    assert users.search_history('alice', '  ') == []
+
+def test_plain_language_searches_rank_the_best_match_first(users):
+    save_with_results(users, 'alice', 'msa.pdf', 'Master services agreement', ['Acme Corporation'],
+                      {'arbitration': ['Disputes go to arbitration']})
+    save_with_results(users, 'alice', 'lease.pdf', 'Acme office lease', ['Acme Corporation'], {})
+    
+    rows = users.search_history('alice', 'which contracts named Acme with an arbitration clause')
+    assert [row[0] for row in rows] == ['msa.pdf', 'lease.pdf']
+    assert [row[-1] for row in rows] == [0, 0]
+
+def test_full_results_are_stored_once_and_reopened(users):
+    result = {'summary': 'Lease of premises', 'clauses': {'payment': ['Rent is due monthly']}}
+    kwargs = dict(analysis_result=result, entities={'PERSONS': ['Jane Roe']}, text='Full lease text',
+                  translated_text='Texte du bail', ai_engine='Basic Analysis')
+    first = users.save_analysis('alice', 'lease.pdf', 'Lease', 3, 'en', 'fr', 'Lease of premises', **kwargs)
+    second = users.save_analysis('alice', 'lease-copy.pdf', 'Lease', 3, 'en', 'fr', 'Lease of premises', **kwargs)
+    
+    stored = users.load_analysis('alice', first)
+    assert stored['document_name'] == 'lease.pdf'
+    assert stored['analysis_result'] == result
+    assert (stored['text'], stored['translated_text']) == ('Full lease text', 'Texte du bail')
+    assert users.load_analysis('alice', second)['document_name'] == 'lease-copy.pdf'
+    with users.pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM analysis_results').fetchone()[0] == 1
+    
+    assert users.load_analysis('bob', first) is None
+    assert users.load_analysis('alice', save(users, 'alice', 'bare.pdf')) is None
+
+def test_corrupted_results_fail_the_integrity_check(users):
+    analysis_id = users.save_analysis('alice', 'a.pdf', 'Lease', 1, 'en', 'en', 'A', analysis_result={'summary': 'A'})
+    with users.pool.connection() as conn:
+        conn.execute("UPDATE analysis_results SET payload = ?", (zlib.compress(b'{"summary": "B"}'),))
+    assert users.load_analysis('alice', analysis_id) is None
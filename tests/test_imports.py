@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('streamlit', 'pandas', 'PyPDF2', 'docx', 'google.generativeai', 'langdetect')
+
+def loaded_modules(module):
+    """Import a module in a fresh interpreter and return the heavy dependencies it loaded"""
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.split()
+
+@pytest.mark.parametrize('module', ['legal_core', 'batch_analyze'])
+def test_headless_modules_import_only_the_standard_library(module):
+    assert loaded_modules(module) == []
+
+def test_app_import_has_no_streamlit_side_effects(tmp_path):
+    # Streamlit page setup happens in main(), so importing leaves the working directory untouched
+    pytest.importorskip('streamlit')
+    code = f"import sys; sys.path.insert(0, {REPO_ROOT!r}); import legal_analyzer"
+    subprocess.run([sys.executable, '-c', code], cwd=tmp_path, capture_output=True, check=True)
+    assert os.listdir(tmp_path) == []
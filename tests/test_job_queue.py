@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from legal_core import JobQueue, QueueFullError
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'), max_depth=10, max_attempts=2, backoff_base=0.0)
+
+def test_claim_and_complete(queue):
+    job_id = queue.enqueue('analyze_file', {'path': 'a.txt'}, user_id='alice')
+    job = queue.claim('worker-1')
+    assert job == {'id': job_id, 'kind': 'analyze_file', 'payload': {'path': 'a.txt'}, 'user_id': 'alice', 'attempts': 1}
+    assert queue.claim('worker-2') is None
+    
+    queue.complete(job_id, {'word_count': 3})
+    stored = queue.get(job_id)
+    assert stored['status'] == 'done'
+    assert stored['result'] == {'word_count': 3}
+    assert queue.get_depth() == {'queued': 0, 'running': 0, 'done': 1, 'dead': 0}
+
+def test_expired_lease_is_claimed_again(queue):
+    job_id = queue.enqueue('analyze_file', {})
+    assert queue.claim('worker-1', lease_seconds=-1)['id'] == job_id
+    
+    reclaimed = queue.claim('worker-2')
+    assert reclaimed['id'] == job_id
+    assert reclaimed['attempts'] == 2
+
+def test_expired_lease_on_final_attempt_is_dead_lettered(queue):
+    job_id = queue.enqueue('analyze_file', {}, max_attempts=1)
+    queue.claim('worker-1', lease_seconds=-1)
+    
+    assert queue.claim('worker-2') is None
+    job = queue.get(job_id)
+    assert job['status'] == 'dead'
+    assert job['error'] == 'Worker lease expired'
+
+def test_failures_retry_then_dead_letter_then_requeue(queue):
+    job_id = queue.enqueue('analyze_file', {})
+    queue.claim('worker')
+    assert queue.fail(job_id, 'timeout') == 'queued'
+    queue.claim('worker')
+    assert queue.fail(job_id, 'timeout again') == 'dead'
+    assert queue.get(job_id)['error'] == 'timeout again'
+    
+    assert queue.requeue(job_id)
+    assert queue.claim('worker')['attempts'] == 1
+
+def test_non_retryable_failure_is_dead_lettered_at_once(queue):
+    job_id = queue.enqueue('analyze_file', {})
+    queue.claim('worker')
+    assert queue.fail(job_id, 'bad input', retryable=False) == 'dead'
+
+def test_enqueue_refuses_work_past_max_depth(queue):
+    for _ in range(10):
+        queue.enqueue('analyze_file', {})
+    with pytest.raises(QueueFullError):
+        queue.enqueue('analyze_file', {})
+    
+    queue.complete(queue.claim('worker')['id'], {})
+    queue.enqueue('analyze_file', {})
+
+def test_enqueue_refuses_work_past_max_depth_under_concurrency(queue):
+    accepted = []
+    
+    def produce():
+        for _ in range(5):
+            try:
+                accepted.append(queue.enqueue('analyze_file', {}))
+            except QueueFullError:
+                pass
+    
+    threads = [threading.Thread(target=produce) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(accepted) == 10
+    assert queue.get_depth()['queued'] == 10
+    with pytest.raises(QueueFullError):
+        queue.enqueue('analyze_file', {})
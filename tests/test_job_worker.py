@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from job_worker import enqueue_analysis, run_job, start_workers, stop_workers
+from legal_core import JobQueue, LegalDocumentAnalyzer, UserManager
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'))
+
+def wait_for(queue, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in ('done', 'dead'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Job {job_id} did not finish: {queue.get(job_id)}")
+
+def test_run_job_saves_the_result_to_the_users_history(tmp_path, contract_text):
+    path = tmp_path / 'contract.txt'
+    path.write_text(contract_text, encoding='utf-8')
+    users = UserManager(str(tmp_path / 'app.db'))
+    job = {'kind': 'analyze_file', 'user_id': 'alice',
+           'payload': {'path': str(path), 'document_name': 'contract.txt', 'target_lang': 'en'}}
+    
+    record = run_job(job, LegalDocumentAnalyzer(), users)
+    assert record['entities']['MONEY'] == ['$12,000']
+    assert users.load_analysis('alice', record['analysis_id'])['document_name'] == 'contract.txt'
+
+def test_worker_processes_run_queued_jobs(tmp_path, queue, contract_text):
+    path = tmp_path / 'contract.txt'
+    path.write_text(contract_text, encoding='utf-8')
+    bad_path = tmp_path / 'empty.txt'
+    bad_path.write_text('', encoding='utf-8')
+    job_id = enqueue_analysis(queue, str(path), 'contract.txt')
+    bad_job_id = enqueue_analysis(queue, str(bad_path), 'empty.txt')
+    
+    workers, stop_event = start_workers(1, queue_db=queue.db_path, history_db=str(tmp_path / 'app.db'))
+    try:
+        job = wait_for(queue, job_id)
+        bad_job = wait_for(queue, bad_job_id)
+    finally:
+        stop_workers(workers, stop_event, timeout=30)
+    
+    assert job['status'] == 'done'
+    assert job['result']['entities']['MONEY'] == ['$12,000']
+    # Finished uploads are removed; bad input is dead-lettered at once and keeps its file
+    assert not path.exists()
+    assert bad_job['status'] == 'dead' and bad_job['attempts'] == 1
+    assert bad_path.exists()
+
+def test_workers_can_extract_pdfs_with_a_process_pool(tmp_path, queue, make_pdf):
+    pages = [f"Page {number}. Acme Corporation pays $500." for number in range(1, 4)]
+    job_id = enqueue_analysis(queue, make_pdf(pages), 'filing.pdf')
+    
+    workers, stop_event = start_workers(1, queue_db=queue.db_path, history_db=str(tmp_path / 'app.db'), pdf_workers=2)
+    try:
+        job = wait_for(queue, job_id)
+    finally:
+        stop_workers(workers, stop_event, timeout=30)
+    
+    assert job['status'] == 'done', job['error']
+    assert job['result']['entities']['MONEY'] == ['$500']
+    assert all(not worker.is_alive() for worker in workers)
@@ -0,0 +1,41 @@
+import pytest
+
+from legal_core import LanguageDetector, detect_language_local
+
+@pytest.mark.parametrize('language, text', [
+    ('en', "The tenant shall pay the rent on the first day of each month and keep the premises in good repair."),
+    ('es', "El arrendatario deberá pagar la renta el primer día de cada mes y mantener el inmueble en buen estado."),
+    ('fr', "Le locataire doit payer le loyer le premier jour de chaque mois et maintenir les lieux en bon état."),
+    ('pt', "O locatário deverá pagar o aluguel no primeiro dia de cada mês e manter o imóvel em bom estado."),
+    ('de', "Der Mieter hat die Miete am ersten Tag jedes Monats zu zahlen und die Räume in gutem Zustand zu halten."),
+    ('ru', "Арендатор обязан вносить арендную плату в первый день каждого месяца."),
+    ('ja', "借主は毎月の初日に賃料を支払わなければならない。"),
+    ('zh', "承租人应当在每月第一天支付租金。"),
+    ('ar', "يجب على المستأجر دفع الإيجار في اليوم الأول من كل شهر."),
+])
+def test_detects_language(language, text):
+    assert detect_language_local(text) == language
+
+@pytest.mark.parametrize('text', [
+    "O locatário deverá pagar o aluguel no primeiro dia de cada mês e manter o imóvel em bom estado.",
+    "O vendedor garante que os produtos estão livres de defeitos e assume a responsabilidade pela sua substituição.",
+])
+def test_portuguese_is_confident_enough_to_skip_gemini(text):
+    # GeminiIntegration only asks Gemini below language_confidence, 0.8 by default
+    language, confidence = LanguageDetector().detect(text)
+    assert language == 'pt' and confidence >= 0.8
+
+def test_empty_text_defaults_to_english_without_confidence():
+    assert LanguageDetector().detect('') == ('en', 0.0)
+    assert LanguageDetector().detect('12345 !!!') == ('en', 0.0)
+
+def test_title_page_in_another_language_does_not_decide():
+    spanish = "El arrendatario deberá pagar la renta el primer día de cada mes y mantener el inmueble en buen estado. " * 30
+    detector = LanguageDetector()
+    assert detector.detect("LEASE AGREEMENT\n" + spanish)[0] == 'es'
+
+def test_detect_batch_is_deterministic():
+    texts = ["The parties agree to the terms set out below.", None, "Les parties conviennent des conditions suivantes."]
+    detector = LanguageDetector()
+    assert detector.detect_batch(texts) == detector.detect_batch(texts)
+    assert [language for language, _ in detector.detect_batch(texts)] == ['en', 'en', 'fr']
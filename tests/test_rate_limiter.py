@@ -0,0 +1,47 @@
+import time
+
+from legal_core import RateLimiter
+
+def test_requests_beyond_the_quota_wait():
+    limiter = RateLimiter(requests_per_minute=3)
+    assert all(limiter.acquire() for _ in range(3))
+    assert limiter.acquire(timeout=0.05) is False
+    
+    stats = limiter.get_stats()
+    assert stats['requests'] == 3
+    assert stats['available_requests'] == 0
+
+def test_budget_refills_over_time():
+    limiter = RateLimiter(requests_per_minute=600)
+    for _ in range(600):
+        limiter.acquire()
+    started = time.monotonic()
+    assert limiter.acquire(timeout=1)
+    # 600 per minute refills one request every 0.1 s
+    assert 0.05 <= time.monotonic() - started < 0.5
+    assert limiter.get_stats()['throttled'] == 1
+
+def test_token_budget_is_corrected_from_actual_usage():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    assert limiter.acquire(tokens=400)
+    limiter.record_usage(400, 900)
+    assert limiter.acquire(tokens=400, timeout=0.05) is False
+    assert limiter.get_stats()['tokens'] == 900
+
+def test_oversized_requests_are_capped_to_the_token_quota():
+    limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    assert limiter.acquire(tokens=5000, timeout=0.05)
+
+def test_pause_holds_back_every_caller():
+    limiter = RateLimiter(requests_per_minute=100)
+    limiter.pause(0.2)
+    assert limiter.acquire(timeout=0.05) is False
+    assert limiter.acquire(timeout=1)
+    assert limiter.get_stats()['rate_limited'] == 1
+
+def test_quota_under_one_request_per_minute_still_admits_requests():
+    limiter = RateLimiter(requests_per_minute=0.5)
+    assert limiter.acquire(timeout=0.05) is False
+    # Two minutes later the bucket holds a whole request
+    limiter._last_refill -= 120
+    assert limiter.acquire(timeout=0.05)
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from legal_core import ResultStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(max_memory_mb=0.01, max_disk_mb=1, spill_dir=str(tmp_path / 'spill'))
+    yield store
+    store.close()
+
+def result(label, size=1000):
+    return {'summary': label, 'clauses': [label * size]}
+
+def test_least_recently_used_results_spill_to_disk_and_load_back(store):
+    handles = [store.put(result(str(index))) for index in range(8)]
+    stats = store.get_stats()
+    assert stats['spilled'] > 0
+    assert stats['memory_bytes'] <= store.max_memory_bytes
+    assert len(os.listdir(store.spill_dir)) == stats['spilled']
+    
+    assert store.get(handles[0]) == result('0')
+    assert store.get_stats()['disk_hits'] == 1
+    assert all(store.get(handle) == result(str(index)) for index, handle in enumerate(handles))
+
+def test_results_beyond_the_disk_cap_are_dropped(tmp_path):
+    store = ResultStore(max_memory_mb=0.001, max_disk_mb=0.0005, spill_dir=str(tmp_path / 'spill'))
+    # Random text barely compresses, so every spill file is about 400 bytes
+    handles = [store.put({'text': os.urandom(300).hex()}) for _ in range(5)]
+    
+    assert store.get(handles[0]) is None
+    assert store.get_stats()['dropped'] > 0
+    assert store.get(handles[-1]) is not None
+    store.close()
+
+def test_put_with_handle_replaces_and_discard_forgets(store):
+    store.put(result('old'), handle='doc')
+    store.put(result('new'), handle='doc')
+    assert store.get('doc') == result('new')
+    
+    store.discard('doc')
+    assert store.get('doc') is None
+    assert store.get_stats()['entries'] == 0
+
+def test_oversized_results_go_straight_to_disk(store):
+    handle = store.put(result('x', size=20000))
+    stats = store.get_stats()
+    assert stats['memory_bytes'] == 0 and stats['spilled'] == 1
+    assert store.get(handle) == result('x', size=20000)